@@ -19,7 +19,7 @@ class SchemaLedgerSerializer(serializers.ModelSerializer):
 
 class TermSetSerializer(serializers.ModelSerializer):
     """Serializes the TermSet Model"""
-    schema = serializers.DictField(source='export')
+    schema = serializers.DictField(source='cached_export')
 
     class Meta:
         model = TermSet
@@ -29,7 +29,7 @@ class TermSetSerializer(serializers.ModelSerializer):
 
 class TermSetJSONLDSerializer(serializers.ModelSerializer):
     """Serializes the TermSet Model"""
-    graph = serializers.DictField(source='json_ld')
+    graph = serializers.DictField(source='cached_json_ld')
 
     class Meta:
         model = TermSet
@@ -16,4 +16,5 @@ urlpatterns = [
          name='json-ld'),
     path('import-csv/', views.ImportCSVView.as_view(), name='import-csv'),
     path('export-terms/', views.ExportTermsView.as_view(), name='export-terms'),
+    path('jobs/<int:pk>', views.DeconflictionJobView.as_view(), name='job'),
 ]
@@ -17,8 +17,9 @@ from rest_framework.permissions import AllowAny
 
 from api.serializers import (TermJSONLDSerializer, TermSetJSONLDSerializer,
                              TermSetSerializer)
-from core.management.utils.xss_helper import sort_version
-from core.models import  TermSet
+from core.models import (LATEST_VERSION_ORDER, NeoTerm, Term,
+                         TermMappingIndex, TermSet)
+from deconfliction_service.models import DeconflictionJob
 
 from .utils import create_terms_from_csv, validate_csv, convert_to_xml
 
@@ -70,9 +71,9 @@ class JSONLDDataView(RetrieveAPIView):
         if self.request.query_params:
             for _, v in self.request.query_params.items():
                 if len(v) == 0:
-                    return TermSetJSONLDSerializer
+                    return TermJSONLDSerializer
         
-        return TermJSONLDSerializer
+        return TermSetJSONLDSerializer
 
     def retrieve(self, request, *args, **kwargs):
         """
@@ -129,7 +130,7 @@ class SchemaLedgerDataView(GenericAPIView):
             # look for a model with the provided name
             queryset = queryset.filter(name=name)
 
-            if not queryset:
+            if not queryset.exists():
                 messages.append(f"Error; no schema found with the name '{name}'")
                 errorMsg = {
                     "message": messages
@@ -139,13 +140,12 @@ class SchemaLedgerDataView(GenericAPIView):
             # if the schema name is found, filter for the version.
             # If no version is provided, we fetch the latest version
             if not version:
-                queryset = [ts for ts in queryset]
-                queryset = sort_version(queryset, reverse_order=True)
+                queryset = queryset.order_by(*LATEST_VERSION_ORDER)
             
             else:
                 queryset = queryset.filter(version=version)
 
-            if not queryset:
+            if not queryset.exists():
                 messages.append(f"Error; no schema found for version '{version}'")
                 errorMsg = {
                     "message": messages
@@ -237,7 +237,8 @@ class TransformationLedgerDataView(GenericAPIView):
             try:
                 source_qs = self._filter_by_source(source_name, source_version, source_iri, messages)
                 target_qs = self._filter_by_target(target_name, target_version, target_iri, messages)
-                mapping_dict = target_qs.first().mapped_to(source_qs.first().iri)
+                mapping_dict = TermMappingIndex.mapped_to(
+                    target_qs.first(), source_qs.first().iri)
                 messages.append("Error fetching records please check the logs.")
             except ObjectDoesNotExist:
                 errorMsg = {
@@ -278,21 +279,19 @@ class TransformationLedgerDataView(GenericAPIView):
         if source_name:
             # look for a model with the provided name
             queryset = self.get_queryset().filter(name=source_name)
-            if not queryset:
+            if not queryset.exists():
                 messages.append(f"Error; no source schema found with the name '{source_name}'")
                 raise ObjectDoesNotExist()
 
             # if the schema name is found, filter for the version.
             # If no version is provided, we fetch the latest version
             if not source_version:
-                term_sets = [ts for ts in queryset]
-                term_set = sort_version(term_sets, reverse_order=True)[0]
-                queryset = queryset.filter(iri=term_set.iri)
+                queryset = queryset.order_by(*LATEST_VERSION_ORDER)
             
             else:
                 queryset = queryset.filter(version=source_version)
             
-            if not queryset:
+            if not queryset.exists():
                 messages.append(f"Error; no source schema found for version '{source_version}'")
                 raise ObjectDoesNotExist()
         
@@ -313,7 +312,7 @@ class TransformationLedgerDataView(GenericAPIView):
             # look for a model with the provided name
             queryset = queryset.filter(name=target_name)
 
-            if not queryset:
+            if not queryset.exists():
                 messages. \
                     append(f"Error; no target schema found {target_name}'")
                 raise ObjectDoesNotExist()
@@ -321,13 +320,11 @@ class TransformationLedgerDataView(GenericAPIView):
             # if the schema name is found, filter for the version.
             # If no version is provided, we fetch the latest version
             if not target_version:
-                term_sets = [ts for ts in queryset]
-                term_set = sort_version(term_sets, reverse_order=True)[0]
-                queryset = queryset.filter(iri=term_set.iri)
+                queryset = queryset.order_by(*LATEST_VERSION_ORDER)
             else:
                 queryset = queryset.filter(version=target_version)
 
-            if not queryset:
+            if not queryset.exists():
                 messages.append(f"Error; no target schema found for version '{target_version}'")
                 raise ObjectDoesNotExist()
 
@@ -342,6 +339,28 @@ class TransformationLedgerDataView(GenericAPIView):
         return queryset
 
 
+class DeconflictionJobView(APIView):
+    """Reports the status and per-row results of a deconfliction job"""
+
+    def get(self, request, pk):
+        try:
+            job = DeconflictionJob.objects.get(pk=pk)
+        except DeconflictionJob.DoesNotExist:
+            return Response({'message': f"Error; no job found with the id '{pk}'"},
+                            status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'id': job.pk,
+            'kind': job.kind,
+            'status': job.status,
+            'created': job.created,
+            'started': job.started,
+            'finished': job.finished,
+            'error': job.error,
+            'result': job.result,
+        }, status.HTTP_200_OK)
+
+
 class ImportCSVView(APIView):
     permission_classes = [AllowAny]
     required_columns = ['Term', 'Definition', 'Context', 'Context Description']
@@ -14,7 +14,11 @@ from core.models import (ChildTermSet, SchemaLedger, Term, TermSet, Transformati
 from django_neomodel import admin as neomodel_admin
 from core.models import NeoAlias, NeoContext, NeoDefinition, NeoTerm, NeoContextDescription
 from core.utils import run_node_creation
+from core.term_import import import_terms_from_data_frame
+from deconfliction_service.models import DeconflictionJob
 from deconfliction_service.views import run_deconfliction
+from django.conf import settings
+from django.utils.html import format_html
 from django import forms
 from uuid import uuid4
 import logging
@@ -179,6 +183,14 @@ class NeoTermAdmin(admin.ModelAdmin):
             context_description = form.cleaned_data['context_description']
             logger.info(f"Creating NeoTerm with alias: {alias}, definition: {definition}, context: {context}, context_description: {context_description}")
 
+            if settings.DECONFLICTION_JOBS_ASYNC:
+                job = DeconflictionJob.enqueue_term(definition=definition, context=context,
+                                                    context_description=context_description, alias=alias,
+                                                    user=request.user)
+                messages.success(request, format_html('NeoTerm queued for creation as <a href="{}">job {}</a>.',
+                                                      job_admin_url(job), job.pk))
+                return
+
             run_node_creation(alias=alias, definition=definition, context=context, context_description=context_description)
 
             messages.success(request, 'NeoTerm saved successfully.')
@@ -228,8 +240,16 @@ class NeoTermAdmin(admin.ModelAdmin):
                 try:
                     data = self.validate_csv_file(csv_file)
                     df = data['data_frame']
-                    self.create_terms_from_csv(df)
+                    if settings.DECONFLICTION_JOBS_ASYNC:
+                        job = DeconflictionJob.enqueue_csv_import(df, user=request.user)
+                        messages.success(request, format_html(
+                            'CSV file uploaded successfully, {} rows queued for import as <a href="{}">job {}</a>.',
+                            len(df), job_admin_url(job), job.pk))
+                        return HttpResponseRedirect(reverse('admin:core_neoterm_changelist'))
+
+                    report = self.create_terms_from_csv(df)
                     messages.success(request, 'CSV file uploaded successfully.')
+                    messages.info(request, self.summarize_import_report(report))
                     return HttpResponseRedirect(reverse('admin:core_neoterm_changelist'))
 
                 except MissingColumnsError as e:
@@ -289,18 +309,24 @@ class NeoTermAdmin(admin.ModelAdmin):
         logger.info('Creating terms from CSV file...')
         logger.info(f'{len(df)} rows found in data frame file.')
 
-        for index, row in df.iterrows():
-            try:
-                alias_value = row['Alias'] if pd.notna(row['Alias']) and row['Alias'] else None
-                run_node_creation(alias=alias_value, definition=row['Definition'], context=row['Context'], context_description=row['Context Description'])
-            except Exception as e:
-                logger.error(f'Error creating term for index {index}: {str(e)}')
-                raise TermCreationError(f'Failed to create term for row {index + 1}: {str(e)}')
+        report = import_terms_from_data_frame(df)
 
         logger.info(f'{len(df)} terms created from CSV file.')
+        return report
+
+    def summarize_import_report(self, report):
+        counts = {'unique': 0, 'duplicate': 0, 'collision': 0}
+        for row in report:
+            counts[row['status']] = counts.get(row['status'], 0) + 1
+        return (f"{len(report)} rows imported: {counts['unique']} new terms, "
+                f"{counts['duplicate']} duplicates, {counts['collision']} collisions.")
 
 neomodel_admin.register(NeoTerm, NeoTermAdmin)
 
+
+def job_admin_url(job):
+    return reverse('admin:deconfliction_service_deconflictionjob_change', args=[job.pk])
+
 class NeoAliasAdmin(admin.ModelAdmin):
     list_display = ('alias', 'term')
 
@@ -0,0 +1,388 @@
+import json
+import platform
+import random
+import subprocess
+import time
+from collections import Counter
+from contextlib import ExitStack, nullcontext
+from types import SimpleNamespace
+from unittest import mock
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from neomodel import db
+
+from deconfliction_service.embedding_backends import EMBEDDING_BACKENDS
+
+BENCH_PROVIDER = 'BENCH-PROVIDER'
+
+# random definitions are drawn from these words, so unrelated benchmark
+# definitions stay below the collision threshold of each other
+WORDS = '''
+    account action agent air animal answer area army art bank bird board boat body book bridge
+    budget camp card cargo carrier castle cell channel chart circuit city climate cloud coast code
+    company council course craft crew cycle data desert device doctor door drill dust energy engine
+    field file film fire flight floor forest fuel garden glass grid ground harbor health helmet
+    history horse hospital island job journal key kitchen ladder lake language law leader lesson
+    library light machine map market medicine metal mission motor mountain music navy network
+    office ocean oil operator paper patrol pilot plant poem port power prison radar radio rail
+    recipe report river road rocket route safety satellite school science season sensor ship
+    signal soil soldier song station steel storm student supply surgeon system table tank teacher
+    tower track trade traffic train tunnel valley vehicle village voice water weapon weather wheel
+    window winter wire wood
+'''.split()
+
+SCENARIOS = [
+    'generate_uid',
+    'api_generate_uid',
+    'api_generate_uid_bulk',
+    'run_node_creation_unique',
+    'run_node_creation_duplicate',
+    'run_node_creation_collision',
+    'csv_import',
+    'export_csv',
+    'export_json',
+    'export_xml',
+    'encode',
+]
+
+
+class StubGraph:
+    """
+    Stand-in for db.cypher_query answering the statements issued by the
+    benchmarked paths with canned results, so the Python side of each path
+    can be measured without a Neo4j server.
+    """
+
+    def __init__(self, term_count=100):
+        self.counter = 0
+        self.term_count = term_count
+        self.similar = []
+
+    def __call__(self, query, params=None, **kwargs):
+        params = params or {}
+
+        if 'RETURN c.counter' in query:
+            self.counter += params['count']
+            return [[self.counter]], None
+        if 'db.index.vector.queryNodes' in query:
+            return [[item['position'], text, score]
+                    for item in params['items'] for text, score in self.similar], None
+        if 'RETURN DISTINCT row.index' in query:
+            return [[position] for position in range(len(params['rows']))], None
+        if 'UNWIND $rows' in query and 'RETURN r' in query:
+            return [[row] for row in params['rows']], None
+        if '$after' in query:
+            first = 0 if params['after'] is None else int(params['after'], 16) + 1
+            return [self.term_row(i) for i in range(first, min(first + params['limit'], self.term_count))], None
+        return [], None
+
+    def term_row(self, i):
+        return [f'0x{i:08x}', 'BENCH', [f'alias {i}'], [f'definition {i}'],
+                [{'context': f'context {i % 10}', 'context_description': f'context description {i % 10}'}]]
+
+
+class Command(BaseCommand):
+    """This command benchmarks the UID, term creation, import and export
+    hot paths and writes a JSON report.  Live mode writes benchmark data to
+    the configured Neo4j and MySQL databases and only runs with
+    --allow-writes."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stub', action='store_true',
+                            help='Replace Neo4j and ORM writes with in-process stubs')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Allow live mode to write benchmark terms to the configured databases')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Scenario to run, defaults to all of them')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--bulk', type=int, default=100, help='UIDs per bulk request')
+        parser.add_argument('--csv-rows', type=int, default=100, help='Rows per CSV import')
+        parser.add_argument('--terms', type=int, default=100, help='Terms exported in stub mode')
+        parser.add_argument('--embedding-backend', action='append', dest='embedding_backends',
+                            choices=sorted(EMBEDDING_BACKENDS),
+                            help='Backend timed by the encode scenario, repeatable, EMBEDDING_BACKEND by default')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] <= 0:
+            raise CommandError('--iterations must be a positive integer')
+        if not options['stub'] and not options['allow_writes']:
+            raise CommandError('Live mode creates terms, UIDs and log rows that are not removed, '
+                               'pass --allow-writes to run it or --stub to measure without them')
+
+        self.options = options
+        self.run_id = uuid4().hex[:8]
+        self.random = random.Random(0)
+        self.statuses = Counter()
+        self.graph = StubGraph(term_count=options['terms'])
+        self.factory = RequestFactory()
+
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'mode': 'stub' if options['stub'] else 'live',
+            # every term a live run creates is in the context 'benchmark context <run_id>'
+            'run_id': self.run_id,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'scenarios': {},
+        }
+
+        with ExitStack() as stack:
+            if options['stub']:
+                self.install_stubs(stack)
+            self.prepare()
+
+            for name in options['scenarios'] or SCENARIOS:
+                if name == 'encode':
+                    # one entry per backend so their latencies sit side by side
+                    for backend in options['embedding_backends'] or [settings.EMBEDDING_BACKEND]:
+                        self.stderr.write(f'Running {name} with {backend}...')
+                        report['scenarios'][f'{name}:{backend}'] = self.run_scenario(name, backend)
+                    continue
+                self.stderr.write(f'Running {name}...')
+                report['scenarios'][name] = self.run_scenario(name)
+
+        output = json.dumps(report, indent=4)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stderr.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def install_stubs(self, stack):
+        from uid.models import GeneratedUIDLog, UIDRequestNode
+
+        stack.enter_context(mock.patch.object(db, 'cypher_query', self.graph))
+        stack.enter_context(mock.patch.object(db, 'transaction', nullcontext()))
+        stack.enter_context(mock.patch.object(GeneratedUIDLog.objects, 'create'))
+        stack.enter_context(mock.patch.object(GeneratedUIDLog.objects, 'bulk_create'))
+        stack.enter_context(mock.patch.object(
+            UIDRequestNode, 'inflate',
+            side_effect=lambda row: SimpleNamespace(
+                token=row['token'], default_uid=row['uid'], default_uid_chain=row['uid_chain'])))
+        # the per-node neomodel writes of run_node_creation need a server,
+        # stub mode measures deconfliction and dispatch only
+        for writer in ('run_unique_definition_creation', 'run_duplicate_definition_creation',
+                       'run_collision_definition_creation'):
+            stack.enter_context(mock.patch(f'core.utils.{writer}'))
+
+    def prepare(self):
+        """Warm the provider cache the way a running server would be"""
+        from core.models import DEFAULT_LCVID
+        from uid.models import Provider, ProviderDjangoModel, provider_cache, uid_allocator
+
+        uid_allocator.reset()
+        for name in (BENCH_PROVIDER, DEFAULT_LCVID):
+            if self.options['stub']:
+                provider = Provider(name=name, default_uid='0x00000001')
+                provider.element_id_property = f'stub:{name}'
+                provider_cache.set(provider)
+            else:
+                ProviderDjangoModel.ensure_provider_exists(name)
+
+    def run_scenario(self, name, *args):
+        operation, items, *setup = getattr(self, f'scenario_{name}')(*args)
+        # per iteration preparation that is not timed, e.g. seeding a match
+        setup = setup[0] if setup else (lambda: None)
+
+        for _ in range(self.options['warmup']):
+            setup()
+            operation()
+
+        self.statuses.clear()
+        latencies = []
+        for _ in range(self.options['iterations']):
+            setup()
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        elapsed = sum(latencies)
+
+        latencies.sort()
+        return {
+            'items_per_iteration': items,
+            'total_seconds': round(elapsed, 6),
+            'throughput_per_second': round(len(latencies) / elapsed, 3),
+            'items_per_second': round(len(latencies) * items / elapsed, 3),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+                'min': round(latencies[0] * 1000, 3),
+                'p50': round(percentile(latencies, 50) * 1000, 3),
+                'p95': round(percentile(latencies, 95) * 1000, 3),
+                'p99': round(percentile(latencies, 99) * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            },
+            # what deconfliction decided, so a scenario measuring the wrong
+            # path shows up in the report
+            'statuses': dict(self.statuses),
+        }
+
+    def scenario_generate_uid(self):
+        from uid.models import generate_uid
+
+        return lambda: generate_uid(BENCH_PROVIDER), 1
+
+    def scenario_api_generate_uid(self):
+        return self.api_generate_uid({'provider_name': BENCH_PROVIDER}), 1
+
+    def scenario_api_generate_uid_bulk(self):
+        bulk = self.options['bulk']
+        return self.api_generate_uid({'provider_name': BENCH_PROVIDER, 'bulk': bulk}), bulk
+
+    def api_generate_uid(self, payload):
+        from uid.views import api_generate_uid
+
+        def operation():
+            request = self.factory.post('/uid/api/generate', data=json.dumps(payload),
+                                        content_type='application/json')
+            response = api_generate_uid(request)
+            if response.status_code != 200:
+                raise CommandError(f'api_generate_uid returned {response.status_code}: {response.content}')
+
+        return operation
+
+    def scenario_run_node_creation_unique(self):
+        return self.run_node_creation('unique', [])
+
+    def scenario_run_node_creation_duplicate(self):
+        return self.run_node_creation('duplicate', [('benchmark definition', 0.95)])
+
+    def scenario_run_node_creation_collision(self):
+        return self.run_node_creation('collision', [('benchmark definition', 0.85)])
+
+    def run_node_creation(self, status, similar):
+        from core.utils import run_node_creation
+
+        submitted = {}
+
+        def create(definition):
+            return run_node_creation(definition=definition, context=f'benchmark context {self.run_id}',
+                                     context_description='benchmark context description',
+                                     alias=f'benchmark alias {uuid4().hex}')
+
+        def setup():
+            # a fresh definition every time so the embedding cache never hits
+            definition = self.random_definition()
+            if self.options['stub']:
+                self.graph.similar = similar
+            elif status != 'unique':
+                # live mode needs a real definition in the graph to match
+                self.graph.similar = []
+                create(definition)
+                if status == 'collision':
+                    definition = self.collision_of(definition)
+            submitted['definition'] = definition
+
+        def operation():
+            self.statuses[create(submitted['definition'])['status']] += 1
+
+        return operation, 1, setup
+
+    def scenario_csv_import(self):
+        from core.term_import import import_terms_from_data_frame
+
+        rows = self.options['csv_rows']
+
+        def operation():
+            self.graph.similar = []
+            run = uuid4().hex
+            report = import_terms_from_data_frame(pd.DataFrame({
+                'Alias': [f'benchmark alias {run} {i}' for i in range(rows)],
+                'Definition': [self.random_definition() for _ in range(rows)],
+                'Context': [f'benchmark context {self.run_id} {i % 10}' for i in range(rows)],
+                'Context Description': [f'benchmark context description {i % 10}' for i in range(rows)],
+            }))
+            self.statuses.update(row['status'] for row in report)
+
+        return operation, rows
+
+    def random_definition(self, length=12):
+        return ' '.join(self.random.choice(WORDS) for _ in range(length))
+
+    def collision_of(self, definition, attempts=5):
+        """Rewrite some words of a definition until it scores inside the
+        collision band against the original"""
+        from deconfliction_service.node_utils import encode_texts, is_collision
+        from deconfliction_service.schema import vector_index_score
+
+        words = definition.split()
+        candidates = []
+        for replaced in range(1, len(words) + 1):
+            for _ in range(attempts):
+                candidate = list(words)
+                for position in self.random.sample(range(len(words)), replaced):
+                    candidate[position] = self.random.choice(WORDS)
+                candidates.append(' '.join(candidate))
+
+        vectors = encode_texts([definition] + candidates)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for candidate, cosine in zip(candidates, vectors[1:] @ vectors[0]):
+            if is_collision(vector_index_score(float(cosine))):
+                return candidate
+        raise CommandError(f'No rewrite of "{definition}" lands in the collision band')
+
+    def scenario_encode(self, backend):
+        from deconfliction_service.node_utils import encode_texts
+
+        def operation():
+            # straight to the model, past the embedding cache and micro-batching
+            encode_texts([self.random_definition()], backend)
+
+        return operation, 1
+
+    def scenario_export_csv(self):
+        from core.views import export_terms_as_csv
+
+        return self.export(export_terms_as_csv), self.options['terms']
+
+    def scenario_export_json(self):
+        from core.views import export_terms_as_json
+
+        return self.export(export_terms_as_json), self.options['terms']
+
+    def scenario_export_xml(self):
+        from core.views import export_terms_as_xml
+
+        return self.export(export_terms_as_xml), self.options['terms']
+
+    def export(self, view):
+        def operation():
+            request = self.factory.get('/admin/export/')
+            request._messages = CookieStorage(request)
+            response = view(request)
+            if response.status_code != 200:
+                raise CommandError(f'{view.__name__} returned {response.status_code}')
+            consume(response)
+
+        return operation
+
+
+def consume(response) -> int:
+    """Read a whole response body, streamed or not, and return its size"""
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,115 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.management.commands.bench import git_commit
+
+STAGES = [
+    'django_setup',
+    'import_app_modules',
+    'load_model',
+]
+
+# runs in a fresh interpreter so nothing is already imported; prints the
+# time, peak RSS and whether torch is loaded after every stage
+PROBE = '''
+import json, resource, sys, time
+
+def stage(name, step):
+    started = time.perf_counter()
+    step()
+    print(json.dumps({
+        'stage': name,
+        'seconds': time.perf_counter() - started,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'torch_imported': 'torch' in sys.modules,
+    }), flush=True)
+
+def django_setup():
+    import django
+    django.setup()
+
+def import_app_modules():
+    import core.admin, core.utils, api.views, deconfliction_service.views
+
+def load_model():
+    from deconfliction_service.node_utils import get_model
+    get_model()
+
+for name in sys.argv[1:]:
+    stage(name, globals()[name])
+'''
+
+
+class Command(BaseCommand):
+    """
+    This command reports how long a fresh process takes to start Django,
+    import the app modules and load the embedding model, and how much
+    memory each step adds
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3,
+                            help='Fresh processes to time, the median is reported')
+        parser.add_argument('--skip-model', action='store_true',
+                            help='Stop before loading the embedding model')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['runs'] <= 0:
+            raise CommandError('--runs must be a positive integer')
+
+        stages = STAGES[:-1] if options['skip_model'] else STAGES
+        runs = []
+        for run in range(options['runs']):
+            self.stderr.write(f'Timing startup run {run + 1}...')
+            runs.append(probe(stages))
+
+        report = {
+            'commit': git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'runs': options['runs'],
+            'stages': summarize(runs),
+        }
+
+        output = json.dumps(report, indent=4)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stderr.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+
+def probe(stages):
+    """Run the startup stages in a new interpreter and return their rows"""
+    env = dict(os.environ, EMBEDDING_PRELOAD='false',
+               DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE',
+                                                     'openlxp_xss_project.settings'))
+    try:
+        result = subprocess.run([sys.executable, '-c', PROBE, *stages], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise CommandError(f'Startup probe failed: {e.stderr.strip()}')
+    return [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+
+
+def summarize(runs):
+    """Median time and peak memory of every stage over several runs"""
+    stages = {}
+    for rows in zip(*runs):
+        name = rows[0]['stage']
+        stages[name] = {
+            'seconds': round(statistics.median(row['seconds'] for row in rows), 4),
+            'max_rss_mb': round(statistics.median(row['max_rss_mb'] for row in rows), 1),
+            'torch_imported': any(row['torch_imported'] for row in rows),
+        }
+    return stages
@@ -1,9 +1,20 @@
 import logging
+import threading
+from contextlib import contextmanager
 
-from core.models import ChildTermSet, Term, TermSet
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core.models import (ChildTermSet, Term, TermMappingIndex, TermSet,
+                         TermSetCache)
 
 logger = logging.getLogger('dict_config_logger')
 
+# rows per INSERT statement when ingesting schemas
+BULK_BATCH_SIZE = 1000
+
+_status_propagation = threading.local()
+
 
 def create_child_termset(termset_name, parent_iri, status, updated_by):
     """function to create/save termset"""
@@ -56,71 +67,193 @@ def term_object(term_obj, term_name, parent_iri, status, updated_by):
     create_terms(term_obj, term_name, parent_iri, status, updated_by)
 
 
+def flatten_metadata(metadata, termset, status, updated_by):
+    """
+    Flatten a schema's metadata into the Term Set and Term rows that
+    termset_object would create under termset, without saving them.
+
+    :return: A tuple of the child Term Sets, (child iri, parent iri) pairs
+             and Terms, parents before children.
+    """
+    term_sets, links, terms = [], [], []
+
+    def collect(metadata, parent_iri):
+        for element in metadata:
+            value = metadata[element]
+            # an element's kind is decided by its first value, like
+            # termset_object does
+            if not isinstance(value, dict) or not value:
+                continue
+            first = next(iter(value.values()))
+            if isinstance(first, dict):
+                iri = parent_iri + '/' + element
+                term_set = TermSet(iri=iri, name=element,
+                                   version=termset.version, status=status,
+                                   updated_by=updated_by)
+                term_set.set_version_numbers()
+                term_sets.append(term_set)
+                links.append((iri, parent_iri))
+                collect(value, iri)
+            elif isinstance(first, str):
+                term = Term(term_set_id=parent_iri, name=element,
+                            status=status, updated_by=updated_by)
+                term.__dict__.update(value)
+                term.iri = parent_iri + '?' + term.name
+                terms.append(term)
+
+    collect(metadata, termset.iri)
+    return term_sets, links, terms
+
+
+def ingest_schema_metadata(metadata, termset, status, updated_by):
+    """
+    Create the child Term Sets and Terms of a schema in bulk.
+
+    The rows match the ones termset_object creates, but are written with
+    a few batched INSERTs in one transaction instead of several statements
+    per element.  Child Term Sets are multi-table models, which bulk_create
+    does not support, so their TermSet rows are bulk created and the child
+    table rows are inserted directly.
+    """
+    term_sets, links, terms = flatten_metadata(metadata, termset, status,
+                                               updated_by)
+
+    child_table = connection.ops.quote_name(ChildTermSet._meta.db_table)
+    child_columns = ', '.join(connection.ops.quote_name(column) for column in (
+        ChildTermSet._meta.pk.column,
+        ChildTermSet._meta.get_field('parent_term_set').column))
+
+    with transaction.atomic():
+        TermSet.objects.bulk_create(term_sets, batch_size=BULK_BATCH_SIZE)
+        if links:
+            with connection.cursor() as cursor:
+                for start in range(0, len(links), BULK_BATCH_SIZE):
+                    cursor.executemany(
+                        f'INSERT INTO {child_table} ({child_columns}) '
+                        f'VALUES (%s, %s)',
+                        links[start:start + BULK_BATCH_SIZE])
+        Term.objects.bulk_create(terms, batch_size=BULK_BATCH_SIZE)
+
+    # bulk inserts do not send post_save
+    TermSetCache.invalidate(termset.iri)
+    logger.info(f'Ingested {len(term_sets)} Term Sets and {len(terms)} '
+                f'Terms into {termset.iri}')
+
+
+@contextmanager
+def propagating_status():
+    """
+    Mark the current thread as propagating a status change, so the
+    TermSet post_save receiver leaves the work to the caller.
+    """
+    previous = getattr(_status_propagation, 'active', False)
+    _status_propagation.active = True
+    try:
+        yield
+    finally:
+        _status_propagation.active = previous
+
+
+def is_propagating_status():
+    """Check if a status change is already being propagated"""
+    return getattr(_status_propagation, 'active', False)
+
+
 def update_status(termset, status, updated_by):
     """function to update the status of children terms/termsets"""
 
-    child_termset = ChildTermSet.objects.filter(parent_term_set=termset)
+    # the iris of the whole subtree start with the Term Set's iri, so two
+    # UPDATEs cover every descendant Term Set and Term
+    with transaction.atomic():
+        TermSet.objects.filter(iri__startswith=termset.iri + '/'). \
+            update(status=status, updated_by=updated_by)
+        Term.objects.filter(Q(iri__startswith=termset.iri + '?') |
+                            Q(iri__startswith=termset.iri + '/')). \
+            update(status=status, updated_by=updated_by)
 
-    if child_termset:
-        for child_element in child_termset:
-            child_termset.update(status=status, updated_by=updated_by)
-            update_status(child_element, status, updated_by)
-    term = termset.terms
-    term.update(status=status, updated_by=updated_by)
+    # queryset updates do not send post_save
+    TermSetCache.invalidate(termset.iri)
+    TermMappingIndex.rebuild(termset.iri)
 
 
-def termset_map(target, source, mapping):
+def subtree_paths(termset):
     """
-    recursive function to create mappings between schemas
+    Map the dotted paths below termset to iris, e.g. child.term for
+    termset/child?term.
+
+    :return: A tuple of the Term Set paths and the Term paths.
     """
-    for kid in mapping:
-        # if the value in the dict is a string, the key is the term
-        if isinstance(mapping[kid], str):
-            path = mapping[kid].split('.')
-            source_ts = TermSet.objects.get(iri=source.iri)
-
-            try:
-                source_ts = __traverse_path(source_ts, path)
-            except Exception:
-                # if one of the child term sets doesn't exist, log and
-                # skip to the next mapping
-                logger.info(f"Source Term Set {mapping[kid]} does not exist")
-                continue
+    def relative(iri):
+        return iri[len(termset.iri):].lstrip('/?'). \
+            replace('/', '.').replace('?', '.')
 
-            source_name = path[-1]
-            target_name = kid
+    term_sets = TermSet.objects.filter(iri__startswith=termset.iri + '/'). \
+        values_list('iri', flat=True)
+    terms = Term.objects.filter(Q(iri__startswith=termset.iri + '?') |
+                                Q(iri__startswith=termset.iri + '/')). \
+        values_list('iri', flat=True)
+    return ({relative(iri): iri for iri in term_sets},
+            {relative(iri): iri for iri in terms})
 
-            # verify terms exist
-            if not target.terms.filter(name=target_name).exists():
-                logger.info(f"Target Term {target_name} does not exist")
-                continue
-            if not source_ts.terms.filter(name=source_name).exists():
-                logger.info(f"Source Term {source_name} does not exist")
-                continue
 
-            # get the terms
-            source_term = source_ts.terms.get(name=source_name)
-            target_term = target.terms.get(name=target_name)
+def termset_map(target, source, mapping):
+    """
+    Create the mappings between schemas described by a nested mapping
+    dict, whose leaves are dotted source Term paths keyed by target Term.
+
+    Both trees are loaded once and every pair is resolved in memory, then
+    the symmetrical Term.mapping rows are inserted with one bulk_create.
+    """
+    target_sets, target_terms = subtree_paths(target)
+    source_sets, source_terms = subtree_paths(source)
+
+    pairs = set()
+    missing = {'Source Term Set': [], 'Source Term': [],
+               'Target Term Set': [], 'Target Term': []}
 
-            # add the term connection
-            target_term.mapping.add(source_term)
-            target_term.save()
+    def resolve(mapping, prefix):
+        for kid in mapping:
+            value = mapping[kid]
+            # if the value in the dict is a string, the key is the term
+            if isinstance(value, str):
+                source_set = value.rpartition('.')[0]
+                if source_set and source_set not in source_sets:
+                    missing['Source Term Set'].append(value)
+                elif prefix + kid not in target_terms:
+                    missing['Target Term'].append(prefix + kid)
+                elif value not in source_terms:
+                    missing['Source Term'].append(value)
+                else:
+                    pairs.add((target_terms[prefix + kid],
+                               source_terms[value]))
+            # if kid is not a child of target, skip to next mapping
+            elif prefix + kid not in target_sets or \
+                    not isinstance(value, dict):
+                missing['Target Term Set'].append(prefix + kid)
+            # else the key is a child term set
+            else:
+                resolve(value, prefix + kid + '.')
 
-        # if kid is not a child of target, log and skip to next mapping
-        elif not target.children.filter(name=kid).exists():
-            logger.info(
-                f"Target Term Set {kid} does not exist in {target.iri}")
-            continue
+    resolve(mapping, '')
 
-        # else the key is a child term set
-        else:
-            termset_map(target.children.get(
-                name=kid), source, mapping[kid])
+    # Term.mapping is symmetrical, so store both directions like
+    # mapping.add does
+    through = Term.mapping.through
+    rows = {(from_iri, to_iri) for pair in pairs
+            for from_iri, to_iri in (pair, pair[::-1])}
+    through.objects.bulk_create(
+        [through(from_term_id=from_iri, to_term_id=to_iri)
+         for from_iri, to_iri in sorted(rows)],
+        batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
 
+    # bulk inserts do not send m2m_changed
+    TermSetCache.invalidate(target.iri, source.iri)
+    TermMappingIndex.rebuild(target.iri, source.iri)
 
-def __traverse_path(termset, path):
-    """helper function to traverse the source term sets"""
-    for step in path[:-1]:
-        termset = termset.children.get(
-            name=step)
-    return termset
+    skipped = '; '.join(f'{kind} does not exist: {", ".join(names)}'
+                        for kind, names in missing.items() if names)
+    if skipped:
+        logger.info(f'Skipped mappings from {source.iri} to {target.iri}. '
+                    f'{skipped}')
+    logger.info(f'Mapped {len(pairs)} Terms from {source.iri} to '
+                f'{target.iri}')
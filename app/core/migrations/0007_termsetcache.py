@@ -0,0 +1,24 @@
+# Generated by Django 3.2.20 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_auto_20230901_1454'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermSetCache',
+            fields=[
+                ('term_set', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cache', serialize=False, to='core.termset')),
+                ('format_version', models.PositiveSmallIntegerField(default=1)),
+                ('export', models.JSONField(blank=True, null=True)),
+                ('json_ld', models.JSONField(blank=True, null=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
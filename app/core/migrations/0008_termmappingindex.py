@@ -0,0 +1,81 @@
+# Generated by Django 3.2.20 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def root_iri(iri):
+    return iri.split('/', 1)[0].split('?', 1)[0]
+
+
+def iri_path(iri):
+    return iri[len(root_iri(iri)):].lstrip('/?'). \
+        replace('/', '.').replace('?', '.')
+
+
+def backfill_mapping_index(apps, schema_editor):
+    """Index the mappings that already exist, like
+    TermMappingIndex.rebuild does for every root"""
+    Term = apps.get_model('core', 'Term')
+    TermSet = apps.get_model('core', 'TermSet')
+    TermMappingIndex = apps.get_model('core', 'TermMappingIndex')
+
+    published = set(Term.objects.filter(status='published').
+                    values_list('iri', flat=True))
+    hidden = set(TermSet.objects.exclude(status='published').
+                 values_list('iri', flat=True))
+
+    def visible(iri):
+        root = root_iri(iri)
+        parent = iri.rsplit('?', 1)[0]
+        while parent != root:
+            if parent in hidden:
+                return False
+            parent = parent.rsplit('/', 1)[0]
+        return iri in published
+
+    best = {}
+    for target, source in Term.mapping.through.objects.values_list(
+            'from_term_id', 'to_term_id').iterator():
+        if not visible(target):
+            continue
+        key = (target, root_iri(source))
+        if key not in best or source < best[key]:
+            best[key] = source
+
+    TermMappingIndex.objects.bulk_create([
+        TermMappingIndex(target_term_id=target, target_root=root_iri(target),
+                         target_path=iri_path(target),
+                         source_root=source_root,
+                         source_path=iri_path(source))
+        for (target, source_root), source in best.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_termsetcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermMappingIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_root', models.CharField(max_length=255)),
+                ('target_path', models.CharField(max_length=255)),
+                ('source_root', models.CharField(max_length=255)),
+                ('source_path', models.CharField(max_length=255)),
+                ('target_term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.term')),
+            ],
+            options={
+                'unique_together': {('target_term', 'source_root')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='termmappingindex',
+            index=models.Index(fields=['target_root', 'source_root'], name='core_mapping_roots_idx'),
+        ),
+        migrations.RunPython(backfill_mapping_index, migrations.RunPython.noop),
+    ]
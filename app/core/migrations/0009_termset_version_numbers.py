@@ -0,0 +1,52 @@
+# Generated by Django 3.2.20 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+def version_numbers(version):
+    parts = (version.split('.') + ['', ''])[:3]
+    return tuple(min(int(part), 2147483647) if part.isdigit() else 0
+                 for part in parts)
+
+
+def backfill_version_numbers(apps, schema_editor):
+    """Store the version of existing Term Sets as numbers"""
+    TermSet = apps.get_model('core', 'TermSet')
+
+    term_sets = list(TermSet.objects.only('iri', 'version'))
+    for term_set in term_sets:
+        term_set.major_version, term_set.minor_version, \
+            term_set.patch_version = version_numbers(term_set.version)
+    TermSet.objects.bulk_update(
+        term_sets, ['major_version', 'minor_version', 'patch_version'],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_termmappingindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='termset',
+            name='major_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='termset',
+            name='minor_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='termset',
+            name='patch_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='termset',
+            index=models.Index(fields=['name', 'major_version', 'minor_version', 'patch_version'], name='core_termset_version_idx'),
+        ),
+        migrations.RunPython(backfill_version_numbers, migrations.RunPython.noop),
+    ]
@@ -11,7 +11,7 @@ import magic
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django_neomodel import DjangoNode
 from neomodel import StringProperty, UniqueIdProperty
 from model_utils.models import TimeStampedModel
@@ -26,6 +26,8 @@ from typing import Tuple
 
 logger = logging.getLogger('dict_config_logger')
 
+DEFAULT_LCVID = "DOD-OSD-P_R-DHRA-DSSC"
+
 data_type_matching = {
     'str': 'schema:Text',
     'int': 'schema:Number',
@@ -42,6 +44,30 @@ regex_check = (r'(?!(\A( \x09\x0A\x0D\x20-\x7E # ASCII '
                r'| \xF4\x80-\x8F{2} # plane 16 )*\Z))')
 
 
+def root_iri(iri):
+    """Get the iri of the root Term Set of any Term Set or Term iri"""
+    return iri.split('/', 1)[0].split('?', 1)[0]
+
+
+def iri_path(iri):
+    """Get the dotted path of a Term or Term Set iri below its root, e.g.
+    child.term for xss:0.0.1@root/child?term"""
+    return iri[len(root_iri(iri)):].lstrip('/?'). \
+        replace('/', '.').replace('?', '.')
+
+
+# largest value the version number columns hold
+MAX_VERSION_NUMBER = 2147483647
+
+
+def version_numbers(version):
+    """Split a 0.0.0 version string into its major, minor and patch
+    numbers, missing or empty parts counting as 0"""
+    parts = (version.split('.') + ['', ''])[:3]
+    return tuple(min(int(part), MAX_VERSION_NUMBER) if part.isdigit() else 0
+                 for part in parts)
+
+
 def validate_version(value):
     check = re.fullmatch('[0-9]*[.][0-9]*[.][0-9]*', value)
     if check is None:
@@ -49,6 +75,16 @@ def validate_version(value):
             '%(value)s does not match the format 0.0.0',
             params={'value': value},
         )
+    if any(part and int(part) > MAX_VERSION_NUMBER
+           for part in value.split('.')):
+        raise ValidationError(
+            '%(value)s has a version number above %(max)s',
+            params={'value': value, 'max': MAX_VERSION_NUMBER},
+        )
+
+
+# newest first, for use with order_by on TermSets
+LATEST_VERSION_ORDER = ('-major_version', '-minor_version', '-patch_version')
 
 
 class TermSet(TimeStampedModel):
@@ -60,70 +96,53 @@ class TermSet(TimeStampedModel):
     uuid = models.UUIDField(default=uuid4, editable=False, unique=True)
     name = models.SlugField(max_length=255, allow_unicode=True)
     version = models.CharField(max_length=255, validators=[validate_version])
+    major_version = models.PositiveIntegerField(default=0)
+    minor_version = models.PositiveIntegerField(default=0)
+    patch_version = models.PositiveIntegerField(default=0)
     status = models.CharField(max_length=255, choices=STATUS_CHOICES)
     updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
+    VERSION_FIELDS = {'major_version', 'minor_version', 'patch_version'}
+
+    class Meta:
+        indexes = [models.Index(
+            fields=['name', 'major_version', 'minor_version', 'patch_version'],
+            name='core_termset_version_idx')]
+
     def save(self, *args, **kwargs):
         """Generate iri for item"""
         self.iri = 'xss:' + self.version + '@' + self.name
+        self.set_version_numbers()
         update_fields = kwargs.get('update_fields', None)
         if update_fields:
-            kwargs['update_fields'] = set(update_fields).union({'iri'})
+            kwargs['update_fields'] = set(update_fields).union(
+                {'iri'}, self.VERSION_FIELDS)
 
         super().save(*args, **kwargs)
 
+    def set_version_numbers(self):
+        """Store the version string as sortable numbers"""
+        self.major_version, self.minor_version, self.patch_version = \
+            version_numbers(self.version)
+
     def export(self):
-        children = {kid.name: kid.export() for kid in self.children.filter(status='published')}
-        terms = {term.name: term.export() for term in self.terms.filter(status='published')}
-        return {**children, **terms}
+        return TermSetTree(self).export()
 
     def json_ld(self):
         """Generate python representation of JSON-LD"""
-        # create graph and context dicts
-        graph = {}
-        context = {}
-        # add elements to graph and context
-        graph['@id'] = 'ldss:' + self.iri
-        graph['@type'] = 'rdfs:Class'
-        graph['rdfs:label'] = self.name
-        context['rdfs'] = 'http://www.w3.org/2000/01/rdf-schema#'
-        if hasattr(self, 'childtermset'):
-            graph['schema:domainIncludes'] = {
-                '@id': 'ldss:' + self.childtermset.parent_term_set.iri
-            }
-            context['schema'] = 'https://schema.org/'
-        # iterate over child term sets and collect their graphs and contexts
-        children = []
-        for kid in self.children.filter(status='published'):
-            kid_ld = kid.json_ld()
-            children.extend(kid_ld['@graph'])
-            # add children's context to current context, but current has
-            # higher priority
-            context = {**kid_ld['@context'], **context}
-        # iterate over terms and collect their graphs and contexts
-        terms = []
-        for term in self.terms.filter(status='published'):
-            term_ld = term.json_ld()
-            terms.extend(term_ld['@graph'])
-            # add terms' context to current context, but current has higher
-            # priority
-            context = {**term_ld['@context'], **context}
-        # return the graph and context
-        return {'@context': context, '@graph': [graph, *children, *terms]}
+        return TermSetTree(self).json_ld()
 
-    def mapped_to(self, target_root):
-        """Return dict of Terms mapped to anything in target_root string"""
+    def cached_export(self):
+        """Return the export document, computing and storing it if needed"""
+        return TermSetCache.get_document(self, 'export')
 
-        # filter out children with no mapped terms
-        children = {kid.name: kid.mapped_to(target_root) for kid in self.children.filter(status='published')}
-        filtered_children = dict(filter(lambda kid: len(kid[1]) != 0, children.items()))
+    def cached_json_ld(self):
+        """Return the JSON-LD document, computing and storing it if needed"""
+        return TermSetCache.get_document(self, 'json_ld')
 
-        # filter out terms that do not have a mapping
-        terms = {term.name: term.mapped_to(target_root)
-                 for term in self.terms.filter(status='published')}
-        filtered_terms = dict(
-            filter(lambda term: term[1] is not None, terms.items()))
-        return {**filtered_children, **filtered_terms}
+    def mapped_to(self, target_root):
+        """Return dict of Terms mapped to anything in target_root string"""
+        return TermSetTree(self).mapped_to(target_root)
 
 
 class ChildTermSet(TermSet):
@@ -135,9 +154,11 @@ class ChildTermSet(TermSet):
         """Generate iri for item"""
         self.iri = self.parent_term_set.iri + '/' + self.name
         self.version = self.parent_term_set.version
+        self.set_version_numbers()
         update_fields = kwargs.get('update_fields', None)
         if update_fields:
-            kwargs['update_fields'] = set(update_fields).union({'iri', 'version'})
+            kwargs['update_fields'] = set(update_fields).union(
+                {'iri', 'version'}, self.VERSION_FIELDS)
 
         super(TermSet, self).save(*args, **kwargs)
 
@@ -221,16 +242,8 @@ class Term(TimeStampedModel):
 
     def path(self):
         """Get the path of the Term"""
-        path = self.name
-        ts = self.term_set
-
-        # traverse the Term Sets to the root
-        try:
-            while ts.childtermset:
-                path = ts.name + '.' + path
-                ts = ts.childtermset.parent_term_set
-        except ChildTermSet.DoesNotExist:
-            return path
+        # the iri spells out the Term Sets below the root
+        return iri_path(self.iri)
 
     def mapped_to(self, target_root):
         """Return path if Term is mapped to anything in target_root string"""
@@ -240,6 +253,293 @@ class Term(TimeStampedModel):
         return None
 
 
+class TermSetTree:
+    """
+    In-memory tree of a Term Set with all its descendant Term Sets, Terms
+    and Term mappings.  The whole subtree is read with three queries, an
+    iri prefix scan for the Term Sets, one for the Terms and one prefetch
+    of their mappings, and export, json_ld and mapped_to then walk it
+    without touching the database.
+    """
+
+    def __init__(self, term_set):
+        self.root = term_set
+        prefix = term_set.iri
+
+        term_sets = TermSet.objects.filter(
+            models.Q(iri=prefix) | models.Q(iri__startswith=prefix + '/')
+        ).select_related('childtermset').order_by('iri')
+        terms = Term.objects.filter(
+            models.Q(iri__startswith=prefix + '?') |
+            models.Q(iri__startswith=prefix + '/')
+        ).prefetch_related('mapping').order_by('iri')
+
+        self.term_sets = {}
+        self.children = {}
+        self.parents = {}
+        for ts in term_sets:
+            self.term_sets[ts.iri] = ts
+            if hasattr(ts, 'childtermset'):
+                parent = ts.childtermset.parent_term_set_id
+                self.parents[ts.iri] = parent
+                self.children.setdefault(parent, []).append(ts)
+
+        self.terms = {}
+        for term in terms:
+            term_set = self.term_sets.get(term.term_set_id)
+            if term_set is None:
+                continue
+            # reuse the loaded Term Set instead of a query per Term
+            term.term_set = term_set
+            self.terms.setdefault(term.term_set_id, []).append(term)
+
+    def published_children(self, iri):
+        return [kid for kid in self.children.get(iri, [])
+                if kid.status == 'published']
+
+    def published_terms(self, iri):
+        return [term for term in self.terms.get(iri, [])
+                if term.status == 'published']
+
+    def export(self, iri=None):
+        iri = iri or self.root.iri
+        children = {kid.name: self.export(kid.iri)
+                    for kid in self.published_children(iri)}
+        terms = {term.name: term.export()
+                 for term in self.published_terms(iri)}
+        return {**children, **terms}
+
+    def json_ld(self, iri=None):
+        """Generate python representation of JSON-LD"""
+        iri = iri or self.root.iri
+        term_set = self.term_sets.get(iri, self.root)
+        # create graph and context dicts
+        graph = {}
+        context = {}
+        # add elements to graph and context
+        graph['@id'] = 'ldss:' + iri
+        graph['@type'] = 'rdfs:Class'
+        graph['rdfs:label'] = term_set.name
+        context['rdfs'] = 'http://www.w3.org/2000/01/rdf-schema#'
+        parent = self.parents.get(iri)
+        if parent is None and iri == self.root.iri and \
+                hasattr(self.root, 'childtermset'):
+            parent = self.root.childtermset.parent_term_set_id
+        if parent is not None:
+            graph['schema:domainIncludes'] = {'@id': 'ldss:' + parent}
+            context['schema'] = 'https://schema.org/'
+        # iterate over child term sets and collect their graphs and contexts
+        children = []
+        for kid in self.published_children(iri):
+            kid_ld = self.json_ld(kid.iri)
+            children.extend(kid_ld['@graph'])
+            # add children's context to current context, but current has
+            # higher priority
+            context = {**kid_ld['@context'], **context}
+        # iterate over terms and collect their graphs and contexts
+        terms = []
+        for term in self.published_terms(iri):
+            term_ld = term.json_ld()
+            terms.extend(term_ld['@graph'])
+            # add terms' context to current context, but current has higher
+            # priority
+            context = {**term_ld['@context'], **context}
+        # return the graph and context
+        return {'@context': context, '@graph': [graph, *children, *terms]}
+
+    def mapped_to(self, target_root, iri=None):
+        """Return dict of Terms mapped to anything in target_root string"""
+        iri = iri or self.root.iri
+
+        # filter out children with no mapped terms
+        children = {kid.name: self.mapped_to(target_root, kid.iri)
+                    for kid in self.published_children(iri)}
+        filtered_children = dict(
+            filter(lambda kid: len(kid[1]) != 0, children.items()))
+
+        # filter out terms that do not have a mapping
+        terms = {}
+        for term in self.published_terms(iri):
+            targets = [alt for alt in term.mapping.all()
+                       if alt.iri.startswith(target_root)]
+            if targets:
+                terms[term.name] = min(targets, key=lambda alt: alt.iri).path()
+        return {**filtered_children, **terms}
+
+
+class TermSetCache(models.Model):
+    """Model for the stored export and JSON-LD documents of a Term Set"""
+    # bump when export() or json_ld() change shape to discard stored copies
+    FORMAT_VERSION = 1
+
+    term_set = models.OneToOneField(
+        TermSet, on_delete=models.CASCADE, primary_key=True,
+        related_name='cache')
+    format_version = models.PositiveSmallIntegerField(default=FORMAT_VERSION)
+    export = models.JSONField(null=True, blank=True)
+    json_ld = models.JSONField(null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_document(cls, term_set, field):
+        """Return the stored field document of term_set, generating it on
+        a miss"""
+        cache, _ = cls.objects.get_or_create(term_set=term_set)
+        # modified only changes when the row is created, so it tells this
+        # row apart from one recreated after an invalidate
+        row = cls.objects.filter(pk=cache.pk, modified=cache.modified)
+        if cache.format_version != cls.FORMAT_VERSION:
+            row.filter(format_version=cache.format_version).update(
+                format_version=cls.FORMAT_VERSION, export=None, json_ld=None)
+            document = None
+        else:
+            document = getattr(cache, field)
+
+        if document is None:
+            document = getattr(term_set, field)()
+            # only store it if the row was not invalidated meanwhile, and
+            # leave the other document alone
+            row.filter(format_version=cls.FORMAT_VERSION).update(
+                **{field: document})
+        return document
+
+    @classmethod
+    def invalidate(cls, *iris):
+        """Drop the stored documents of every Term Set in the trees of the
+        given iris, as a document includes its children and mappings"""
+        roots = {root_iri(iri) for iri in iris if iri}
+        if not roots:
+            return
+
+        query = models.Q()
+        for root in roots:
+            query |= models.Q(term_set__iri=root) | \
+                models.Q(term_set__iri__startswith=root + '/')
+        cls.objects.filter(query).delete()
+
+
+class TermMappingIndex(models.Model):
+    """
+    Model for the denormalized mappings of published Terms, one row per
+    target Term and source root, holding what TermSet.mapped_to would
+    return for it.  Rows are rebuilt per target root whenever mappings or
+    statuses in it change.
+    """
+    target_term = models.ForeignKey(
+        Term, on_delete=models.CASCADE, related_name='+')
+    target_root = models.CharField(max_length=255)
+    target_path = models.CharField(max_length=255)
+    source_root = models.CharField(max_length=255)
+    source_path = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = [['target_term', 'source_root']]
+        indexes = [models.Index(fields=['target_root', 'source_root'],
+                                name='core_mapping_roots_idx')]
+
+    @classmethod
+    def rebuild(cls, *iris):
+        """Recompute the rows of the roots of the given iris"""
+        for root in {root_iri(iri) for iri in iris if iri}:
+            in_root = models.Q(iri__startswith=root + '?') | \
+                models.Q(iri__startswith=root + '/')
+            published = set(Term.objects.filter(in_root, status='published').
+                            values_list('iri', flat=True))
+            hidden = set(TermSet.objects.filter(
+                iri__startswith=root + '/').exclude(status='published').
+                values_list('iri', flat=True))
+            mappings = Term.mapping.through.objects.filter(
+                models.Q(from_term__iri__startswith=root + '?') |
+                models.Q(from_term__iri__startswith=root + '/')). \
+                values_list('from_term_id', 'to_term_id')
+
+            # mapped_to skips Terms below an unpublished Term Set and
+            # reports the first mapping into each source root
+            visible = {}
+            best = {}
+            for target, source in mappings:
+                if target not in visible:
+                    visible[target] = target in published and \
+                        not _below_any(target, root, hidden)
+                if not visible[target]:
+                    continue
+                key = (target, root_iri(source))
+                if key not in best or source < best[key]:
+                    best[key] = source
+
+            with transaction.atomic():
+                cls.objects.filter(target_root=root).delete()
+                cls.objects.bulk_create([
+                    cls(target_term_id=target, target_root=root,
+                        target_path=iri_path(target),
+                        source_root=source_root,
+                        source_path=iri_path(source))
+                    for (target, source_root), source in best.items()
+                ], batch_size=1000)
+
+    @classmethod
+    def refresh_term(cls, term):
+        """Recompute only the rows of one target Term, e.g. after its
+        status changed"""
+        root = root_iri(term.iri)
+        best = {}
+        if term.status == 'published' and not TermSet.objects.filter(
+                iri__in=_ancestors(term.iri, root)).exclude(
+                status='published').exists():
+            for source in Term.mapping.through.objects.filter(
+                    from_term_id=term.iri).values_list('to_term_id',
+                                                       flat=True):
+                if root_iri(source) not in best or \
+                        source < best[root_iri(source)]:
+                    best[root_iri(source)] = source
+
+        with transaction.atomic():
+            cls.objects.filter(target_term_id=term.iri).delete()
+            cls.objects.bulk_create([
+                cls(target_term_id=term.iri, target_root=root,
+                    target_path=iri_path(term.iri), source_root=source_root,
+                    source_path=iri_path(source))
+                for source_root, source in best.items()
+            ])
+
+    @classmethod
+    def mapped_to(cls, term_set, target_root):
+        """
+        Return dict of Terms mapped to anything in target_root string,
+        like TermSet.mapped_to, from a single indexed SELECT when both are
+        roots and from the Term Set tree otherwise.
+        """
+        if root_iri(term_set.iri) != term_set.iri or \
+                root_iri(target_root) != target_root:
+            return term_set.mapped_to(target_root)
+
+        mapped = {}
+        for target_path, source_path in cls.objects.filter(
+                target_root=term_set.iri, source_root=target_root). \
+                values_list('target_path', 'source_path'):
+            *term_sets, name = target_path.split('.')
+            node = mapped
+            for step in term_sets:
+                node = node.setdefault(step, {})
+            node[name] = source_path
+        return mapped
+
+
+def _ancestors(iri, root):
+    """List the Term Sets between root and iri, nearest first"""
+    ancestors = []
+    parent = iri.rsplit('?', 1)[0]
+    while parent != root:
+        ancestors.append(parent)
+        parent = parent.rsplit('/', 1)[0]
+    return ancestors
+
+
+def _below_any(iri, root, term_sets):
+    """Check if any Term Set between root and iri is in term_sets"""
+    return any(parent in term_sets for parent in _ancestors(iri, root))
+
+
 class SchemaLedger(TimeStampedModel):
     """Model for Uploaded Schemas"""
     SCHEMA_STATUS_CHOICES = [('published', 'published'),
@@ -265,9 +565,9 @@ class SchemaLedger(TimeStampedModel):
     version = models.CharField(max_length=255,
                                help_text="auto populated from other version "
                                          "fields")
-    major_version = models.SmallIntegerField(default=0)
-    minor_version = models.SmallIntegerField(default=0)
-    patch_version = models.SmallIntegerField(default=0)
+    major_version = models.PositiveIntegerField(default=0)
+    minor_version = models.PositiveIntegerField(default=0)
+    patch_version = models.PositiveIntegerField(default=0)
     updated_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
 
@@ -437,7 +737,7 @@ class NeoTerm(DjangoNode):
     django_id = UniqueIdProperty()
     uid = StringProperty(unique_index=True)
     uid_chain = StringProperty(unique_index=True)
-    lcvid = StringProperty(default="DOD-OSD-P_R-DHRA-DSSC")
+    lcvid = StringProperty(default=DEFAULT_LCVID)
     status = StringProperty(choices={'accepted':'accepted', 'rejected':'rejected', 'pending':'pending'}, default='pending')
     term = StringProperty(default="UNASSIGNED")
     deprecated = BooleanProperty(default=False)
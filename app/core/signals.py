@@ -1,11 +1,16 @@
 import logging
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
 from django.dispatch import receiver
 
-from core.management.utils.signals_utils import (termset_map, termset_object,
-                                                 update_status)
-from core.models import SchemaLedger, TermSet, TransformationLedger
+from core.management.utils.signals_utils import (ingest_schema_metadata,
+                                                 is_propagating_status,
+                                                 propagating_status,
+                                                 termset_map, update_status)
+from core.models import (ChildTermSet, SchemaLedger, Term, TermMappingIndex,
+                         TermSet, TermSetCache, TransformationLedger)
 
 logger = logging.getLogger('dict_config_logger')
 
@@ -17,10 +22,9 @@ def create_term_set(sender, instance, created, **kwargs):
                                          version=instance.version,
                                          status=instance.status,
                                          updated_by=instance.updated_by)
-        termset.save()
 
-        termset_object(instance.metadata, termset, instance.status,
-                       instance.updated_by)
+        ingest_schema_metadata(instance.metadata, termset, instance.status,
+                               instance.updated_by)
 
         logger.info("TermSet created")
 
@@ -31,9 +35,12 @@ def update_term_set(sender, instance, created, **kwargs):
         termset = TermSet.objects.get(iri=instance)
         termset.status = instance.status
         termset.updated_by = instance.updated_by
-        termset.save()
+        with transaction.atomic():
+            # the ledger is already current, skip update_schema_ledger
+            with propagating_status():
+                termset.save()
 
-        update_status(termset, termset.status, termset.updated_by)
+            update_status(termset, termset.status, termset.updated_by)
         logger.info("TermSet updated")
 
 
@@ -50,10 +57,84 @@ def map_term_sets(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=TermSet)
 def update_schema_ledger(sender, instance, created, **kwargs):
-    if not created:
-        SchemaLedger.objects.filter(schema_iri=instance.iri). \
-            update(status=instance.status,
-                   updated_by=instance.updated_by)
+    if not created and not is_propagating_status():
+        with transaction.atomic():
+            SchemaLedger.objects.filter(schema_iri=instance.iri). \
+                update(status=instance.status,
+                       updated_by=instance.updated_by)
 
-        update_status(instance, instance.status, instance.updated_by)
+            update_status(instance, instance.status, instance.updated_by)
         logger.info("SchemaLedger updated")
+
+
+@receiver(post_save, sender=TermSet)
+@receiver(post_save, sender=ChildTermSet)
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=TermSet)
+@receiver(post_delete, sender=ChildTermSet)
+@receiver(post_delete, sender=Term)
+def invalidate_term_set_cache(sender, instance, **kwargs):
+    TermSetCache.invalidate(instance.iri)
+
+
+@receiver(post_save, sender=SchemaLedger)
+def invalidate_schema_cache(sender, instance, **kwargs):
+    TermSetCache.invalidate(instance.schema_iri)
+
+
+@receiver(post_save, sender=TransformationLedger)
+def invalidate_mapping_cache(sender, instance, **kwargs):
+    TermSetCache.invalidate(instance.source_schema_id,
+                            instance.target_schema_id)
+
+
+@receiver(m2m_changed, sender=Term.mapping.through)
+def invalidate_term_mapping_cache(sender, instance, action, pk_set, **kwargs):
+    # mapped terms reference each other in their JSON-LD
+    if action == 'pre_clear':
+        instance._cleared_mapping = list(
+            instance.mapping.values_list('iri', flat=True))
+        TermSetCache.invalidate(instance.iri, *instance._cleared_mapping)
+    elif action == 'post_clear':
+        TermMappingIndex.rebuild(
+            instance.iri, *getattr(instance, '_cleared_mapping', []))
+    elif action in ('post_add', 'post_remove'):
+        TermSetCache.invalidate(instance.iri, *pk_set)
+        TermMappingIndex.rebuild(instance.iri, *pk_set)
+
+
+@receiver(pre_save, sender=ChildTermSet)
+@receiver(pre_save, sender=Term)
+def remember_status(sender, instance, **kwargs):
+    instance._saved_status = sender.objects.filter(pk=instance.pk). \
+        values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=ChildTermSet)
+@receiver(post_save, sender=Term)
+def rebuild_mapping_index(sender, instance, created, **kwargs):
+    # only status decides which rows exist; a new row has no mappings yet
+    # and root Term Set saves are covered by update_status
+    if created or instance.status == getattr(instance, '_saved_status',
+                                             instance.status):
+        return
+    if sender is Term:
+        TermMappingIndex.refresh_term(instance)
+    else:
+        TermMappingIndex.rebuild(instance.iri)
+
+
+@receiver(pre_delete, sender=Term)
+def remember_mapping(sender, instance, **kwargs):
+    # the delete cascades to the mapping rows without sending m2m_changed
+    instance._deleted_mapping = list(
+        instance.mapping.values_list('iri', flat=True))
+
+
+@receiver(post_delete, sender=Term)
+def refresh_mapped_terms(sender, instance, **kwargs):
+    # mapped Terms reference the deleted Term in their documents, and
+    # their index rows must fall back to their next mapping
+    mapped = getattr(instance, '_deleted_mapping', [])
+    TermSetCache.invalidate(*mapped)
+    TermMappingIndex.rebuild(*mapped)
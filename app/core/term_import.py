@@ -0,0 +1,296 @@
+import logging
+import time
+from typing import Dict, List
+from uuid import uuid4
+
+import pandas as pd
+from neomodel import db
+
+from core.exceptions import TermCreationError
+from core.models import DEFAULT_LCVID
+from core.utils import run_node_creation
+from deconfliction_service.node_utils import (add_to_similarity_index,
+                                              deconflict_within_batch,
+                                              find_similar_texts_by_embeddings,
+                                              generate_embeddings)
+from deconfliction_service.schema import ensure_graph_schema
+from uid.models import ProviderDjangoModel, issuing_uids
+
+logger = logging.getLogger('dict_config_logger')
+
+DEFAULT_CHUNK_SIZE = 500
+
+MERGE_CONTEXTS_QUERY = """
+UNWIND $contexts AS row
+MERGE (c:NeoContext {context: row.context})
+ON CREATE SET c.django_id = row.django_id
+WITH c, row
+OPTIONAL MATCH (existing:NeoContextDescription)-[:RATIONALE]->(c)
+WITH c, row, count(existing) AS existing_descriptions
+FOREACH (_ IN CASE WHEN existing_descriptions = 0 THEN [1] ELSE [] END |
+    CREATE (:NeoContextDescription {context_description: row.context_description})-[:RATIONALE]->(c)
+)
+"""
+
+MERGE_ALIASES_QUERY = """
+UNWIND $aliases AS row
+MERGE (a:NeoAlias {alias: row.alias})
+ON CREATE SET a.django_id = row.django_id
+"""
+
+CREATE_UNIQUE_TERMS_QUERY = """
+MATCH (p:Provider {name: $lcvid})
+UNWIND $rows AS row
+CREATE (u:UIDNode {uid: row.uid, created_at: $now, updated_at: $now})
+CREATE (t:NeoTerm {django_id: row.term_id, uid: row.uid, uid_chain: row.uid_chain, lcvid: $lcvid,
+                   status: 'pending', term: 'UNASSIGNED', deprecated: false})
+CREATE (t)-[:HAS_UID]->(u)
+CREATE (p)-[:HAS_UID]->(u)
+WITH row, t
+MATCH (c:NeoContext {context: row.context})
+MATCH (cd:NeoContextDescription)-[:RATIONALE]->(c)
+WITH row, t, c, head(collect(cd)) AS cd
+MERGE (d:NeoDefinition {definition: row.definition})
+ON CREATE SET d.django_id = row.definition_id, d.embedding = row.embedding, d.rejected = false
+MERGE (c)-[:IS_A]->(t)
+MERGE (t)-[:POINTS_TO]->(d)
+MERGE (d)-[:VALID_IN]->(c)
+MERGE (cd)-[:BASED_ON]->(d)
+WITH row, t, c
+OPTIONAL MATCH (a:NeoAlias {alias: row.alias})
+FOREACH (_ IN CASE WHEN a IS NULL THEN [] ELSE [1] END |
+    MERGE (a)-[:POINTS_TO]->(t)
+    MERGE (a)-[:USED_IN]->(c)
+)
+RETURN DISTINCT row.index
+"""
+
+CREATE_COLLISIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (existing:NeoDefinition {definition: row.most_similar_text})
+WITH row, head(collect(existing)) AS existing
+MATCH (c:NeoContext {context: row.context})
+MATCH (cd:NeoContextDescription)-[:RATIONALE]->(c)
+WITH row, existing, c, head(collect(cd)) AS cd
+CREATE (d:NeoDefinition {django_id: row.definition_id, definition: row.definition,
+                         embedding: row.embedding, rejected: false})
+MERGE (d)-[:VALID_IN]->(c)
+MERGE (cd)-[:BASED_ON]->(d)
+MERGE (d)-[:IS_COLLIDING_WITH]->(existing)
+WITH row, c, d
+MATCH (a:NeoAlias {alias: row.alias})
+MERGE (a)-[:USED_IN]->(c)
+MERGE (a)-[:WAS_ADDED_WITH]->(d)
+MERGE (d)-[:WAS_ADDED_WITH]->(a)
+RETURN DISTINCT row.index
+"""
+
+CREATE_DUPLICATES_QUERY = """
+UNWIND $rows AS row
+MATCH (d:NeoDefinition {definition: row.most_similar_text})
+WITH row, head(collect(d)) AS d
+MATCH (c:NeoContext {context: row.context})
+MATCH (cd:NeoContextDescription)-[:RATIONALE]->(c)
+WITH row, d, c, head(collect(cd)) AS cd
+OPTIONAL MATCH (t:NeoTerm)-[:POINTS_TO]->(d)
+WITH row, d, c, cd, head(collect(t)) AS t
+OPTIONAL MATCH (a:NeoAlias {alias: row.alias})
+WITH row, d, c, cd, t, a
+WHERE t IS NOT NULL OR a IS NOT NULL
+MERGE (d)-[:VALID_IN]->(c)
+MERGE (cd)-[:BASED_ON]->(d)
+FOREACH (_ IN CASE WHEN a IS NULL THEN [] ELSE [1] END |
+    MERGE (a)-[:USED_IN]->(c)
+)
+FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END |
+    MERGE (c)-[:IS_A]->(t)
+)
+FOREACH (_ IN CASE WHEN t IS NOT NULL AND a IS NOT NULL THEN [1] ELSE [] END |
+    MERGE (a)-[:POINTS_TO]->(t)
+)
+FOREACH (_ IN CASE WHEN t IS NULL THEN [1] ELSE [] END |
+    MERGE (a)-[:WAS_ADDED_WITH]->(d)
+)
+RETURN DISTINCT row.index
+"""
+
+
+class TermImporter:
+    """
+    Batched import engine for CSV glossaries.
+
+    Every definition is encoded in one batched call and deconflicted with
+    batched vector queries plus an in-memory similarity pass over the
+    upload itself before anything is written.  Rows are then
+    written in chunks, each chunk in its own transaction, with aliases,
+    contexts and context descriptions deduplicated in memory first.  If a
+    chunk fails it is rolled back and replayed row by row through
+    run_node_creation, so a bad row raises the same TermCreationError the
+    row-at-a-time import raised.
+
+    Collisions need an alias, and so do duplicates of a definition no term
+    points to yet.  The batched statements leave such rows unwritten, which
+    sends their chunk to the replay where they fail as they did before.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, lcvid: str = DEFAULT_LCVID):
+        self.chunk_size = chunk_size
+        self.lcvid = lcvid
+
+    def run(self, df: pd.DataFrame) -> List[Dict]:
+        """Import every row of df and return a per-row report"""
+        rows = self.rows_from_data_frame(df)
+        if not rows:
+            return []
+
+        logger.info(f'Encoding {len(rows)} definitions...')
+        embeddings = generate_embeddings([row['definition'] for row in rows])
+
+        ensure_graph_schema()
+        similarity_results = find_similar_texts_by_embeddings(embeddings, 'definition', 'definitions')
+
+        self.classify(rows, embeddings, similarity_results)
+
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            try:
+                self.write_chunk(chunk)
+            except Exception as e:
+                logger.error(f'Batched write failed for rows {chunk[0]["row"]}-{chunk[-1]["row"]}, '
+                             f'replaying them one at a time: {e}')
+                self.replay_chunk(chunk)
+
+        return [self.report_row(row) for row in rows]
+
+    def rows_from_data_frame(self, df: pd.DataFrame) -> List[Dict]:
+        """Pull the importable columns out of df without iterating rows"""
+        if 'Alias' in df.columns:
+            aliases = df['Alias'].astype(object)
+            aliases = aliases.where(aliases.notna() & (aliases != ''), None).tolist()
+        else:
+            aliases = [None] * len(df)
+
+        return [
+            {
+                'index': index,
+                'row': position + 1,
+                'alias': alias,
+                'definition': definition,
+                'context': context,
+                'context_description': context_description,
+            }
+            for position, (index, alias, definition, context, context_description) in enumerate(zip(
+                df.index.tolist(), aliases, df['Definition'].tolist(),
+                df['Context'].tolist(), df['Context Description'].tolist()))
+        ]
+
+    def classify(self, rows, embeddings, similarity_results):
+        """Attach embedding and deconfliction status to every row"""
+        classifications = deconflict_within_batch(
+            embeddings, [row['definition'] for row in rows], similarity_results)
+
+        for row, embedding, classification in zip(rows, embeddings, classifications):
+            row['embedding'] = [float(value) for value in embedding]
+            row['status'], row['most_similar_text'], row['score'] = classification
+
+    def write_chunk(self, chunk):
+        """Write one chunk of classified rows in a single transaction"""
+        unique_rows = [row for row in chunk if row['status'] == 'unique']
+        collision_rows = [row for row in chunk if row['status'] == 'collision']
+        duplicate_rows = [row for row in chunk if row['status'] == 'duplicate']
+
+        if unique_rows:
+            provider = ProviderDjangoModel.ensure_provider_exists(self.lcvid)
+
+        # a failed chunk hands its UIDs back to the allocator, which issues
+        # them again first, so the replay reuses them in the same order
+        with issuing_uids(self.lcvid, len(unique_rows)) as uids, db.transaction:
+            for row, uid in zip(unique_rows, uids):
+                row['uid'] = uid
+                row['uid_chain'] = f"{provider.default_uid}-{uid}"
+            self.merge_dimensions(chunk)
+            if unique_rows:
+                self.run_write(CREATE_UNIQUE_TERMS_QUERY, unique_rows, lcvid=self.lcvid, now=time.time())
+            if collision_rows:
+                self.run_write(CREATE_COLLISIONS_QUERY, collision_rows)
+            if duplicate_rows:
+                self.run_write(CREATE_DUPLICATES_QUERY, duplicate_rows)
+
+        created = unique_rows + collision_rows
+        add_to_similarity_index('definitions', [row['definition'] for row in created],
+                                [row['embedding'] for row in created])
+
+    def merge_dimensions(self, chunk):
+        """Upsert the distinct aliases, contexts and context descriptions of a chunk"""
+        contexts = {}
+        aliases = {}
+        for row in chunk:
+            contexts.setdefault(row['context'], {
+                'context': row['context'],
+                'context_description': row['context_description'],
+                'django_id': uuid4().hex,
+            })
+            if row['alias']:
+                aliases.setdefault(row['alias'], {'alias': row['alias'], 'django_id': uuid4().hex})
+
+        db.cypher_query(MERGE_CONTEXTS_QUERY, {'contexts': list(contexts.values())})
+        if aliases:
+            db.cypher_query(MERGE_ALIASES_QUERY, {'aliases': list(aliases.values())})
+
+    def run_write(self, query, rows, **params):
+        """Run a batched write and make sure every row was applied"""
+        payload = [
+            {
+                'index': position,
+                'alias': row['alias'],
+                'definition': row['definition'],
+                'context': row['context'],
+                'embedding': row['embedding'],
+                'most_similar_text': row['most_similar_text'],
+                'uid': row.get('uid'),
+                'uid_chain': row.get('uid_chain'),
+                'term_id': uuid4().hex,
+                'definition_id': uuid4().hex,
+            }
+            for position, row in enumerate(rows)
+        ]
+        results, _ = db.cypher_query(query, {'rows': payload, **params})
+
+        written = {result[0] for result in results}
+        missing = [rows[position]['row'] for position in range(len(rows)) if position not in written]
+        if missing:
+            raise Exception(f'Rows {missing} could not be written')
+
+    def replay_chunk(self, chunk):
+        """Write a chunk row by row, failing on the first bad row"""
+        for row in chunk:
+            row['uid'] = None
+            row['replayed'] = True
+            try:
+                result = run_node_creation(alias=row['alias'], definition=row['definition'], context=row['context'],
+                                           context_description=row['context_description'])
+            except Exception as e:
+                logger.error(f'Error creating term for index {row["index"]}: {str(e)}')
+                raise TermCreationError(f'Failed to create term for row {row["index"] + 1}: {str(e)}')
+            row['uid'] = result['uid']
+            row['status'] = result['status']
+            row['most_similar_text'] = result['most_similar_text']
+            row['score'] = result['score']
+
+    def report_row(self, row) -> Dict:
+        return {
+            'row': row['row'],
+            'status': row['status'],
+            'uid': row.get('uid'),
+            'most_similar_text': row['most_similar_text'],
+            'score': row['score'],
+            'replayed': row.get('replayed', False),
+        }
+
+
+def import_terms_from_data_frame(df: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[Dict]:
+    """Import a validated CSV upload and return one report entry per row"""
+    logger.info(f'Importing {len(df)} terms...')
+    report = TermImporter(chunk_size=chunk_size).run(df)
+    logger.info(f'{len(report)} terms imported.')
+    return report
@@ -1,10 +1,13 @@
 from unittest.mock import patch
 
 from ddt import ddt
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from django.db.utils import OperationalError
 from django.test import SimpleTestCase, tag
 
+from core.management.commands.bench import StubGraph, percentile
+from core.management.commands.startup_timing import summarize
+
 
 @tag('unit')
 @ddt
@@ -27,3 +30,40 @@ class CommandTests(SimpleTestCase):
             gi.ensure_connection.side_effect = [OperationalError] * 5 + [True]
             call_command('waitdb')
             self.assertEqual(gi.ensure_connection.call_count, 6)
+
+    def test_bench_percentile(self):
+        """Test nearest-rank percentiles of the bench report"""
+        values = [i / 100 for i in range(1, 101)]
+
+        self.assertEqual(percentile(values, 50), 0.5)
+        self.assertEqual(percentile(values, 99), 0.99)
+        self.assertEqual(percentile([0.1], 95), 0.1)
+
+    def test_bench_live_mode_needs_allow_writes(self):
+        """Test that a live benchmark refuses to write without consent"""
+        with self.assertRaises(CommandError):
+            call_command('bench', '--scenario', 'generate_uid')
+
+    def test_bench_stub_graph(self):
+        """Test that the bench stub reserves UID counter blocks"""
+        graph = StubGraph()
+        query = 'SET c.counter = c.counter + $count RETURN c.counter'
+
+        self.assertEqual(graph(query, {'count': 10})[0], [[10]])
+        self.assertEqual(graph(query, {'count': 5})[0], [[15]])
+
+    def test_startup_timing_summary(self):
+        """Test that the startup report keeps the median of every stage"""
+        runs = [[{'stage': 'django_setup', 'seconds': seconds,
+                  'max_rss_mb': 50.0 + seconds, 'torch_imported': False},
+                 {'stage': 'load_model', 'seconds': seconds * 10,
+                  'max_rss_mb': 400.0, 'torch_imported': True}]
+                for seconds in (0.3, 0.1, 0.2)]
+
+        stages = summarize(runs)
+
+        self.assertEqual(list(stages), ['django_setup', 'load_model'])
+        self.assertEqual(stages['django_setup'], {
+            'seconds': 0.2, 'max_rss_mb': 50.2, 'torch_imported': False})
+        self.assertEqual(stages['load_model']['seconds'], 2.0)
+        self.assertTrue(stages['load_model']['torch_imported'])
@@ -7,8 +7,10 @@ from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
 from django.test import tag
 
-from core.models import (ChildTermSet, SchemaLedger, Term, TermSet,
-                         TransformationLedger, validate_version, NeoTerm)
+from core.models import (LATEST_VERSION_ORDER, ChildTermSet, SchemaLedger,
+                         Term, TermMappingIndex, TermSet, TermSetCache,
+                         TermSetTree, TransformationLedger, root_iri,
+                         validate_version, version_numbers, NeoTerm)
 
 from neomodel import db
 
@@ -357,6 +359,174 @@ class ModelTests(TestSetUp):
         self.assertDictEqual(term.export(), expected_export,
                              "Incorrect Term export")
 
+    def test_term_set_cache(self):
+        """Test that a stored export is served until the tree changes"""
+        term = Term(name='cached', use=Term.USE_CHOICES[0][0],
+                    term_set=self.ts, status='published')
+        term.save()
+        self.ts.status = 'published'
+        self.ts.save()
+
+        with patch.object(TermSet, 'export',
+                          return_value={'cached': {}}) as export:
+            self.assertDictEqual(self.ts.cached_export(), {'cached': {}})
+            self.assertDictEqual(self.ts.cached_export(), {'cached': {}})
+            self.assertEqual(export.call_count, 1)
+
+            term.description = 'changed'
+            term.save()
+
+            self.ts.cached_export()
+            self.assertEqual(export.call_count, 2)
+
+        self.assertEqual(TermSetCache.objects.count(), 1)
+
+    def test_term_set_cache_fill_after_invalidate(self):
+        """Test that a document built while the tree changed is returned
+        but not stored, and that fills keep each other's documents"""
+        def export_and_change():
+            TermSetCache.invalidate(self.ts.iri)
+            return {'stale': {}}
+
+        with patch.object(TermSet, 'export', side_effect=export_and_change):
+            self.assertDictEqual(self.ts.cached_export(), {'stale': {}})
+        self.assertFalse(TermSetCache.objects.filter(term_set=self.ts).exists())
+
+        with patch.object(TermSet, 'export', return_value={'fresh': {}}), \
+                patch.object(TermSet, 'json_ld', return_value={'@graph': []}):
+            self.ts.cached_json_ld()
+            self.ts.cached_export()
+
+        cache = TermSetCache.objects.get(term_set=self.ts)
+        self.assertDictEqual(cache.export, {'fresh': {}})
+        self.assertDictEqual(cache.json_ld, {'@graph': []})
+
+    def test_term_delete_refreshes_mapped_terms(self):
+        """Test that deleting a Term drops the stored documents and index
+        rows of the Terms mapped to it"""
+        source = TermSet(name='source', version='1.0.0', status='published')
+        source.save()
+        source_term = Term(name='origin', use=Term.USE_CHOICES[0][0],
+                           term_set=source, status='published')
+        source_term.save()
+        term = Term(name='leaf', use=Term.USE_CHOICES[0][0],
+                    term_set=self.ts, status='published')
+        term.save()
+        term.mapping.add(source_term)
+        self.ts.status = 'published'
+        self.ts.save()
+        self.ts.cached_json_ld()
+        self.assertTrue(TermSetCache.objects.filter(term_set=self.ts).exists())
+        self.assertDictEqual(TermMappingIndex.mapped_to(self.ts, source.iri),
+                             {'leaf': 'origin'})
+
+        source_term.delete()
+
+        self.assertFalse(TermSetCache.objects.filter(term_set=self.ts).exists())
+        self.assertDictEqual(TermMappingIndex.mapped_to(self.ts, source.iri),
+                             {})
+
+    def test_root_iri(self):
+        """Test that the root Term Set is found from any iri"""
+        self.assertEqual(root_iri('xss:0.0.1@root'), 'xss:0.0.1@root')
+        self.assertEqual(root_iri('xss:0.0.1@root/child?term'),
+                         'xss:0.0.1@root')
+        self.assertEqual(root_iri('xss:0.0.1@root?term'), 'xss:0.0.1@root')
+
+    def test_term_set_tree(self):
+        """Test that a whole Term Set tree loads in a fixed number of
+        queries and exports like the Term Sets it holds"""
+        target = TermSet(name='target', version='1.0.0', status='published')
+        target.save()
+        target_term = Term(name='goal', use=Term.USE_CHOICES[0][0],
+                           term_set=target, status='published')
+        target_term.save()
+        kid = ChildTermSet(name='kid', status='published',
+                           parent_term_set=self.ts)
+        kid.save()
+        term = Term(name='leaf', use=Term.USE_CHOICES[0][0],
+                    term_set=kid, status='published')
+        term.save()
+        term.mapping.add(target_term)
+        Term(name='old', use=Term.USE_CHOICES[0][0],
+             term_set=kid, status='retired').save()
+
+        with self.assertNumQueries(3):
+            tree = TermSetTree(self.ts)
+            export = tree.export()
+            json_ld = tree.json_ld()
+            mapped = tree.mapped_to(target.iri)
+
+        self.assertDictEqual(export, {'kid': {'leaf': {'use': 'Required'}}})
+        self.assertEqual(len(json_ld['@graph']), 3)
+        self.assertDictEqual(mapped, {'kid': {'leaf': 'goal'}})
+        self.assertEqual(term.path(), 'kid.leaf')
+        self.assertEqual(target_term.path(), 'goal')
+
+    def test_term_mapping_index(self):
+        """Test that the mapping index follows mapping and status changes
+        and matches the Term Set tree"""
+        source = TermSet(name='source', version='1.0.0', status='published')
+        source.save()
+        source_term = Term(name='origin', use=Term.USE_CHOICES[0][0],
+                           term_set=source, status='published')
+        source_term.save()
+        kid = ChildTermSet(name='kid', status='published',
+                           parent_term_set=self.ts)
+        kid.save()
+        term = Term(name='leaf', use=Term.USE_CHOICES[0][0],
+                    term_set=kid, status='published')
+        term.save()
+        term.mapping.add(source_term)
+
+        with self.assertNumQueries(1):
+            mapped = TermMappingIndex.mapped_to(self.ts, source.iri)
+        self.assertDictEqual(mapped, {'kid': {'leaf': 'origin'}})
+        self.assertDictEqual(mapped, self.ts.mapped_to(source.iri))
+        self.assertDictEqual(TermMappingIndex.mapped_to(source, self.ts.iri),
+                             {'origin': 'kid.leaf'})
+
+        # plain edits leave the index alone, a status change only
+        # touches the saved Term's rows
+        with patch.object(TermMappingIndex, 'rebuild') as rebuild:
+            term.description = 'edited'
+            term.save()
+            term.status = 'retired'
+            term.save()
+        rebuild.assert_not_called()
+        self.assertDictEqual(TermMappingIndex.mapped_to(self.ts, source.iri),
+                             {})
+        term.status = 'published'
+        term.save()
+        self.assertDictEqual(TermMappingIndex.mapped_to(self.ts, source.iri),
+                             {'kid': {'leaf': 'origin'}})
+
+        kid.status = 'retired'
+        kid.save()
+        self.assertDictEqual(TermMappingIndex.mapped_to(self.ts, source.iri),
+                             {})
+
+        kid.status = 'published'
+        kid.save()
+        source_term.delete()
+        self.assertFalse(TermMappingIndex.objects.exists())
+
+    def test_term_set_version_numbers(self):
+        """Test that Term Sets sort by their numeric version"""
+        for version in ('1.9.0', '1.10.0', '1.2.30'):
+            TermSet(name='versioned', version=version,
+                    status='published').save()
+        kid = ChildTermSet(name='kid', status='published',
+                           parent_term_set=TermSet.objects.get(
+                               iri='xss:1.10.0@versioned'))
+        kid.save()
+
+        self.assertEqual((kid.major_version, kid.minor_version,
+                          kid.patch_version), (1, 10, 0))
+        self.assertEqual(TermSet.objects.filter(name='versioned').order_by(
+            *LATEST_VERSION_ORDER).first().version, '1.10.0')
+        self.assertEqual(version_numbers('1..2'), (1, 0, 2))
+
     def test_validate_version_pass(self):
         """Test that validate version passes correct formats"""
         validate_version("0.0.1")
@@ -366,6 +536,14 @@ class ModelTests(TestSetUp):
         """Test that validate version fails bad formats"""
         self.assertRaises(ValidationError, validate_version, "0.0..1")
 
+    def test_validate_version_fail_too_large(self):
+        """Test that validate version fails numbers the version columns
+        cannot hold"""
+        validate_version("1.40000.0")
+        self.assertRaises(ValidationError, validate_version, "1.2147483648.0")
+        self.assertEqual(version_numbers('1.2147483648.0'),
+                         (1, 2147483647, 0))
+
 
 @tag('unit')
 class NeoTermTests(unittest.TestCase):
@@ -13,7 +13,7 @@ class SignalTests(TestSetUp):
         """Function to check create postsave of schema ledger
         in termsets and terms"""
 
-        with patch('core.signals.termset_object'):
+        with patch('core.signals.ingest_schema_metadata'):
             self.schema.save()
             termset = TermSet.objects.get(name=self.schema_name)
 
@@ -38,6 +38,22 @@ class SignalTests(TestSetUp):
             termset = TermSet.objects.get(name=self.schema_name)
             self.assertEqual(termset.status, 'retired')
 
+    def test_update_term_set_propagates_once(self):
+        """Test that a ledger status change is propagated to the Term Set
+        tree once"""
+
+        with patch('core.signals.update_status') as update_status, \
+                patch('core.signals.create_term_set'):
+
+            self.schema.save()
+
+            schemaledger = \
+                SchemaLedger.objects.get(schema_name=self.schema_name)
+            schemaledger.status = 'retired'
+            schemaledger.save()
+
+            update_status.assert_called_once()
+
     def test_map_term_sets(self):
         """Test to verify mappings are kicked off"""
 
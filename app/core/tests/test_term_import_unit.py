@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, tag
+
+from core.exceptions import TermCreationError
+from core.term_import import TermImporter
+
+
+@tag('unit')
+class TermImporterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'Alias': ['first', None, ''],
+            'Definition': ['a definition', 'another definition',
+                           'a definition'],
+            'Context': ['context', 'context', 'other context'],
+            'Context Description': ['description', 'description',
+                                    'other description'],
+        })
+        self.importer = TermImporter(chunk_size=2)
+
+    def test_rows_from_data_frame(self):
+        """Test that rows are extracted with empty aliases set to None"""
+        rows = self.importer.rows_from_data_frame(self.df)
+
+        self.assertEqual([row['alias'] for row in rows],
+                         ['first', None, None])
+        self.assertEqual([row['row'] for row in rows], [1, 2, 3])
+        self.assertEqual(rows[2]['context'], 'other context')
+
+    def test_rows_from_data_frame_no_alias_column(self):
+        """Test that a missing Alias column means no aliases"""
+        rows = self.importer.rows_from_data_frame(
+            self.df.drop(columns=['Alias']))
+
+        self.assertEqual([row['alias'] for row in rows], [None] * 3)
+
+    def test_classify(self):
+        """Test that rows are classified against the index and against
+        definitions created earlier in the same upload"""
+        rows = self.importer.rows_from_data_frame(self.df)
+        embeddings = np.array([[1, 0, 0], [0, 1, 0], [1, 0, 0]],
+                              dtype=np.float32)
+        similarity_results = [[], [('existing', 0.95)], [('existing', 0.1)]]
+
+        self.importer.classify(rows, embeddings, similarity_results)
+
+        self.assertEqual([row['status'] for row in rows],
+                         ['unique', 'duplicate', 'duplicate'])
+        self.assertEqual(rows[1]['most_similar_text'], 'existing')
+        self.assertEqual(rows[2]['most_similar_text'], 'a definition')
+
+    def test_classify_collision_within_upload(self):
+        """Test that near-duplicates inside one upload collide"""
+        rows = self.importer.rows_from_data_frame(self.df)
+        embeddings = np.array([[1, 0, 0], [0, 1, 0], [0.7, 0, 0.7141]],
+                              dtype=np.float32)
+
+        self.importer.classify(rows, embeddings, [[], [], []])
+
+        self.assertEqual([row['status'] for row in rows],
+                         ['unique', 'unique', 'collision'])
+        self.assertEqual(rows[2]['most_similar_text'], 'a definition')
+        self.assertAlmostEqual(rows[2]['score'], 0.85, places=3)
+
+    def test_replay_chunk_raises_for_failing_row(self):
+        """Test that replaying a chunk keeps the per-row error"""
+        rows = self.importer.rows_from_data_frame(self.df)
+
+        with patch('core.term_import.run_node_creation') as run:
+            run.side_effect = [{'status': 'unique', 'uid': '0x00000001',
+                                'most_similar_text': None, 'score': 0},
+                               Exception('boom')]
+
+            with self.assertRaisesMessage(
+                    TermCreationError,
+                    'Failed to create term for row 2: boom'):
+                self.importer.replay_chunk(rows)
+
+    def test_replay_chunk_reports_replayed_result(self):
+        """Test that a replayed row reports the UID and status it was
+        written with"""
+        rows = self.importer.rows_from_data_frame(self.df)[:1]
+        rows[0].update(status='collision', uid=None,
+                       most_similar_text='existing', score=0.8)
+
+        with patch('core.term_import.run_node_creation') as run:
+            run.return_value = {'status': 'unique', 'uid': '0x00000002',
+                                'most_similar_text': 'existing',
+                                'score': 0.3}
+            self.importer.replay_chunk(rows)
+
+        report = self.importer.report_row(rows[0])
+        self.assertEqual(report['uid'], '0x00000002')
+        self.assertEqual(report['status'], 'unique')
+        self.assertTrue(report['replayed'])
+
+    def test_write_chunk_releases_uids_when_a_row_is_not_written(self):
+        """Test that a collision without an alias fails its chunk, as the
+        row-at-a-time import did, and that the chunk's UIDs are handed
+        back instead of logged"""
+        rows = self.importer.rows_from_data_frame(self.df)[:2]
+        for row, status in zip(rows, ['unique', 'collision']):
+            row.update(status=status, embedding=[1.0],
+                       most_similar_text='existing', score=0.8)
+
+        with patch('core.term_import.ProviderDjangoModel') as provider, \
+                patch('uid.models.reserve_uids',
+                      return_value=['0x00000003']), \
+                patch('uid.models.log_generated_uids') as log, \
+                patch('uid.models.release_uids') as release, \
+                patch('core.term_import.db') as db:
+            provider.ensure_provider_exists.return_value.default_uid = \
+                '0x00000001'
+            db.cypher_query.side_effect = [
+                (None, None), (None, None), ([[0]], None), ([], None)]
+
+            with self.assertRaisesMessage(Exception,
+                                          'Rows [2] could not be written'):
+                self.importer.write_chunk(rows)
+
+        self.assertEqual(rows[0]['uid_chain'], '0x00000001-0x00000003')
+        self.assertIsNotNone(db.transaction.__exit__.call_args[0][0])
+        release.assert_called_once_with(self.importer.lcvid, ['0x00000003'])
+        log.assert_not_called()
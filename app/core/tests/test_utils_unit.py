@@ -1,13 +1,17 @@
 from unittest.mock import patch
 
 from ddt import data, ddt, unpack
-from django.test import tag
+from django.test import SimpleTestCase, tag
 
 from ..management.utils.signals_utils import (create_child_termset,
-                                              create_terms, term_object,
+                                              create_terms,
+                                              ingest_schema_metadata,
+                                              term_object, termset_map,
                                               termset_object, update_status)
 from ..management.utils.xss_helper import bleach_data_to_json, sort_version
-from ..models import ChildTermSet, TermSet
+from ..models import DEFAULT_LCVID, ChildTermSet, Term, TermSet
+from ..term_import import CREATE_UNIQUE_TERMS_QUERY
+from ..utils import run_unique_definition_creation
 from .test_setup import TestSetUp
 
 
@@ -66,6 +70,71 @@ class UtilsTests(TestSetUp):
                         'status', self.user)
             self.assertEqual(mock_create_terms.call_count, 1)
 
+    def test_ingest_schema_metadata(self):
+        """Test that bulk ingestion creates the same rows as
+        termset_object"""
+        metadata = {'outer': {'inner': {'leaf': {'use': 'Required',
+                                                 'data_type': 'str'}},
+                              'term': {'use': 'Optional'}},
+                    'top': {'use': 'Recommended', 'description': 'top'},
+                    'empty': {}, 'ignored': 'value'}
+        legacy = TermSet(name='legacy', version='1.0.0',
+                         status=self.status)
+        legacy.save()
+        bulk = TermSet(name='bulk', version='1.0.0', status=self.status)
+        bulk.save()
+
+        termset_object(metadata, legacy, self.status, self.user)
+        ingest_schema_metadata(metadata, bulk, self.status, self.user)
+
+        def rows(model, root, *fields):
+            return sorted(
+                (obj['iri'][len(root.iri):],
+                 *(obj[field] for field in fields))
+                for obj in model.objects.filter(iri__startswith=root.iri)
+                .exclude(iri=root.iri).values('iri', *fields))
+
+        for model, fields in ((ChildTermSet, ('name', 'version', 'status',
+                                              'updated_by')),
+                              (Term, ('name', 'use', 'data_type',
+                                      'description', 'status',
+                                      'updated_by'))):
+            self.assertEqual(rows(model, bulk, *fields),
+                             rows(model, legacy, *fields))
+        self.assertEqual(bulk.children.get().children.get().name, 'inner')
+        self.assertEqual(Term.objects.filter(
+            iri__startswith=bulk.iri).count(), 3)
+
+    def test_termset_map(self):
+        """Test that mappings are resolved in memory and the missing ones
+        are logged together"""
+        source = TermSet(name='source', version='1.0.0', status=self.status)
+        source.save()
+        target = TermSet(name='target', version='1.0.0', status=self.status)
+        target.save()
+        ingest_schema_metadata({'inner': {'leaf': {'use': 'Required'}},
+                                'top': {'use': 'Optional'}},
+                               source, self.status, self.user)
+        ingest_schema_metadata({'kid': {'goal': {'use': 'Required'}},
+                                'other': {'use': 'Optional'}},
+                               target, self.status, self.user)
+
+        with patch('core.management.utils.signals_utils.logger') as log:
+            termset_map(target, source, {'kid': {'goal': 'inner.leaf'},
+                                         'other': 'top',
+                                         'missing': {'goal': 'top'},
+                                         'absent': 'nowhere.leaf'})
+
+        goal = Term.objects.get(iri=target.iri + '/kid?goal')
+        self.assertEqual(list(goal.mapping.values_list('iri', flat=True)),
+                         [source.iri + '/inner?leaf'])
+        self.assertEqual(Term.objects.get(iri=source.iri + '?top').mapping
+                         .get().iri, target.iri + '?other')
+        skipped = log.info.call_args_list[0][0][0]
+        self.assertIn('Target Term Set does not exist: missing', skipped)
+        self.assertIn('Source Term Set does not exist: nowhere.leaf',
+                      skipped)
+
     def test_update_status(self):
         """Test function to update the status of children terms/termsets"""
         self.schema.save()
@@ -100,3 +169,60 @@ class UtilsTests(TestSetUp):
 
         self.assertEqual(returned_dict, bad_dict)
         self.assertDictEqual(clean_dict, returned_dict)
+
+
+@tag('unit')
+class TermCreationTests(SimpleTestCase):
+
+    def test_run_unique_definition_creation(self):
+        """Test that a unique term is written in one transaction with the
+        importer's batched statement"""
+        with patch('core.utils.ProviderDjangoModel') as provider, \
+                patch('uid.models.reserve_uids', return_value=['0x00000002']), \
+                patch('uid.models.log_generated_uids') as log, \
+                patch('uid.models.release_uids') as release, \
+                patch('uid.models.transaction.on_commit',
+                      side_effect=lambda callback: callback()), \
+                patch('core.utils.db') as db, \
+                patch('core.term_import.db', db):
+            provider.ensure_provider_exists.return_value.default_uid = \
+                '0x00000001'
+            db.cypher_query.return_value = ([[0]], None)
+
+            uid = run_unique_definition_creation(
+                'a definition', 'context', 'description', [0.5, 0.25],
+                None)
+
+        self.assertEqual(uid, '0x00000002')
+        # contexts, then the term, no aliases to merge
+        self.assertEqual(db.cypher_query.call_count, 2)
+        query, params = db.cypher_query.call_args[0]
+        self.assertEqual(query, CREATE_UNIQUE_TERMS_QUERY)
+        self.assertEqual(len(params['rows']), 1)
+        self.assertEqual(params['rows'][0]['uid_chain'],
+                         '0x00000001-0x00000002')
+        self.assertIsNone(params['rows'][0]['alias'])
+        self.assertEqual(params['lcvid'], DEFAULT_LCVID)
+        db.transaction.__enter__.assert_called_once()
+        log.assert_called_once_with(DEFAULT_LCVID, ['0x00000002'])
+        release.assert_not_called()
+
+    def test_run_unique_definition_creation_missing_provider(self):
+        """Test that nothing written by the statement is kept when the
+        provider node is missing"""
+        with patch('core.utils.ProviderDjangoModel'), \
+                patch('uid.models.reserve_uids', return_value=['0x00000002']), \
+                patch('uid.models.log_generated_uids') as log, \
+                patch('uid.models.release_uids') as release, \
+                patch('core.utils.db') as db, \
+                patch('core.term_import.db', db):
+            db.cypher_query.return_value = ([], None)
+
+            with self.assertRaises(Exception):
+                run_unique_definition_creation(
+                    'a definition', 'context', 'description', [0.5],
+                    'alias')
+
+        self.assertIsNotNone(db.transaction.__exit__.call_args[0][0])
+        log.assert_not_called()
+        release.assert_called_once_with(DEFAULT_LCVID, ['0x00000002'])
@@ -1,8 +1,13 @@
+import csv
+import gzip
 import unittest
+from io import StringIO
 from unittest.mock import patch, MagicMock
 import json
 from core.models import NeoTerm
-from core.views import export_terms_as_json, export_terms_as_xml
+from core.views import (accepts_gzip, export_terms_as_csv,
+                        export_terms_as_json, export_terms_as_xml,
+                        iter_term_pages)
 import xml.etree.ElementTree as ET
 
 class ExportNeoTermsViewsTests(unittest.TestCase):
@@ -21,10 +26,15 @@ class ExportNeoTermsViewsTests(unittest.TestCase):
         self.neoterm2.context_description = 'test_context_description2'
 
     
-    @patch('core.models.NeoTerm.nodes', autoSpec=True)
-    def test_export_terms_as_json(self, mock_nodes):
-        
-        mock_nodes.all.return_value = [self.neoterm1, self.neoterm2]
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_json(self, mock_query):
+        mock_query.return_value = ([
+            ['0x00000001', 'lcvid', ['alias'], ['test_definition'],
+             [{'context': 'test_context',
+               'context_description': 'test_context_description'}]],
+            ['0x00000002', 'lcvid', [], [],
+             [{'context': 'test_context2', 'context_description': None}]],
+        ], None)
 
         request = MagicMock()
         response = export_terms_as_json(request)
@@ -33,16 +43,98 @@ class ExportNeoTermsViewsTests(unittest.TestCase):
         self.assertEqual(response['Content-Disposition'], 'attachment; filename="terms.json"')
 
         expected_json = [
-            {'term': 'test_term', 'definition': 'test_definition', 'context': 'test_context', 'context_description': 'test_context_description'},
-            {'term': 'test_term2', 'definition': 'test_definition2', 'context': 'test_context2', 'context_description': 'test_context_description2'},
+            {'uid': '0x00000001', 'aliases': ['alias'], 'definition': 'test_definition',
+             'contexts': [{'context': 'test_context', 'context_description': 'test_context_description'}]},
+            {'uid': '0x00000002', 'aliases': [],
+             'contexts': [{'context': 'test_context2'}]},
         ]
-        self.assertEqual(json.loads(response.content), expected_json)
-    
-    @patch('core.models.NeoTerm.nodes', autoSpec=True)
-    def test_export_terms_as_xml(self, mock_nodes):
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected_json)
+        self.assertEqual(mock_query.call_count, 1)
+
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_json_pages(self, mock_query):
+        rows = [[f'0x{i:08x}', 'lcvid', [], [], []] for i in range(3)]
+        mock_query.side_effect = [(rows[:2], None), (rows[2:], None)]
+
+        self.assertEqual(
+            [len(page) for page in iter_term_pages(page_size=2)], [2, 1])
+        self.assertEqual(mock_query.call_args[0][1],
+                         {'after': '0x00000001', 'limit': 2})
+
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_csv(self, mock_query):
+        mock_query.return_value = ([
+            ['0x00000001', 'lcvid', ['alias', 'other'], ['test_definition'],
+             [{'context': 'b', 'context_description': 'b description'},
+              {'context': 'a', 'context_description': None}]],
+            ['0x00000002', 'lcvid', [], [], []],
+        ], None)
+
+        request = MagicMock()
+        request.META = {'HTTP_ACCEPT_ENCODING': 'gzip, deflate'}
+        response = export_terms_as_csv(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="terms_export.csv"')
+
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(list(csv.reader(StringIO(content))), [
+            ['UID', 'Parent ID', 'Aliases', 'Definitions', 'Context', 'Context Description'],
+            ['0x00000001', 'lcvid', 'alias; other', 'test_definition', 'a', ''],
+            ['0x00000001', 'lcvid', 'alias; other', 'test_definition', 'b', 'b description'],
+            ['0x00000002', 'lcvid', '', '', '', ''],
+        ])
+
+    def test_accepts_gzip(self):
+        for header, expected in [
+            ('gzip, deflate', True),
+            ('deflate, GZIP;q=0.5', True),
+            ('gzip;q=0', False),
+            ('gzip; q=0.0, deflate', False),
+            ('*;q=0.1', True),
+            ('gzip;q=0, *', False),
+            ('x-gzip', True),
+            ('deflate, br', False),
+            ('', False),
+        ]:
+            with self.subTest(header=header):
+                self.assertEqual(accepts_gzip(header), expected)
+
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_csv_gzip_refused(self, mock_query):
+        mock_query.return_value = ([
+            ['0x00000001', 'lcvid', [], ['test_definition'], []],
+        ], None)
+
+        request = MagicMock()
+        request.META = {'HTTP_ACCEPT_ENCODING': 'gzip;q=0, identity'}
+        response = export_terms_as_csv(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('0x00000001', content)
+
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_csv_empty(self, mock_query):
+        mock_query.return_value = ([], None)
+
+        request = MagicMock()
+        request.META = {}
+        response = export_terms_as_csv(request)
+
+        self.assertEqual(response.status_code, 302)
+
+    @patch('core.views.db.cypher_query')
+    def test_export_terms_as_xml(self, mock_query):
+        mock_query.return_value = ([
+            ['0x00000001', 'lcvid', ['alias'], ['test_definition'],
+             [{'context': 'test_context',
+               'context_description': 'test_context_description'}]],
+            ['0x00000002', 'lcvid', [], [], []],
+        ], None)
 
-        mock_nodes.all.return_value = [self.neoterm1, self.neoterm2]
-        
         request = MagicMock()
         response = export_terms_as_xml(request)
 
@@ -50,17 +142,9 @@ class ExportNeoTermsViewsTests(unittest.TestCase):
         self.assertEqual(response['Content-Disposition'], 'attachment; filename="terms.xml"')
         self.assertEqual(response['Content-Type'], 'application/xml')
 
-        xml_string = "<NeoTerms><NeoTerm><term>test_term</term><definition>test_definition</definition><context>test_context</context><context_description>test_context_description</context_description></NeoTerm><NeoTerm><term>test_term2</term><definition>test_definition2</definition><context>test_context2</context><context_description>test_context_description2</context_description></NeoTerm></NeoTerms>"
-        
+        xml_string = "<Terms><Term><uid>0x00000001</uid><aliases><Alias>alias</Alias></aliases><definition>test_definition</definition><contexts><context><context>test_context</context><context_description>test_context_description</context_description></context></contexts></Term><Term><uid>0x00000002</uid><aliases /><contexts /></Term></Terms>"
 
-        actual_xml = ET.fromstring(response.content)
+        actual_xml = ET.fromstring(b''.join(response.streaming_content))
         expected_xml = ET.fromstring(xml_string)
 
-        ## TODO:     
-        ##      Potentially weak assertion if the XML structure changes,
-        ##      as this is a string literal comparison.
-        ##
-        ##      Would prefer if this sort of thing were compared with properties
-        ##      down the road.
-        ##    
-        self.assertEqual(ET.tostring(actual_xml), ET.tostring(expected_xml))
\ No newline at end of file
+        self.assertEqual(ET.tostring(actual_xml), ET.tostring(expected_xml))
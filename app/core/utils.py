@@ -1,9 +1,13 @@
-from .models import NeoAlias, NeoDefinition, NeoContext, NeoContextDescription, NeoTerm
+from .models import DEFAULT_LCVID, NeoAlias, NeoDefinition, NeoContext, NeoContextDescription
 from deconfliction_service.views import run_deconfliction
+from deconfliction_service.node_utils import add_to_similarity_index
 import logging
+import time
 from uuid import uuid4
 
-from uid.models import UIDNode
+from neomodel import db
+
+from uid.models import ProviderDjangoModel, UIDNode, issuing_uids
 
 logger = logging.getLogger('dict_config_logger')
 
@@ -12,41 +16,57 @@ def run_node_creation(definition: str, context: str, context_description: str, a
         logger.info('Running Deconfliction')
         definition_vector_embedding, deconfliction_status, most_similar_text, highest_score = run_deconfliction(alias, definition, context, context_description)
 
+        uid = None
         if deconfliction_status == 'unique':
-            run_unique_definition_creation(definition=definition, context=context, context_description=context_description, definition_embedding=definition_vector_embedding, alias=alias)
+            uid = run_unique_definition_creation(definition=definition, context=context, context_description=context_description, definition_embedding=definition_vector_embedding, alias=alias)
         elif deconfliction_status == 'duplicate':
             run_duplicate_definition_creation(alias, most_similar_text, context, context_description)
         elif deconfliction_status == 'collision':
             run_collision_definition_creation(alias, most_similar_text, definition, context, context_description, definition_vector_embedding, highest_score)
-            
+
+        if deconfliction_status in ('unique', 'collision'):
+            add_to_similarity_index('definitions', [definition], [definition_vector_embedding])
+
+        return {
+            'status': deconfliction_status,
+            'uid': uid,
+            'most_similar_text': most_similar_text,
+            'score': highest_score,
+        }
 
     except Exception as e: 
         logger.error(f"Error in run_node_creation: {e}")
         raise e
 
 
-def run_unique_definition_creation(definition, context, context_description, definition_embedding, alias):
-    try:
-        # uid = uuid4()
-        term_node = NeoTerm.create_new_term()
-
-        alias_node = None
-        if alias:
-            alias_node, _ = NeoAlias.get_or_create(alias=alias)
-
-        definition_node, _ = NeoDefinition.get_or_create(definition=definition, definition_embedding=definition_embedding)
-
-        context_node, _ = NeoContext.get_or_create(context=context)
+def run_unique_definition_creation(definition, context, context_description, definition_embedding, alias,
+                                   lcvid: str = DEFAULT_LCVID):
+    """Create a new term and its subgraph in one transaction, all or nothing,
+    with the statements the CSV importer batches; the UID is only logged once
+    the write commits"""
+    from core.term_import import CREATE_UNIQUE_TERMS_QUERY, TermImporter
 
-        context_description_node, _ = NeoContextDescription.get_or_create(context_description=context_description, context_node=context_node)
+    try:
+        provider = ProviderDjangoModel.ensure_provider_exists(lcvid)
+        importer = TermImporter(lcvid=lcvid)
+
+        with issuing_uids(lcvid, 1) as (uid,), db.transaction:
+            row = {
+                'row': 1,
+                'alias': alias or None,
+                'definition': definition,
+                'context': context,
+                'context_description': context_description,
+                'embedding': [float(value) for value in definition_embedding],
+                'most_similar_text': None,
+                'uid': uid,
+                'uid_chain': f"{provider.default_uid}-{uid}",
+            }
+            importer.merge_dimensions([row])
+            importer.run_write(CREATE_UNIQUE_TERMS_QUERY, [row], lcvid=lcvid, now=time.time())
+
+        return uid
 
-        context_node.set_relationships(term_node=term_node, alias_node=alias_node, definition_node=definition_node, context_description_node=context_description_node)
-        term_node.set_relationships(alias_node=alias_node, definition_node=definition_node, context_node=context_node)
-        if alias_node:
-            alias_node.set_relationships(term_node=term_node, context_node=context_node)
-        definition_node.set_relationships(term_node, context_node, context_description_node)
-        context_description_node.set_relationships(definition_node, context_node)
-        
     except Exception as e: 
         logger.error(f"Error in run_unique_definition_creation: {e}")
         raise e
@@ -1,70 +1,107 @@
-from django.http import JsonResponse
-from .models import NeoTerm
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib import messages
-import xml.etree.ElementTree as ET
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from xml.sax.saxutils import XMLGenerator
 from neomodel import db
 import csv
 from io import StringIO
+import itertools
+import json
+import textwrap
+import zlib
 
 import logging
 
 logger = logging.getLogger('dict_config_logger')
 
+EXPORT_PAGE_SIZE = 1000
+
+
+EXPORT_TERMS_QUERY = """
+MATCH (t:NeoTerm)
+WHERE t.uid IS NOT NULL AND ($after IS NULL OR t.uid > $after)
+WITH t ORDER BY t.uid LIMIT $limit
+OPTIONAL MATCH (a:NeoAlias)-[:POINTS_TO]->(t)
+WITH t, collect(DISTINCT a.alias) AS aliases
+OPTIONAL MATCH (t)-[:POINTS_TO]->(d:NeoDefinition)
+WITH t, aliases, collect(DISTINCT d.definition) AS definitions
+OPTIONAL MATCH (c:NeoContext)-[:IS_A]->(t)
+OPTIONAL MATCH (cd:NeoContextDescription)-[:RATIONALE]->(c)
+WITH t, aliases, definitions, c, collect(cd.context_description) AS context_descriptions
+WITH t, aliases, definitions,
+     collect(CASE WHEN c IS NULL THEN null
+             ELSE {context: c.context, context_description: head(context_descriptions)} END) AS contexts
+RETURN t.uid, t.lcvid, aliases, definitions, contexts
+ORDER BY t.uid
+"""
+
+
+def iter_term_pages(page_size: int = EXPORT_PAGE_SIZE):
+    """
+    Yield every exported term with its aliases, definitions and contexts,
+    one page of rows at a time.  Pages are read with keyset pagination on
+    the term uid, so each page is a single indexed scan and no more than a
+    page is ever held in memory.
+    """
+    after = None
+    while True:
+        results, _ = db.cypher_query(EXPORT_TERMS_QUERY, {'after': after, 'limit': page_size})
+        if not results:
+            return
+        yield results
+        if len(results) < page_size:
+            return
+        after = results[-1][0]
+
+
+def peek_term_pages(page_size: int = EXPORT_PAGE_SIZE):
+    """Fetch the first page up front, returning None when there are no terms"""
+    pages = iter_term_pages(page_size)
+    first_page = next(pages, None)
+    if first_page is None:
+        return None
+    return itertools.chain([first_page], pages)
+
+
+def term_from_row(row) -> dict:
+    """Shape an EXPORT_TERMS_QUERY row the way the exports present a term"""
+    uid, _, aliases, definitions, contexts = row
+
+    term = {'uid': uid, 'aliases': list(aliases)}
+    if definitions:
+        term['definition'] = definitions[0]
+
+    term['contexts'] = []
+    for context in contexts:
+        context_info = {'context': context['context']}
+        if context.get('context_description') is not None:
+            context_info['context_description'] = context['context_description']
+        term['contexts'].append(context_info)
+
+    return term
+
+
 def export_terms_as_csv(request):
     try:
-        # Check if there's any data to export
-        check_query = """
-        MATCH (n:NeoTerm) 
-        RETURN count(n) as count
-        """
-        result, _ = db.cypher_query(check_query)
-        
-        if result[0][0] == 0:
+        pages = peek_term_pages()
+        if pages is None:
             messages.error(request, "There is no data to export.")
             return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
 
-        query = """
-        MATCH (t:NeoTerm)
-        OPTIONAL MATCH (t)-[:POINTS_TO]->(d:NeoDefinition)
-        OPTIONAL MATCH (a:NeoAlias)-[:POINTS_TO]->(t)
-        OPTIONAL MATCH (c:NeoContext)-[:IS_A]->(t)
-        OPTIONAL MATCH (cd:NeoContextDescription)-[:RATIONALE]->(c)
-        WITH t, d, a, c, cd,
-             CASE WHEN c IS NOT NULL THEN c.context ELSE null END as context,
-             CASE WHEN cd IS NOT NULL THEN cd.context_description ELSE null END as context_desc
-        RETURN DISTINCT 
-            t.uid as uid,
-            t.lcvid as lcvid,
-            COLLECT(DISTINCT a.alias) as aliases,
-            COLLECT(DISTINCT d.definition) as definitions,
-            context,
-            context_desc
-        ORDER BY t.uid, context
-        """
-        
-        results, _ = db.cypher_query(query)
-        
-        output = StringIO()
-        writer = csv.writer(output, quoting=csv.QUOTE_ALL)
-        
-        headers = ['UID', 'Parent ID', 'Aliases', 'Definitions', 'Context', 'Context Description']
-        writer.writerow(headers)
-        
-        for row in results:
-            processed_row = [
-                str(row[0]) if row[0] is not None else '',  # uid
-                str(row[1]) if row[1] is not None else '',  # lcvid
-                '; '.join(filter(None, row[2])) if row[2] else '',  # aliases
-                '; '.join(filter(None, row[3])) if row[3] else '',  # definitions
-                str(row[4]) if row[4] is not None else '',  # context
-                str(row[5]) if row[5] is not None else '',  # context description
-            ]
-            writer.writerow(processed_row)
-        
-        response = HttpResponse(output.getvalue(), content_type='text/csv')
+        content = stream_terms_as_csv(pages)
+        gzipped = getattr(settings, 'EXPORT_CSV_GZIP', True) and \
+            accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if gzipped:
+            content = gzip_stream(content)
+
+        response = StreamingHttpResponse(content, content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="terms_export.csv"'
-        
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+
         return response
         
     except Exception as e:
@@ -72,46 +109,79 @@ def export_terms_as_csv(request):
         messages.error(request, f'Error exporting terms as CSV: {e}')
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
 
-def export_terms_as_json(request):
-    try:
-        neoterm_nodes = NeoTerm.nodes.all()
-        if not neoterm_nodes:
-            messages.error(request, "There is no data to export.")
-            return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
-        
-        data = []
-        
-        for neoterm in neoterm_nodes:
-            term = {}
+class Echo:
+    """A file-like object whose write returns the value, for csv.writer"""
+    def write(self, value):
+        return value
 
-            term['uid'] = neoterm.uid
-
-            aliases = neoterm.alias.all() 
-            term['aliases'] = [alias.alias for alias in aliases]
+def stream_terms_as_csv(pages):
+    """Write the exported terms one page at a time, one row per term context"""
+    try:
+        writer = csv.writer(Echo(), quoting=csv.QUOTE_ALL)
+        yield writer.writerow(['UID', 'Parent ID', 'Aliases', 'Definitions', 'Context', 'Context Description'])
 
-            definitions = neoterm.definition.all()
-            if definitions:
-                term['definition'] = definitions[0].definition
+        for page in pages:
+            chunk = []
+            for uid, lcvid, aliases, definitions, contexts in page:
+                contexts = sorted(contexts, key=lambda context: str(context['context'])) or [{}]
+                for context in contexts:
+                    chunk.append(writer.writerow([
+                        str(uid) if uid is not None else '',
+                        str(lcvid) if lcvid is not None else '',
+                        '; '.join(filter(None, aliases)),
+                        '; '.join(filter(None, definitions)),
+                        str(context['context']) if context.get('context') is not None else '',
+                        str(context['context_description']) if context.get('context_description') is not None else '',
+                    ]))
+            yield ''.join(chunk)
+    except Exception as e:
+        # the response has started, so the error can only be logged
+        logger.error(f'Error streaming terms as CSV: {e}')
+        raise
 
-            contexts = neoterm.context.all()
-            term['contexts'] = []
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows a gzip response, honouring
+    q-values so that gzip;q=0 refuses it.  A wildcard covers gzip unless
+    gzip is listed on its own.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
 
-            for context in contexts:
-                context_info = {
-                    'context': context.context 
-                }
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
 
-                context_description_nodes = context.context_description.all()
-                if context_description_nodes:
-                    context_info['context_description'] = context_description_nodes[0].context_description
-                
-                term['contexts'].append(context_info)
 
-            logger.info(term)
+def gzip_stream(chunks):
+    """Gzip a stream of text chunks without buffering the whole body"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
 
-            data.append(term)
+def export_terms_as_json(request):
+    try:
+        pages = peek_term_pages()
+        if pages is None:
+            messages.error(request, "There is no data to export.")
+            return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
 
-        response = JsonResponse(data, safe=False, json_dumps_params={'indent': 4})
+        response = StreamingHttpResponse(stream_terms_as_json(pages), content_type='application/json')
         response['Content-Disposition'] = 'attachment; filename="terms.json"'
         return response
 
@@ -120,85 +190,82 @@ def export_terms_as_json(request):
         messages.error(request, f'Error exporting terms as JSON: {e}')
         return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
 
+def stream_terms_as_json(pages):
+    """Encode the exported terms one page at a time, as an indented JSON list"""
+    try:
+        separator = '[\n'
+        for page in pages:
+            chunk = []
+            for row in page:
+                chunk.append(separator)
+                chunk.append(textwrap.indent(json.dumps(term_from_row(row), indent=4, cls=DjangoJSONEncoder), '    '))
+                separator = ',\n'
+            yield ''.join(chunk)
+        yield '\n]'
+    except Exception as e:
+        # the response has started, so the error can only be logged
+        logger.error(f'Error streaming terms as JSON: {e}')
+        raise
+
 def export_terms_as_xml(request):
         try:
-            neoterm_nodes = NeoTerm.nodes.all()
-            if not neoterm_nodes:
+            pages = peek_term_pages()
+            if pages is None:
                 messages.error(request, "There is no data to export.")
                 return HttpResponseRedirect(request.META.get('HTTP_REFERER', '.'))
-            data = []
-            
-            for neoterm in neoterm_nodes:
-                term = {}
-
-                term['uid'] = neoterm.uid
-
-                alaises = neoterm.alias.all()
-                term['aliases'] = [alias.alias for alias in alaises]
-                
-                definition = neoterm.definition.all()[0]
-
-                term['definition'] = definition.definition
 
-                contexts = neoterm.context.all()
-
-                term['contexts'] = []
-
-                for context in contexts:
-                    context_info = {
-                        'context': context.context,
-                    }
-                    context_description_node = context.context_description.all()[0]
-                    if context_description_node:
-                        context_info['context_description'] = context_description_node.context_description
-                    
-                    term['contexts'].append(context_info)
-                
-
-                logger.info(term)
-
-                data.append(term)
-
-            
-            xml_output = convert_to_xml(data)
-            if xml_output['error']:
-                messages.error(request, f'Error exporting terms as XML: {xml_output["error"]}')
-                return HttpResponseRedirect('.')
-            else:
-                response = HttpResponse(xml_output['xml_data'], content_type='application/xml')
-                response['Content-Disposition'] = 'attachment; filename="terms.xml"'
+            response = StreamingHttpResponse(stream_terms_as_xml(pages), content_type='application/xml')
+            response['Content-Disposition'] = 'attachment; filename="terms.xml"'
             return response
         except Exception as e:
             logger.error(f'Error exporting terms as XML: {e}')
             messages.error(request, f'Error exporting terms as XML: {e}')
             return HttpResponseRedirect('.')
 
-def convert_to_xml(data):
-    try:    
-        root = ET.Element("Terms")
-        
-        for term_data in data:
-            term_elem = ET.SubElement(root, "Term")
-            
-            for key, value in term_data.items():
-                if isinstance(value, list):
-                    list_elem = ET.SubElement(term_elem, key)
-                    for item in value:
-                        if isinstance(item, dict):
-                            item_elem = ET.SubElement(list_elem, key[:-1])
-                            for sub_key, sub_value in item.items():
-                                sub_elem = ET.SubElement(item_elem, sub_key)
-                                sub_elem.text = str(sub_value)
-                        else:
-                            item_elem = ET.SubElement(list_elem, "Alias")
-                            item_elem.text = str(item)
-                else:
-                    child_elem = ET.SubElement(term_elem, key)
-                    child_elem.text = str(value)
-        
-        # Generate the XML string
-        xml_data = ET.tostring(root, encoding='utf-8')
-        logger.info(f'XML data generated: {xml_data}')
-        return {'error': None, 'xml_data': xml_data}
+def stream_terms_as_xml(pages):
+    """Serialize the exported terms one page at a time as a Terms document"""
+    try:
+        output = StringIO()
+        xml = XMLGenerator(output, encoding='utf-8')
+
+        def element(name, text):
+            xml.startElement(name, {})
+            xml.characters(str(text))
+            xml.endElement(name)
+
+        xml.startDocument()
+        xml.startElement('Terms', {})
+        for page in pages:
+            for row in page:
+                term = term_from_row(row)
+                xml.startElement('Term', {})
+                element('uid', term['uid'])
+
+                xml.startElement('aliases', {})
+                for alias in term['aliases']:
+                    element('Alias', alias)
+                xml.endElement('aliases')
+
+                if 'definition' in term:
+                    element('definition', term['definition'])
+
+                xml.startElement('contexts', {})
+                for context in term['contexts']:
+                    xml.startElement('context', {})
+                    for key, value in context.items():
+                        element(key, value)
+                    xml.endElement('context')
+                xml.endElement('contexts')
+                xml.endElement('Term')
+
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+
+        xml.endElement('Terms')
+        xml.endDocument()
+        yield output.getvalue()
     except Exception as e:
-        return {'error': str(e)}
+        # the response has started, so the error can only be logged
+        logger.error(f'Error streaming terms as XML: {e}')
+        raise
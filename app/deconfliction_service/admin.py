@@ -3,6 +3,7 @@ from django.urls import path
 from django.db import models
 from django.shortcuts import redirect
 from . import views
+from .models import DeconflictionJob
 
 class Deconfliction(models.Model):
     class Meta:
@@ -50,4 +51,16 @@ class DeconflictionAdmin(admin.ModelAdmin):
         """Enable view permission to allow access to the custom view"""
         return True
 
-admin.site.register(Deconfliction, DeconflictionAdmin)
\ No newline at end of file
+admin.site.register(Deconfliction, DeconflictionAdmin)
+
+class DeconflictionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'created_by', 'created', 'finished')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('kind', 'status', 'payload', 'result', 'error', 'created_by', 'created', 'started',
+                       'heartbeat', 'attempts', 'finished')
+
+    def has_add_permission(self, request):
+        """Jobs are only queued by term creation and CSV uploads"""
+        return False
+
+admin.site.register(DeconflictionJob, DeconflictionJobAdmin)
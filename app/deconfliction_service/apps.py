@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DeconflictionServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'deconfliction_service'
+
+    def ready(self):
+        if getattr(settings, 'GRAPH_SCHEMA_BOOTSTRAP', False):
+            from deconfliction_service.schema import ensure_graph_schema
+            ensure_graph_schema()
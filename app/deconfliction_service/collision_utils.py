@@ -1,81 +1,125 @@
 from typing import List, Dict
 import logging
+
+import numpy as np
 from neomodel import db
-from core.models import NeoTerm, NeoDefinition, NeoAlias, NeoContext
-from .node_utils import find_similar_text_by_embedding, get_all_nodes
+
+from .schema import vector_index_score
 
 logger = logging.getLogger('dict_config_logger')
 
+LOAD_DEFINITIONS_QUERY = """
+MATCH (d:NeoDefinition)
+OPTIONAL MATCH (t:NeoTerm)-[:POINTS_TO]->(d)
+OPTIONAL MATCH (a:NeoAlias)-[:POINTS_TO]->(t)
+OPTIONAL MATCH (d)-[:VALID_IN]->(c:NeoContext)
+RETURN elementId(d), d.definition, d.embedding,
+       head(collect(DISTINCT t.uid)), head(collect(DISTINCT a.alias)), head(collect(DISTINCT c.context))
+"""
+
+MERGE_COLLISIONS_QUERY = """
+UNWIND $pairs AS pair
+MATCH (d1:NeoDefinition) WHERE elementId(d1) = pair.source
+MATCH (d2:NeoDefinition) WHERE elementId(d2) = pair.target
+MERGE (d1)-[r:IS_COLLIDING_WITH]-(d2)
+SET r.similarity = pair.similarity
+"""
+
+
 class CollisionDetector:
-    def __init__(self, similarity_threshold: float = 0.85):
+    def __init__(self, similarity_threshold: float = 0.85, top_k: int = 10,
+                 block_size: int = 1024, write_batch_size: int = 1000):
         self.similarity_threshold = similarity_threshold
-    
-    
+        self.top_k = top_k
+        self.block_size = block_size
+        self.write_batch_size = write_batch_size
+
     def find_collisions(self) -> List[Dict]:
         """Find all definition pairs that have similar embeddings"""
-        all_definitions = get_all_nodes(NeoDefinition)
+        definitions = self._load_definitions()
+        if len(definitions) < 2:
+            logger.info("Found 0 potential collisions")
+            return []
+
+        embeddings = np.asarray([definition['embedding'] for definition in definitions], dtype=np.float32)
+        pairs = self._similar_pairs(embeddings, [definition['definition'] for definition in definitions])
+
         collisions = []
-        
-        for def1 in all_definitions:
-            definition1, embedding1, term1_id, alias1, context1 = def1
-            
-            if embedding1 is None:
-                logger.warning(f"Definition '{definition1}' has no embedding, skipping")
-                continue
-                
-            similar_results = find_similar_text_by_embedding(
-                embedding1, 
-                'definition', 
-                'definitions',
-                top_k_results=10
-            )
-            
-            # Filter out self-matches and low similarity scores
-            for similar_def, score in similar_results:
-                if similar_def == definition1 or score < self.similarity_threshold:
-                    continue
-                
-                # Find the matching definition's information
-                for def2 in all_definitions:
-                    definition2, embedding2, term2_id, alias2, context2 = def2
-                    if definition2 == similar_def:
-                        collision = {
-                            'term1': {
-                                'id': term1_id,
-                                'alias': alias1,
-                                'definition': definition1,
-                                'context': context1
-                            },
-                            'term2': {
-                                'id': term2_id,
-                                'alias': alias2,
-                                'definition': definition2,
-                                'context': context2
-                            },
-                            'similarity_score': round(score, 3)
-                        }
-                        collisions.append(collision)
-                        
-                        # Create or update collision relationship
-                        self._create_collision_relationship(term1_id, term2_id, score)
-                        break
-        
+        for (i, j), score in pairs.items():
+            collisions.append({
+                'term1': self._describe(definitions[i]),
+                'term2': self._describe(definitions[j]),
+                'similarity_score': round(score, 3)
+            })
+
+        self._create_collision_relationships([
+            {'source': definitions[i]['element_id'], 'target': definitions[j]['element_id'], 'similarity': score}
+            for (i, j), score in pairs.items()
+        ])
+
         logger.info(f"Found {len(collisions)} potential collisions")
         return collisions
-    
-    def _create_collision_relationship(self, term1_id: str, term2_id: str, similarity: float):
-        """Create or update collision relationship between definitions"""
-        query = """
-        MATCH (t1:NeoTerm {uid: $term1_id})-[:POINTS_TO]->(d1:NeoDefinition)
-        MATCH (t2:NeoTerm {uid: $term2_id})-[:POINTS_TO]->(d2:NeoDefinition)
-        MERGE (d1)-[r:IS_COLLIDING_WITH]-(d2)
-        SET r.similarity = $similarity
-        """
-        try:
-            db.cypher_query(query, {
-                'term1_id': term1_id,
-                'term2_id': term2_id,
-                'similarity': similarity
+
+    def _load_definitions(self) -> List[Dict]:
+        """Load every definition with its embedding and metadata in one query"""
+        results, _ = db.cypher_query(LOAD_DEFINITIONS_QUERY)
+
+        definitions = []
+        for element_id, definition, embedding, term_id, alias, context in results:
+            if embedding is None:
+                logger.warning(f"Definition '{definition}' has no embedding, skipping")
+                continue
+            definitions.append({
+                'element_id': element_id,
+                'definition': definition,
+                'embedding': embedding,
+                'term_id': term_id,
+                'alias': alias,
+                'context': context,
             })
-        except Exception as e:
-            logger.error(f"Error creating collision relationship: {e}")
\ No newline at end of file
+        return definitions
+
+    def _similar_pairs(self, embeddings: np.ndarray, texts: List[str]) -> Dict:
+        """
+        Find the top-k neighbours of every embedding above the threshold.
+
+        Cosine similarities are computed in blocks of rows so memory stays
+        bounded, and scored on the vector index scale the threshold was
+        chosen for.  Each unordered pair is returned once, keyed by its
+        (lower, higher) row positions.
+        """
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+        k = min(self.top_k, len(embeddings) - 1)
+
+        pairs = {}
+        for start in range(0, len(embeddings), self.block_size):
+            scores = vector_index_score(embeddings[start:start + self.block_size] @ embeddings.T)
+            rows = np.arange(len(scores))
+            scores[rows, rows + start] = -np.inf
+
+            neighbours = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, columns in zip(rows, neighbours):
+                i = start + row
+                for j in columns:
+                    score = float(scores[row, j])
+                    if score < self.similarity_threshold or texts[i] == texts[j]:
+                        continue
+                    pairs[(min(i, j), max(i, j))] = score
+        return pairs
+
+    def _describe(self, definition: Dict) -> Dict:
+        return {
+            'id': definition['term_id'],
+            'alias': definition['alias'],
+            'definition': definition['definition'],
+            'context': definition['context']
+        }
+
+    def _create_collision_relationships(self, pairs: List[Dict]):
+        """Create or update collision relationships between definitions in batches"""
+        for start in range(0, len(pairs), self.write_batch_size):
+            try:
+                db.cypher_query(MERGE_COLLISIONS_QUERY, {'pairs': pairs[start:start + self.write_batch_size]})
+            except Exception as e:
+                logger.error(f"Error creating collision relationships: {e}")
@@ -0,0 +1,64 @@
+import logging
+
+logger = logging.getLogger('dict_config_logger')
+
+DEFAULT_EMBEDDING_BACKEND = 'torch'
+
+
+def load_torch(model_name: str):
+    """Full precision PyTorch model, the reference every backend is
+    compared against"""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device='cpu')
+
+
+def load_torch_int8(model_name: str):
+    """PyTorch model with its Linear layers dynamically quantized to int8,
+    weights are stored as int8 and activations quantized per batch"""
+    import torch
+
+    model = load_torch(model_name)
+    model.eval()
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8,
+                                               inplace=True)
+
+
+def load_onnx(model_name: str):
+    """ONNX Runtime CPU model, needs sentence-transformers 3.2 or later
+    and optimum[onnxruntime]"""
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name, device='cpu', backend='onnx')
+
+
+EMBEDDING_BACKENDS = {
+    'torch': load_torch,
+    'torch-int8': load_torch_int8,
+    'onnx': load_onnx,
+}
+
+
+def load_embedding_model(model_name: str, backend: str):
+    """
+    Load a sentence transformer with the given inference backend.
+
+    :param model_name: The sentence transformer to load.
+    :param backend: One of EMBEDDING_BACKENDS.
+    :return: A model exposing SentenceTransformer.encode.
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f'Unknown embedding backend {backend}, expected one of {sorted(EMBEDDING_BACKENDS)}')
+    return EMBEDDING_BACKENDS[backend](model_name)
+
+
+def embedding_model_id(model_name: str, backend: str) -> str:
+    """
+    Name the embeddings of a model and backend in the embedding cache.
+
+    fp32 torch keeps the bare model name so existing cache entries stay
+    valid, every other backend gets its own keys.
+    """
+    if backend == DEFAULT_EMBEDDING_BACKEND:
+        return model_name
+    return f'{model_name}/{backend}'
@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('dict_config_logger')
+
+DEFAULT_EMBEDDING_CACHE_SIZE = 10000
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so trivially different submissions share an embedding.
+
+    :param text: The text to normalize.
+    :return: NFC normalized text with surrounding whitespace stripped and
+        inner whitespace collapsed.
+    """
+    return _whitespace.sub(' ', unicodedata.normalize('NFC', str(text))).strip()
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    """
+    Build the cache key of a text encoded by the given model.
+
+    :param model_name: The sentence transformer the embedding came from.
+    :param text: The text that was encoded.
+    :return: A sha256 hex digest of the model name and normalized text.
+    """
+    return hashlib.sha256(f'{model_name}\0{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two tier cache of float32 embeddings.
+
+    The first tier is an in-process LRU, the second an optional SQLite file
+    shared by every worker on the host, so retries and re-imports never
+    encode the same definition twice.
+    """
+
+    def __init__(self, maxsize=None, path=None):
+        self.maxsize = maxsize if maxsize is not None else getattr(
+            settings, 'EMBEDDING_CACHE_SIZE', DEFAULT_EMBEDDING_CACHE_SIZE)
+        self.path = path if path is not None else getattr(settings, 'EMBEDDING_CACHE_PATH', None)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """
+        Look up embeddings, promoting disk hits into memory.
+
+        :param keys: The cache keys to look up.
+        :return: A dict of key to float32 vector for every key found.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.path:
+            from_disk = self._read_disk(missing)
+            with self._lock:
+                for key, vector in from_disk.items():
+                    self._remember(key, vector)
+            found.update(from_disk)
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def set_many(self, items):
+        """
+        Store embeddings in both tiers.
+
+        :param items: A dict of key to embedding.
+        """
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+        if vectors and self.path:
+            self._write_disk(vectors)
+
+    def clear(self):
+        """Empty the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'path': self.path,
+            }
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _get_connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)')
+        return self._connection
+
+    def _read_disk(self, keys):
+        found = {}
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = connection.execute(
+                        f'SELECT key, vector FROM embeddings WHERE key IN ({",".join("?" * len(chunk))})',
+                        chunk).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32).copy()
+        except sqlite3.Error as e:
+            logger.error(f'Could not read embedding cache {self.path}: {e}')
+        return found
+
+    def _write_disk(self, vectors):
+        try:
+            with self._lock:
+                connection = self._get_connection()
+                with connection:
+                    connection.executemany(
+                        'INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)',
+                        [(key, vector.tobytes()) for key, vector in vectors.items()])
+        except sqlite3.Error as e:
+            logger.error(f'Could not write embedding cache {self.path}: {e}')
+
+
+embedding_cache = EmbeddingCache()
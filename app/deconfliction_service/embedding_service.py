@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger('dict_config_logger')
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5
+
+
+class MicroBatchEncoder:
+    """
+    Funnel encode requests from every thread of a process through one
+    encoder thread.
+
+    Each text is queued with a Future.  The encoder thread takes the first
+    waiting text, keeps collecting until max_batch_size texts are queued or
+    max_wait has passed, and encodes them in one forward pass, so
+    concurrent single-sentence callers share batches instead of each
+    running the model on their own.  Only the encoder thread touches the
+    model.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = None,
+                 max_wait_ms: float = None):
+        self.encode = encode
+        self.max_batch_size = max_batch_size or getattr(
+            settings, 'EMBEDDING_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE)
+        if max_wait_ms is None:
+            max_wait_ms = getattr(settings, 'EMBEDDING_BATCH_MAX_WAIT_MS', DEFAULT_MAX_WAIT_MS)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.encoded = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def submit(self, text: str) -> Future:
+        """Queue one text and return a Future of its embedding"""
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts: List[str]) -> List[Future]:
+        requests = self._ensure_started()
+        futures = []
+        for text in texts:
+            future = Future()
+            requests.put((text, future))
+            futures.append(future)
+        return futures
+
+    def encode_many(self, texts: List[str]) -> np.ndarray:
+        """Encode texts through the shared batches and wait for the result"""
+        return np.stack([future.result() for future in self.submit_many(texts)])
+
+    def _ensure_started(self) -> queue.Queue:
+        # threads do not survive a fork, e.g. gunicorn --preload, so every
+        # process starts its own encoder thread on first use
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='embedding-encoder', daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self, requests: queue.Queue):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(requests.get(timeout=timeout) if timeout > 0 else requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            pending = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            texts = [text for text, _ in pending]
+            futures = [future for _, future in pending]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                logger.error(f'Error encoding a batch of {len(texts)} texts: {e}')
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.encoded += len(texts)
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+
+
+def service_authkey() -> bytes:
+    """Key the embedding service and its clients share, derived from the
+    Django secret so only processes of this deployment can connect"""
+    return hashlib.sha256(f'embedding-service\0{settings.SECRET_KEY}'.encode('utf-8')).digest()
+
+
+class EmbeddingServer:
+    """
+    Serve a MicroBatchEncoder to other processes over a local socket.
+
+    The run_embedding_service command runs one of these, so the gunicorn
+    workers and the deconfliction worker share a single copy of the model
+    and its batches instead of loading one each.  Every connection gets a
+    thread that hands its texts to the shared encoder.
+    """
+
+    def __init__(self, address: str, encoder: MicroBatchEncoder, authkey: bytes = None):
+        self.address = address
+        self.encoder = encoder
+        self.authkey = authkey or service_authkey()
+        self.listener = None
+
+    def start(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        # gunicorn drops to www-data, the authkey keeps other users out
+        os.chmod(self.address, 0o666)
+        return self
+
+    def serve_forever(self):
+        if self.listener is None:
+            self.start()
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError as e:
+                if self.listener is None:
+                    return
+                logger.error(f'Error accepting an embedding client: {e}')
+                continue
+            threading.Thread(target=self._serve, args=(connection,),
+                             name='embedding-client', daemon=True).start()
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.close()
+
+    def _serve(self, connection):
+        with connection:
+            while True:
+                try:
+                    texts = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.encoder.encode_many(texts)
+                except Exception as e:
+                    # not every exception pickles, send its text instead
+                    reply = RuntimeError(f'{type(e).__name__}: {e}')
+                connection.send(reply)
+
+
+class EmbeddingClient:
+    """
+    encode_many() through an EmbeddingServer.  Each thread keeps its own
+    connection and reconnects once when the service restarted.
+    """
+
+    def __init__(self, address: str, authkey: bytes = None, connect_timeout: float = 30):
+        self.address = address
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def encode_many(self, texts: List[str]) -> np.ndarray:
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.send(list(texts))
+                reply = connection.recv()
+                break
+            except (EOFError, OSError):
+                self._local.connection = None
+                if attempt:
+                    raise
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # a forked child must not share its parent's socket
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                connection = Client(self.address, family='AF_UNIX',
+                                    authkey=self.authkey or service_authkey())
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # the service may still be loading the model
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from deconfliction_service.schema import VECTOR_INDEXES
+from deconfliction_service.similarity_backends import IVFFlatBackend, get_backend
+
+
+class Command(BaseCommand):
+    """This command rebuilds the on-disk approximate nearest neighbour
+    index of every vector index from Neo4j"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', action='append', dest='indexes',
+                            help='Vector index to rebuild, defaults to all of them')
+        parser.add_argument('--if-needed', action='store_true',
+                            help='Only rebuild indexes whose delta outgrew them')
+
+    def handle(self, *args, **options):
+        backend = get_backend(IVFFlatBackend.name)
+
+        if options['if_needed']:
+            for index_name in backend.rebuild_if_needed(options['indexes']):
+                self.stdout.write(self.style.SUCCESS(f'Rebuilt similarity index {index_name}'))
+            return
+
+        for index_name in options['indexes'] or [name for name, _, _ in VECTOR_INDEXES]:
+            index = backend.rebuild(index_name)
+            self.stdout.write(self.style.SUCCESS(
+                f'Built similarity index {index_name} with {index.size} vectors'))
@@ -0,0 +1,132 @@
+import json
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from neomodel import db
+
+from deconfliction_service.embedding_backends import (DEFAULT_EMBEDDING_BACKEND,
+                                                     EMBEDDING_BACKENDS)
+from deconfliction_service.node_utils import encode_texts, is_collision, is_duplicate
+from deconfliction_service.schema import vector_index_score
+
+
+class Command(BaseCommand):
+    """
+    This command encodes the stored definitions with fp32 torch and with
+    other embedding backends and reports how far each backend drifts,
+    including how many deconfliction decisions it would change
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', dest='backends',
+                            choices=sorted(set(EMBEDDING_BACKENDS) - {DEFAULT_EMBEDDING_BACKEND}),
+                            help='Backend to compare, repeatable, all by default')
+        parser.add_argument('--limit', type=int, default=5000,
+                            help='Number of stored definitions to compare')
+        parser.add_argument('--batch-size', type=int, default=64)
+        parser.add_argument('--min-cosine', type=float,
+                            help='Fail when any definition drifts below this cosine')
+        parser.add_argument('--output', help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        results, _ = db.cypher_query(
+            'MATCH (d:NeoDefinition) WHERE d.definition IS NOT NULL '
+            'RETURN d.definition ORDER BY d.definition LIMIT $limit',
+            {'limit': options['limit']})
+        texts = [row[0] for row in results]
+        if len(texts) < 2:
+            raise CommandError('At least two stored definitions are needed to check parity')
+
+        reference = self.encode(texts, DEFAULT_EMBEDDING_BACKEND, options['batch_size'])
+        report = {'definitions': len(texts), 'reference': DEFAULT_EMBEDDING_BACKEND, 'backends': {}}
+        failed = []
+
+        for backend in options['backends'] or sorted(set(EMBEDDING_BACKENDS) - {DEFAULT_EMBEDDING_BACKEND}):
+            self.stderr.write(f'Encoding {len(texts)} definitions with {backend}...')
+            candidate = self.encode(texts, backend, options['batch_size'])
+            report['backends'][backend] = parity_report(reference, candidate)
+            if options['min_cosine'] is not None and \
+                    report['backends'][backend]['cosine']['min'] < options['min_cosine']:
+                failed.append(backend)
+
+        output = json.dumps(report, indent=4)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+            self.stderr.write(self.style.SUCCESS(f'Report written to {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+        if failed:
+            raise CommandError(f'Cosine below {options["min_cosine"]} for {", ".join(failed)}')
+
+    def encode(self, texts, backend, batch_size):
+        return np.concatenate([encode_texts(texts[start:start + batch_size], backend)
+                               for start in range(0, len(texts), batch_size)])
+
+
+def deconfliction_status(score):
+    """The status evaluate_deconfliction_status gives a best match score"""
+    if is_duplicate(score):
+        return 'duplicate'
+    if is_collision(score):
+        return 'collision'
+    return 'unique'
+
+
+def normalized(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def parity_report(reference, candidate, block_size=1024):
+    """
+    Compare the embeddings of one backend with the fp32 reference.
+
+    The nearest neighbour of every definition among the other definitions
+    is scored twice on the vector index scale, once querying with its
+    reference vector and once with the candidate vector, both against the
+    reference vectors the graph already stores, and classified with the
+    evaluate_deconfliction_status thresholds.  A status change means the
+    backend would have decided that definition differently.
+
+    :param reference: fp32 torch embeddings, one row per definition.
+    :param candidate: The same definitions encoded by another backend.
+    :param block_size: Number of rows compared per matrix multiply.
+    :return: A JSON ready dict of drift statistics.
+    """
+    reference = normalized(reference)
+    candidate = normalized(candidate)
+    cosine = np.sum(reference * candidate, axis=1)
+
+    score_drift = []
+    changed = 0
+    for start in range(0, len(reference), block_size):
+        rows = slice(start, min(start + block_size, len(reference)))
+        positions = np.arange(rows.start, rows.stop)
+        expected = reference[rows] @ reference.T
+        actual = candidate[rows] @ reference.T
+        expected[positions - start, positions] = -1
+        actual[positions - start, positions] = -1
+
+        for before, after in zip(vector_index_score(expected.max(axis=1)),
+                                 vector_index_score(actual.max(axis=1))):
+            score_drift.append(abs(float(after) - float(before)))
+            if deconfliction_status(before) != deconfliction_status(after):
+                changed += 1
+
+    return {
+        'cosine': {
+            'min': round(float(cosine.min()), 6),
+            'mean': round(float(cosine.mean()), 6),
+            'p01': round(float(np.percentile(cosine, 1)), 6),
+        },
+        'nearest_score_drift': {
+            'mean': round(float(np.mean(score_drift)), 6),
+            'max': round(float(np.max(score_drift)), 6),
+        },
+        'status_changes': changed,
+        # a resubmitted definition must still match its stored fp32 self
+        'self_duplicates': int(sum(is_duplicate(score) for score in vector_index_score(cosine))),
+    }
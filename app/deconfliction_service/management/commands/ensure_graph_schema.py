@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from deconfliction_service.schema import ensure_graph_schema, schema_statements
+
+
+class Command(BaseCommand):
+    """This command creates the Neo4j indexes and constraints used by the
+    deconfliction and UID write paths"""
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Ensuring {len(schema_statements())} graph schema statements...')
+
+        if ensure_graph_schema(force=True):
+            self.stdout.write(self.style.SUCCESS('Graph schema ready'))
+        else:
+            self.stdout.write(self.style.WARNING('Graph schema ensured with errors, see the log'))
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from deconfliction_service.models import DeconflictionJob
+from deconfliction_service.similarity_backends import IVFFlatBackend, get_backend
+
+
+class Command(BaseCommand):
+    """This command runs queued deconfliction jobs until it is stopped"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Waiting for deconfliction jobs...')
+
+        while True:
+            # the worker outlives any single request, drop stale connections
+            close_old_connections()
+            job = DeconflictionJob.claim_next()
+
+            if job is None:
+                # fold large similarity index deltas in while idle
+                self.rebuild_similarity_indexes()
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            job.run()
+            style = self.style.SUCCESS if job.status == DeconflictionJob.STATUS_SUCCEEDED \
+                else self.style.ERROR
+            self.stdout.write(style(str(job)))
+
+    def rebuild_similarity_indexes(self):
+        if getattr(settings, 'DECONFLICTION_SIMILARITY_BACKEND', None) != IVFFlatBackend.name:
+            return
+        try:
+            for index_name in get_backend(IVFFlatBackend.name).rebuild_if_needed():
+                self.stdout.write(self.style.SUCCESS(f'Rebuilt similarity index {index_name}'))
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'Could not rebuild the similarity indexes: {e}'))
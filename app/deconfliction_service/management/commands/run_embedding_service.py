@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from deconfliction_service.embedding_service import EmbeddingServer, MicroBatchEncoder
+from deconfliction_service.node_utils import encode_texts, get_model
+
+
+class Command(BaseCommand):
+    """This command loads the embedding model once and serves it to the
+    web and deconfliction workers over EMBEDDING_SERVICE_SOCKET"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help='Socket path, EMBEDDING_SERVICE_SOCKET by default')
+
+    def handle(self, *args, **options):
+        address = options['socket'] or settings.EMBEDDING_SERVICE_SOCKET
+        if not address:
+            raise CommandError('Set EMBEDDING_SERVICE_SOCKET or pass --socket')
+
+        # listen first, clients queue on the socket while the model loads
+        server = EmbeddingServer(address, MicroBatchEncoder(encode_texts)).start()
+        get_model()
+        self.stdout.write(f'Serving embeddings on {address}')
+        try:
+            server.serve_forever()
+        finally:
+            server.close()
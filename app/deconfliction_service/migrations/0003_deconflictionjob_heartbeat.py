@@ -0,0 +1,23 @@
+# Generated by Django 3.2.20 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deconfliction_service', '0002_deconflictionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deconflictionjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deconflictionjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
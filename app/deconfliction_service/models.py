@@ -1,3 +1,169 @@
-from django.db import models
+import logging
+import threading
+from datetime import timedelta
 
-# Create your models here.
+import pandas as pd
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger('dict_config_logger')
+
+
+class DeconflictionJob(models.Model):
+    """
+    Model for queued term creation work.
+
+    Admin saves and CSV uploads store their input here and return right
+    away; the run_deconfliction_worker command claims queued jobs with a
+    conditional update, so several workers can share the queue on any
+    database, and records the outcome of every row.  A running job's
+    heartbeat is refreshed while it runs; jobs whose worker died are
+    requeued on the next claim, and failed after MAX_ATTEMPTS.
+    """
+    KIND_TERM = 'term'
+    KIND_CSV_IMPORT = 'csv_import'
+    KIND_CHOICES = [(KIND_TERM, 'term'),
+                    (KIND_CSV_IMPORT, 'csv import')]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [(STATUS_QUEUED, 'queued'),
+                      (STATUS_RUNNING, 'running'),
+                      (STATUS_SUCCEEDED, 'succeeded'),
+                      (STATUS_FAILED, 'failed')]
+
+    MAX_ATTEMPTS = 3
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    status = models.CharField(max_length=32, choices=STATUS_CHOICES,
+                              default=STATUS_QUEUED, db_index=True)
+    payload = models.JSONField()
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True,
+        blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f'{self.get_kind_display()} job {self.pk} ({self.status})'
+
+    @classmethod
+    def enqueue_term(cls, definition, context, context_description,
+                     alias=None, user=None) -> 'DeconflictionJob':
+        """Queue the creation of one term"""
+        return cls.objects.create(kind=cls.KIND_TERM, created_by=user, payload={
+            'definition': definition,
+            'context': context,
+            'context_description': context_description,
+            'alias': alias or None,
+        })
+
+    @classmethod
+    def enqueue_csv_import(cls, df: pd.DataFrame, user=None) -> 'DeconflictionJob':
+        """Queue the import of a validated CSV upload"""
+        columns = df.astype(object).where(df.notna(), None).to_dict(orient='list')
+        return cls.objects.create(kind=cls.KIND_CSV_IMPORT, created_by=user,
+                                  payload={'columns': columns})
+
+    @classmethod
+    def claim_next(cls) -> 'DeconflictionJob':
+        """Mark the oldest queued job as running and return it, or None"""
+        cls.reclaim_stale()
+        while True:
+            candidate = cls.objects.filter(status=cls.STATUS_QUEUED). \
+                order_by('id').values_list('pk', flat=True).first()
+            if candidate is None:
+                return None
+            # only one worker sees the job still queued, MySQL 5.7 has no
+            # SKIP LOCKED for a locking read
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=candidate, status=cls.STATUS_QUEUED).update(
+                status=cls.STATUS_RUNNING, started=now, heartbeat=now, attempts=F('attempts') + 1)
+            if claimed:
+                return cls.objects.get(pk=candidate)
+
+    @classmethod
+    def reclaim_stale(cls):
+        """Requeue running jobs whose worker stopped sending heartbeats,
+        or fail them once they used up their attempts"""
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=settings.DECONFLICTION_JOB_STALE_SECONDS)
+        stale = cls.objects.filter(Q(heartbeat__lt=cutoff) | Q(heartbeat__isnull=True, started__lt=cutoff),
+                                   status=cls.STATUS_RUNNING)
+
+        failed = stale.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status=cls.STATUS_FAILED, finished=now,
+            error=f'The worker stopped while running this job {cls.MAX_ATTEMPTS} times')
+        requeued = stale.update(status=cls.STATUS_QUEUED, started=None, heartbeat=None)
+        if failed or requeued:
+            logger.warning(f'Requeued {requeued} and failed {failed} stale deconfliction jobs')
+        return requeued, failed
+
+    def run(self):
+        """Run a claimed job and store its outcome"""
+        stop = threading.Event()
+        beat = threading.Thread(target=self.send_heartbeats, args=(stop,),
+                                name=f'deconfliction-job-{self.pk}', daemon=True)
+        beat.start()
+        try:
+            self.run_and_record()
+        finally:
+            stop.set()
+            beat.join()
+        return self
+
+    def run_and_record(self):
+        try:
+            if self.kind == self.KIND_TERM:
+                self.result = [job_result_row(self.run_term())]
+            elif self.kind == self.KIND_CSV_IMPORT:
+                self.result = [job_result_row(row) for row in self.run_csv_import()]
+            else:
+                raise ValueError(f'Unknown job kind {self.kind}')
+            self.status = self.STATUS_SUCCEEDED
+        except Exception as e:
+            logger.error(f'Deconfliction job {self.pk} failed: {e}')
+            self.status = self.STATUS_FAILED
+            self.error = str(e)
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'result', 'error', 'finished'])
+
+    def send_heartbeats(self, stop: threading.Event):
+        """Show the job is alive until stop is set"""
+        try:
+            while not stop.wait(settings.DECONFLICTION_JOB_HEARTBEAT_SECONDS):
+                DeconflictionJob.objects.filter(pk=self.pk, status=self.STATUS_RUNNING). \
+                    update(heartbeat=timezone.now())
+        except Exception as e:
+            logger.error(f'Error sending the heartbeat of deconfliction job {self.pk}: {e}')
+        finally:
+            # the thread opened its own connection
+            connection.close()
+
+    def run_term(self):
+        from core.utils import run_node_creation
+
+        return run_node_creation(**self.payload)
+
+    def run_csv_import(self):
+        from core.term_import import import_terms_from_data_frame
+
+        return import_terms_from_data_frame(pd.DataFrame(self.payload['columns']))
+
+
+def job_result_row(row):
+    """Make a run_node_creation or import report row JSON safe"""
+    return {key: float(value) if key == 'score' and value is not None else value
+            for key, value in row.items()}
@@ -1,19 +1,65 @@
+import threading
+import time
 from typing import Type, Any
+from django.conf import settings
 from django_neomodel import DjangoNode
 from neomodel import db
 import numpy as np
-import torch
-from sentence_transformers import SentenceTransformer, util
 import logging
 from core.constants import MODEL_VECTOR_DIMENSION
+from deconfliction_service.embedding_backends import (DEFAULT_EMBEDDING_BACKEND,
+                                                     embedding_model_id,
+                                                     load_embedding_model)
+from deconfliction_service.embedding_cache import (embedding_cache,
+                                                  embedding_key,
+                                                  normalize_text)
+from deconfliction_service.embedding_service import EmbeddingClient, MicroBatchEncoder
+from deconfliction_service.similarity_backends import get_backend
+from deconfliction_service.schema import (vector_index_score,
+                                          vector_index_statement)
 
 logger = logging.getLogger('dict_config_logger')
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+_models = {}
+_model_lock = threading.Lock()
 
 #model = SentenceTransformer('all-mpnet-base-v2')
 
 
+def get_embedding_backend() -> str:
+    """Name of the inference backend set by EMBEDDING_BACKEND"""
+    return getattr(settings, 'EMBEDDING_BACKEND', DEFAULT_EMBEDDING_BACKEND)
+
+
+def get_model(backend: str = None):
+    """
+    Return the sentence embedding model, loading it on first use.
+
+    torch and sentence_transformers are only imported here, so processes
+    that never encode, e.g. migrate or the test runner, do not pay for
+    them.  Set EMBEDDING_PRELOAD to load the model when a web worker
+    starts instead of on its first request.
+
+    :param backend: The inference backend, by default EMBEDDING_BACKEND.
+    """
+    backend = backend or get_embedding_backend()
+
+    if backend not in _models:
+        with _model_lock:
+            if backend not in _models:
+                started = time.perf_counter()
+                import torch
+
+                if getattr(settings, 'EMBEDDING_TORCH_THREADS', 0):
+                    torch.set_num_threads(settings.EMBEDDING_TORCH_THREADS)
+                _models[backend] = load_embedding_model(MODEL_NAME, backend)
+                logger.info(f'Loaded embedding model {MODEL_NAME} ({backend}) in '
+                            f'{time.perf_counter() - started:.2f}s')
+    return _models[backend]
+
+
 def is_any_node_present(node_class: Type[DjangoNode], **filters: Any) -> bool:
     """
     Check if any instance of node_class exists with the given filters.
@@ -30,10 +76,47 @@ def generate_embedding(text: str) -> list:
     Generate a sentence embedding for the given text.
 
     :param text: The text to generate an embedding for.
-    :return: The sentence embedding as a numpy array.
+    :return: The sentence embedding as a list of floats.
+    """
+    return generate_embeddings([text])[0].tolist()
+
+def encode_texts(texts: list, backend: str = None) -> np.ndarray:
+    """Run the model over one batch of texts"""
+    encoded = get_model(backend).encode(texts, batch_size=len(texts), convert_to_numpy=True)
+    return np.asarray(encoded, dtype=np.float32)
+
+# with EMBEDDING_SERVICE_SOCKET set every process sends its texts to the one
+# model run_embedding_service loaded, otherwise each loads its own
+encoder = EmbeddingClient(settings.EMBEDDING_SERVICE_SOCKET) \
+    if getattr(settings, 'EMBEDDING_SERVICE_SOCKET', None) else MicroBatchEncoder(encode_texts)
+
+def generate_embeddings(texts: list) -> np.ndarray:
     """
-    logger.info(len(model.encode(text).tolist()))
-    return model.encode(text).tolist()
+    Generate sentence embeddings for many texts, encoding only the texts
+    missing from the embedding cache.  Misses go through the shared
+    micro-batching encoder, so concurrent callers share forward passes.
+
+    :param texts: The texts to generate embeddings for.
+    :return: A float32 numpy array with one row per text.
+    """
+    if len(texts) == 0:
+        return np.zeros((0, MODEL_VECTOR_DIMENSION), dtype=np.float32)
+
+    model_id = embedding_model_id(MODEL_NAME, get_embedding_backend())
+    keys = [embedding_key(model_id, text) for text in texts]
+    cached = embedding_cache.get_many(keys)
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = normalize_text(text)
+
+    if missing:
+        encoded = dict(zip(missing.keys(), encoder.encode_many(list(missing.values()))))
+        embedding_cache.set_many(encoded)
+        cached.update(encoded)
+
+    return np.stack([cached[key] for key in keys]).astype(np.float32, copy=False)
 
 def get_terms_with_multiple_definitions():
     cypher_query = """
@@ -64,35 +147,38 @@ def show_current_vector_indeces():
 
 def create_vector_index(index_name, node_name, embedding_field_name='embedding'):
     try:
-        cypher_query = f"""
-        CREATE VECTOR INDEX `{index_name}` IF NOT EXISTS
-        FOR (n:{node_name})
-        ON (n.{embedding_field_name})
-        OPTIONS {{
-            indexConfig: {{
-                `vector.dimensions`: {MODEL_VECTOR_DIMENSION},
-                `vector.similarity_function`: 'cosine'
-            }}
-        }}
-        """
-
-        results, _ = db.cypher_query(cypher_query)
+        results, _ = db.cypher_query(vector_index_statement(index_name, node_name, embedding_field_name))
         show_current_vector_indeces()
     except Exception as e:
         logger.error(f'Error creating vector index: {e}')
         raise e
 
 def find_similar_text_by_embedding(input_embedding, return_field_name, index_name, top_k_results=10):
+    results = get_backend().search([input_embedding], return_field_name, index_name, top_k_results)[0]
+    logger.info(f"Similarity results successful. Most similar items: {results}")
+    return results
 
-    cypher_query = f"""
-        CALL db.index.vector.queryNodes('{index_name}', {top_k_results}, {input_embedding})
-        YIELD node, score
-        RETURN node.{return_field_name}, score
+def find_similar_texts_by_embeddings(input_embeddings, return_field_name, index_name, top_k_results=10):
     """
+    Batched counterpart of find_similar_text_by_embedding.
 
-    results, _ = db.cypher_query(cypher_query)
-    logger.info(f"Similarity results successful. Most similar items: {results}")
-    return results
+    :return: A list with the (text, score) results for each input embedding,
+             in input order.
+    """
+    similar_texts = get_backend().search(input_embeddings, return_field_name, index_name, top_k_results)
+    logger.info(f"Batched similarity results successful for {len(input_embeddings)} embeddings.")
+    return similar_texts
+
+def add_to_similarity_index(index_name, texts, embeddings):
+    """
+    Make newly created nodes searchable by similarity backends that keep
+    their own index.  A failure is logged rather than raised, the node
+    itself was written and a rebuild picks it up.
+    """
+    try:
+        get_backend().add(index_name, texts, embeddings)
+    except Exception as e:
+        logger.error(f'Error adding {len(texts)} items to similarity index {index_name}: {e}')
 
 def find_similar_text_by_node_field(node_name, field_name, return_field_name, index_name, top_k_results=6):
     cypher_query = f"""
@@ -138,6 +224,47 @@ def evaluate_deconfliction_status(similarity_results):
     else:
         return 'unique', None, None
     
+def deconflict_within_batch(embeddings, texts, similarity_results, block_size=1024):
+    """
+    Classify a batch of new definitions against the vector index and against
+    each other.  Row i is compared with every earlier row that creates a
+    definition (unique or collision), which is what the vector index would
+    have returned had the rows been written one at a time.  Cosine
+    similarities are computed block by block with matrix multiplies so
+    memory stays bounded for large uploads, and scored the way the vector
+    index scores them.
+
+    :param embeddings: Array with one embedding per row.
+    :param texts: The definition text of each row.
+    :param similarity_results: The (text, score) vector index results of each row.
+    :param block_size: Number of rows compared per matrix multiply.
+    :return: A (status, most_similar_text, highest_score) tuple per row.
+    """
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+
+    creates_definition = np.zeros(len(vectors), dtype=bool)
+    classifications = []
+
+    for start in range(0, len(vectors), block_size):
+        end = min(start + block_size, len(vectors))
+        block_scores = vector_index_score(vectors[start:end] @ vectors[:end].T)
+
+        for i in range(start, end):
+            candidates = list(similarity_results[i])
+
+            scores = np.where(creates_definition[:i], block_scores[i - start, :i], -np.inf)
+            if i > 0 and np.isfinite(scores.max()):
+                j = int(scores.argmax())
+                candidates.append((texts[j], float(scores[j])))
+
+            status, most_similar_text, highest_score = evaluate_deconfliction_status(candidates)
+            creates_definition[i] = status in ('unique', 'collision')
+            classifications.append((status, most_similar_text, highest_score))
+
+    return classifications
+
 def is_duplicate(similarity_score: float):
     return similarity_score >= 0.9
 
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from neomodel import db
+
+from core.constants import MODEL_VECTOR_DIMENSION
+
+logger = logging.getLogger('dict_config_logger')
+
+VECTOR_INDEXES = [
+    # (index name, node label, embedding property)
+    ('definitions', 'NeoDefinition', 'embedding'),
+]
+
+UNIQUE_CONSTRAINTS = [
+    ('NeoTerm', 'uid'),
+    ('NeoTerm', 'uid_chain'),
+    ('NeoAlias', 'alias'),
+    ('NeoContext', 'context'),
+]
+
+PROPERTY_INDEXES = [
+    ('UIDCounter', 'owner_uid'),
+    ('UIDNode', 'uid'),
+    ('Provider', 'name'),
+    ('NeoDefinition', 'definition'),
+]
+
+# errors that say nothing about the statement itself, worth retrying later
+RETRYABLE_ERRORS = (ServiceUnavailable, SessionExpired, TransientError, ConnectionError)
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 600
+
+_lock = threading.Lock()
+_schema_ready = False
+# statements that succeeded or failed for good, and why the latter failed
+_completed = set()
+_failed = {}
+_retry_at = 0
+_retry_delay = RETRY_DELAY
+
+
+def vector_index_statement(index_name, node_name, embedding_field_name='embedding'):
+    return f"""
+    CREATE VECTOR INDEX `{index_name}` IF NOT EXISTS
+    FOR (n:{node_name})
+    ON (n.{embedding_field_name})
+    OPTIONS {{
+        indexConfig: {{
+            `vector.dimensions`: {MODEL_VECTOR_DIMENSION},
+            `vector.similarity_function`: 'cosine'
+        }}
+    }}
+    """
+
+
+def vector_index_score(cosine_similarity):
+    """
+    Convert a cosine similarity to the score a cosine vector index reports,
+    (1 + cosine) / 2, which is the scale the deconfliction thresholds use.
+    """
+    return (1 + cosine_similarity) / 2
+
+
+def schema_statements():
+    """
+    List the DDL needed by the write paths.  Names follow neomodel's
+    install_labels convention so the statements are no-ops on databases
+    that were already set up with it.
+    """
+    statements = [vector_index_statement(*index) for index in VECTOR_INDEXES]
+    statements += [
+        f'CREATE CONSTRAINT constraint_unique_{label}_{prop} IF NOT EXISTS '
+        f'FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE'
+        for label, prop in UNIQUE_CONSTRAINTS
+    ]
+    statements += [
+        f'CREATE INDEX index_{label}_{prop} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})'
+        for label, prop in PROPERTY_INDEXES
+    ]
+    return statements
+
+
+def ensure_graph_schema(force: bool = False) -> bool:
+    """
+    Make sure every index and constraint the graph relies on exists.
+
+    Each statement is issued until it completes once in this process.  A
+    statement rejected by the database, e.g. a uniqueness constraint over
+    existing duplicates, is logged once and not retried; one that failed
+    because Neo4j was unreachable is retried by a later caller, with a
+    growing delay, so the write path never re-issues DDL on every call.
+
+    :param force: Issue every statement again, e.g. after fixing the data.
+    :return: True if every statement succeeded.
+    """
+    global _schema_ready, _retry_at, _retry_delay
+
+    if not force and (_schema_ready or time.monotonic() < _retry_at):
+        return _schema_ready and not _failed
+
+    with _lock:
+        if not force and (_schema_ready or time.monotonic() < _retry_at):
+            return _schema_ready and not _failed
+        if force:
+            _completed.clear()
+            _failed.clear()
+
+        pending = False
+        for statement in schema_statements():
+            if statement in _completed:
+                continue
+            try:
+                db.cypher_query(statement)
+            except RETRYABLE_ERRORS as e:
+                logger.warning(f'Graph schema statement will be retried, {statement.strip()}: {e}')
+                pending = True
+                continue
+            except Exception as e:
+                # an existing conflicting index or duplicate data must not
+                # stop the rest of the schema from being created
+                logger.error(f'Error ensuring graph schema with {statement.strip()}: {e}')
+                _failed[statement] = str(e)
+            _completed.add(statement)
+
+        if pending:
+            _retry_at = time.monotonic() + _retry_delay
+            _retry_delay = min(_retry_delay * 2, MAX_RETRY_DELAY)
+        else:
+            _retry_at, _retry_delay = 0, RETRY_DELAY
+        _schema_ready = not pending
+
+        succeeded = not pending and not _failed
+        logger.info('Graph schema ensured' if succeeded else 'Graph schema ensured with errors')
+        return succeeded
+
+
+def reset_graph_schema_state():
+    """Forget that the schema was ensured in this process"""
+    global _schema_ready, _retry_at, _retry_delay
+    with _lock:
+        _schema_ready = False
+        _completed.clear()
+        _failed.clear()
+        _retry_at, _retry_delay = 0, RETRY_DELAY
@@ -0,0 +1,457 @@
+import abc
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+from neomodel import db
+
+from core.constants import MODEL_VECTOR_DIMENSION
+from deconfliction_service.schema import VECTOR_INDEXES, vector_index_score
+
+logger = logging.getLogger('dict_config_logger')
+
+DEFAULT_BACKEND = 'neo4j'
+
+# byte length of the utf-8 text that precedes each delta vector
+DELTA_HEADER = struct.Struct('<I')
+
+
+class SimilarityBackend(abc.ABC):
+    """
+    Interface of the nearest neighbour search behind deconfliction.
+
+    Scores are reported on the vector index scale, (1 + cosine) / 2, so the
+    deconfliction thresholds apply to every backend alike.
+    """
+    name = None
+
+    @abc.abstractmethod
+    def search(self, embeddings, return_field_name: str, index_name: str,
+               top_k_results: int = 10) -> List[List[Tuple[str, float]]]:
+        """
+        :return: A list with the (text, score) results for each embedding,
+                 in input order.
+        """
+
+    @abc.abstractmethod
+    def add(self, index_name: str, texts: List[str], embeddings):
+        """Make newly created nodes searchable, if the backend needs it"""
+
+
+class Neo4jVectorBackend(SimilarityBackend):
+    """Query the Neo4j vector index with one UNWIND statement per batch"""
+    name = 'neo4j'
+
+    def __init__(self, batch_size: int = 256):
+        self.batch_size = batch_size
+
+    def search(self, embeddings, return_field_name, index_name, top_k_results=10):
+        cypher_query = f"""
+            UNWIND $items AS item
+            CALL db.index.vector.queryNodes($index_name, $top_k, item.embedding)
+            YIELD node, score
+            RETURN item.position, node.{return_field_name}, score
+        """
+
+        similar_texts = [[] for _ in range(len(embeddings))]
+        for start in range(0, len(embeddings), self.batch_size):
+            items = [
+                {'position': position, 'embedding': [float(value) for value in embeddings[position]]}
+                for position in range(start, min(start + self.batch_size, len(embeddings)))
+            ]
+            results, _ = db.cypher_query(cypher_query, {
+                'items': items,
+                'index_name': index_name,
+                'top_k': top_k_results,
+            })
+            for position, text, score in results:
+                similar_texts[position].append((text, score))
+        return similar_texts
+
+    def add(self, index_name, texts, embeddings):
+        # Neo4j indexes the embedding when the node is written
+        pass
+
+
+class IVFFlatIndex:
+    """
+    Inverted file index over normalized float32 vectors.
+
+    Vectors are clustered with spherical k-means and stored grouped by
+    cluster, so a search only scans the nprobe clusters closest to the
+    query.  The base arrays are saved as .npy files and memory-mapped on
+    load; vectors added afterwards go to an append-only delta that is
+    scanned exhaustively until the next rebuild folds it in.
+
+    Every process serving deconfliction shares the directory.  Writers
+    hold an exclusive flock on the lock file, readers a shared one; each
+    delta record carries its text and vector together, and meta.json
+    holds a generation that build() bumps, so refresh() either reads the
+    records other processes appended or reloads after a rebuild.  A
+    needs_rebuild file asks the worker to fold a large delta in, so no
+    request pays for a rebuild.
+    """
+
+    def __init__(self, directory: str, nprobe: int = 8):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.meta = {}
+        self.centroids = None
+        self.offsets = None
+        self.vectors = None
+        self.texts = []
+        self.delta_vectors = []
+        self.delta_texts = []
+        self.delta_offset = 0
+        self.meta_stamp = None
+        self._lock_file = None
+
+    @property
+    def size(self):
+        return len(self.texts) + len(self.delta_texts)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path('meta.json'))
+
+    @property
+    def needs_rebuild(self):
+        return os.path.exists(self._path('needs_rebuild'))
+
+    def request_rebuild(self):
+        """Flag the index for the next build_similarity_index run"""
+        open(self._path('needs_rebuild'), 'a').close()
+
+    @contextmanager
+    def locked(self, exclusive: bool = False):
+        """Hold the inter-process lock of the index directory.  Nested
+        calls reuse the lock already held by this instance."""
+        if self._lock_file is not None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(self._path('lock'), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def build(self, texts: List[str], embeddings, return_field_name: str, iterations: int = 10):
+        """Cluster the vectors and write a fresh index to disk"""
+        if len(texts) == 0:
+            vectors = np.zeros((0, MODEL_VECTOR_DIMENSION), dtype=np.float32)
+        else:
+            vectors = normalize(embeddings)
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        centroids, assignments = spherical_kmeans(vectors, nlist, iterations)
+
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=nlist)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        with self.locked(exclusive=True):
+            generation = self._read_meta().get('generation', 0) + 1 if self.exists() else 1
+            self._write_array('centroids.npy', centroids)
+            self._write_array('offsets.npy', offsets)
+            self._write_array('vectors.npy', vectors[order])
+            self._write_json('texts.json', [texts[position] for position in order])
+            # readers wait on the lock, so nobody is reading the delta now
+            open(self._path('delta.bin'), 'wb').close()
+            self._write_json('meta.json', {
+                'return_field_name': return_field_name,
+                'dimension': int(vectors.shape[1]),
+                'count': len(vectors),
+                'nlist': nlist,
+                'generation': generation,
+            })
+            if self.needs_rebuild:
+                os.remove(self._path('needs_rebuild'))
+            self.load()
+
+    def load(self):
+        with self.locked():
+            self.meta = self._read_meta()
+            # an empty array cannot be memory-mapped
+            mmap_mode = 'r' if self.meta['count'] else None
+            self.centroids = np.load(self._path('centroids.npy'), mmap_mode=mmap_mode)
+            self.offsets = np.load(self._path('offsets.npy'))
+            self.vectors = np.load(self._path('vectors.npy'), mmap_mode=mmap_mode)
+            with open(self._path('texts.json')) as texts_file:
+                self.texts = json.load(texts_file)
+            self.meta_stamp = meta_stamp(self._path('meta.json'))
+
+            self.delta_vectors, self.delta_texts, self.delta_offset = [], [], 0
+            self._read_delta()
+
+    def refresh(self):
+        """Pick up what other processes appended or rebuilt since the last
+        load"""
+        with self.locked():
+            if meta_stamp(self._path('meta.json')) != self.meta_stamp and \
+                    self._read_meta().get('generation') != self.meta.get('generation'):
+                self.load()
+            else:
+                self._read_delta()
+
+    def add(self, texts: List[str], embeddings):
+        vectors = normalize(embeddings)
+        with self.locked(exclusive=True):
+            self.refresh()
+            # one record per vector: text length, utf-8 text, float32 vector
+            records = b''.join(
+                DELTA_HEADER.pack(len(encoded)) + encoded + vector.tobytes()
+                for encoded, vector in zip((str(text).encode('utf-8') for text in texts), vectors))
+            with open(self._path('delta.bin'), 'ab') as delta_file:
+                # drop a torn tail so the new records start on a boundary
+                delta_file.truncate(self.delta_offset)
+                delta_file.write(records)
+            self._read_delta()
+
+    def _read_meta(self):
+        with open(self._path('meta.json')) as meta_file:
+            return json.load(meta_file)
+
+    def _read_delta(self):
+        """Read the delta records past the ones already loaded"""
+        path = self._path('delta.bin')
+        if not os.path.exists(path) or os.path.getsize(path) <= self.delta_offset:
+            return
+        with open(path, 'rb') as delta_file:
+            delta_file.seek(self.delta_offset)
+            data = delta_file.read()
+
+        vector_size = self.meta['dimension'] * 4
+        position = 0
+        while position + DELTA_HEADER.size <= len(data):
+            length, = DELTA_HEADER.unpack_from(data, position)
+            end = position + DELTA_HEADER.size + length + vector_size
+            # a writer that died mid-record leaves a torn tail, skip it
+            if end > len(data):
+                break
+            text_end = position + DELTA_HEADER.size + length
+            self.delta_texts.append(data[position + DELTA_HEADER.size:text_end].decode('utf-8'))
+            self.delta_vectors.append(np.frombuffer(data, dtype=np.float32, count=self.meta['dimension'],
+                                                    offset=text_end))
+            position = end
+        self.delta_offset += position
+
+    def search(self, embeddings, top_k: int) -> List[List[Tuple[str, float]]]:
+        queries = normalize(embeddings)
+        nprobe = min(self.nprobe, len(self.centroids))
+        delta = np.asarray(self.delta_vectors, dtype=np.float32).reshape(-1, queries.shape[1])
+
+        probes = np.argsort(-(queries @ np.asarray(self.centroids).T), axis=1)[:, :nprobe] \
+            if len(self.texts) else np.zeros((len(queries), 0), dtype=np.int64)
+
+        results = []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate(
+                [np.arange(self.offsets[cluster], self.offsets[cluster + 1]) for cluster in lists]
+                + [np.zeros(0, dtype=np.int64)])
+            scores = np.concatenate([np.asarray(self.vectors[rows]) @ query, delta @ query])
+            texts = [self.texts[row] for row in rows] + self.delta_texts
+
+            k = min(top_k, len(scores))
+            if k == 0:
+                results.append([])
+                continue
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            results.append([(texts[i], float(vector_index_score(scores[i]))) for i in best])
+        return results
+
+    def _write_array(self, name, array):
+        temporary = self._path(f'{name}.tmp.npy')
+        np.save(temporary, array)
+        os.replace(temporary, self._path(name))
+
+    def _write_json(self, name, value):
+        temporary = self._path(f'{name}.tmp')
+        with open(temporary, 'w') as output:
+            json.dump(value, output)
+        os.replace(temporary, self._path(name))
+
+
+class IVFFlatBackend(SimilarityBackend):
+    """
+    In-process approximate search over a NumPy IVF-flat index per vector
+    index, built from Neo4j on first use and kept current through add().
+    Processes sharing DECONFLICTION_ANN_PATH see each other's additions
+    and rebuilds on their next search.
+    """
+    name = 'ivf_flat'
+
+    def __init__(self, path: str = None, nprobe: int = None, rebuild_ratio: float = 0.2):
+        self.path = path or getattr(settings, 'DECONFLICTION_ANN_PATH', None) or os.path.join(
+            settings.BASE_DIR, 'tmp', 'ann')
+        self.nprobe = nprobe or getattr(settings, 'DECONFLICTION_ANN_NPROBE', 8)
+        self.rebuild_ratio = rebuild_ratio
+        self._indexes: Dict[str, IVFFlatIndex] = {}
+        self._lock = threading.RLock()
+
+    def get_index(self, index_name, return_field_name='definition'):
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                index = IVFFlatIndex(os.path.join(self.path, index_name), self.nprobe)
+                if index.exists():
+                    index.load()
+                else:
+                    self.rebuild(index_name, return_field_name, index)
+                self._indexes[index_name] = index
+            else:
+                index.refresh()
+            return index
+
+    def rebuild(self, index_name, return_field_name='definition', index=None):
+        """Rebuild the on-disk index from the nodes the vector index covers"""
+        label, embedding_field_name = vector_index_target(index_name)
+
+        with self._lock:
+            index = index or self._indexes.get(index_name) or IVFFlatIndex(
+                os.path.join(self.path, index_name), self.nprobe)
+            # query under the lock, so an add() racing the rebuild either
+            # lands in the graph snapshot or in the new delta
+            with index.locked(exclusive=True):
+                results, _ = db.cypher_query(f"""
+                    MATCH (n:{label}) WHERE n.{embedding_field_name} IS NOT NULL
+                    RETURN n.{return_field_name}, n.{embedding_field_name}
+                """)
+                index.build([text for text, _ in results],
+                            np.asarray([embedding for _, embedding in results], dtype=np.float32),
+                            return_field_name)
+            self._indexes[index_name] = index
+            logger.info(f'Built {self.name} similarity index {index_name} with {index.size} vectors')
+            return index
+
+    def search(self, embeddings, return_field_name, index_name, top_k_results=10):
+        index = self.get_index(index_name, return_field_name)
+        if index.meta.get('return_field_name') != return_field_name:
+            return get_backend(DEFAULT_BACKEND).search(embeddings, return_field_name, index_name, top_k_results)
+        with self._lock:
+            # fetch extra neighbours to make up for removed nodes
+            results = index.search(embeddings, 2 * top_k_results)
+        return self.drop_removed(index_name, return_field_name, results, top_k_results)
+
+    def drop_removed(self, index_name, return_field_name, results, top_k_results):
+        """
+        Drop results whose node was deleted, or lost its embedding, since
+        it was indexed; the Neo4j vector index forgets such nodes at once,
+        this index only on its next rebuild.
+        """
+        texts = list({text for result in results for text, _ in result})
+        if not texts:
+            return results
+
+        label, embedding_field_name = vector_index_target(index_name)
+        rows, _ = db.cypher_query(f"""
+            MATCH (n:{label})
+            WHERE n.{return_field_name} IN $texts AND n.{embedding_field_name} IS NOT NULL
+            RETURN DISTINCT n.{return_field_name}
+        """, {'texts': texts})
+        present = {row[0] for row in rows}
+        if len(present) < len(texts):
+            logger.debug(f'Dropped {len(texts) - len(present)} removed nodes from {index_name} results')
+        return [[(text, score) for text, score in result if text in present][:top_k_results]
+                for result in results]
+
+    def add(self, index_name, texts, embeddings):
+        if not texts:
+            return
+        with self._lock:
+            index = self.get_index(index_name)
+            index.add(list(texts), embeddings)
+            if len(index.delta_texts) > max(1000, self.rebuild_ratio * len(index.texts)) and \
+                    not index.needs_rebuild:
+                # the scan is left to the worker, not the request that added
+                index.request_rebuild()
+                logger.info(f'Similarity index {index_name} has {len(index.delta_texts)} '
+                            f'unindexed vectors and needs a rebuild')
+
+    def rebuild_if_needed(self, index_names=None):
+        """Rebuild the on-disk indexes flagged by add(), return their names"""
+        rebuilt = []
+        for index_name in index_names or [name for name, _, _ in VECTOR_INDEXES]:
+            index = IVFFlatIndex(os.path.join(self.path, index_name), self.nprobe)
+            if index.exists() and index.needs_rebuild:
+                self.rebuild(index_name, index._read_meta().get('return_field_name', 'definition'))
+                rebuilt.append(index_name)
+        return rebuilt
+
+
+def meta_stamp(path):
+    # meta.json is replaced, never rewritten, so a new inode means a new
+    # file even when the mtime clock is too coarse to tell
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def normalize(embeddings) -> np.ndarray:
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def spherical_kmeans(vectors: np.ndarray, nlist: int, iterations: int = 10, block_size: int = 4096):
+    """Cluster normalized vectors by cosine similarity"""
+    if len(vectors) == 0:
+        return np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+
+    for _ in range(iterations):
+        for start in range(0, len(vectors), block_size):
+            assignments[start:start + block_size] = np.argmax(
+                vectors[start:start + block_size] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        filled = np.linalg.norm(sums, axis=1) > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids, assignments
+
+
+def vector_index_target(index_name) -> Tuple[str, str]:
+    """Return the node label and property a vector index covers"""
+    for name, label, embedding_field_name in VECTOR_INDEXES:
+        if name == index_name:
+            return label, embedding_field_name
+    raise ValueError(f'Unknown vector index {index_name}')
+
+
+BACKENDS = {
+    Neo4jVectorBackend.name: Neo4jVectorBackend,
+    IVFFlatBackend.name: IVFFlatBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name: str = None) -> SimilarityBackend:
+    """
+    Return the process-wide instance of a similarity backend, by default
+    the one named by the DECONFLICTION_SIMILARITY_BACKEND setting.
+    """
+    name = name or getattr(settings, 'DECONFLICTION_SIMILARITY_BACKEND', DEFAULT_BACKEND)
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKENDS:
+                raise ValueError(f'Unknown similarity backend {name}, expected one of {sorted(BACKENDS)}')
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
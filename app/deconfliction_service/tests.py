@@ -1,3 +1,472 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase, tag
+from django.utils import timezone
+from neo4j.exceptions import ServiceUnavailable
+
+from core.constants import MODEL_VECTOR_DIMENSION
+from deconfliction_service.collision_utils import CollisionDetector
+from deconfliction_service.embedding_backends import (embedding_model_id,
+                                                     load_embedding_model)
+from deconfliction_service.embedding_cache import (EmbeddingCache,
+                                                   embedding_key,
+                                                   normalize_text)
+from deconfliction_service.embedding_service import (EmbeddingClient,
+                                                     EmbeddingServer,
+                                                     MicroBatchEncoder)
+from deconfliction_service.models import DeconflictionJob
+from deconfliction_service.schema import (RETRY_DELAY,
+                                          ensure_graph_schema,
+                                          reset_graph_schema_state,
+                                          schema_statements)
+from deconfliction_service.similarity_backends import (IVFFlatBackend,
+                                                       IVFFlatIndex)
+
+
+@tag('unit')
+class EmbeddingCacheTests(SimpleTestCase):
+
+    def test_normalize_text(self):
+        """Test that whitespace differences normalize away"""
+        self.assertEqual(normalize_text('  a\tdefinition \n here '),
+                         'a definition here')
+
+    def test_embedding_key(self):
+        """Test that keys depend on the model and normalized text"""
+        self.assertEqual(embedding_key('model', 'a  definition'),
+                         embedding_key('model', ' a definition'))
+        self.assertNotEqual(embedding_key('model', 'a definition'),
+                            embedding_key('other', 'a definition'))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = EmbeddingCache(maxsize=2, path='')
+        cache.set_many({'a': [1.0], 'b': [2.0]})
+        cache.get_many(['a'])
+        cache.set_many({'c': [3.0]})
+
+        self.assertEqual(set(cache.get_many(['a', 'b', 'c'])), {'a', 'c'})
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_disk_tier(self):
+        """Test that vectors survive in the SQLite tier"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'embeddings.sqlite3')
+            EmbeddingCache(maxsize=10, path=path).set_many(
+                {'a': np.array([0.5, 0.25], dtype=np.float32)})
+
+            found = EmbeddingCache(maxsize=10, path=path).get_many(['a', 'b'])
+
+        self.assertEqual(list(found), ['a'])
+        self.assertEqual(found['a'].dtype, np.float32)
+        np.testing.assert_array_equal(found['a'], [0.5, 0.25])
+
+
+@tag('unit')
+class MicroBatchEncoderTests(SimpleTestCase):
+
+    def test_concurrent_requests_share_batches(self):
+        """Test that concurrent single texts are encoded together and
+        every caller gets its own vector"""
+        batch_sizes = []
+
+        def encode(texts):
+            batch_sizes.append(len(texts))
+            return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+        encoder = MicroBatchEncoder(encode, max_batch_size=8, max_wait_ms=50)
+        results = {}
+
+        def request(length):
+            results[length] = encoder.submit('x' * length).result()[0]
+
+        threads = [threading.Thread(target=request, args=(length,))
+                   for length in range(1, 17)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {length: length for length in range(1, 17)})
+        self.assertEqual(sum(batch_sizes), 16)
+        self.assertLess(len(batch_sizes), 16)
+
+    def test_encode_error(self):
+        """Test that an encoding error reaches every caller in the batch"""
+        def encode(texts):
+            raise ValueError('boom')
+
+        encoder = MicroBatchEncoder(encode, max_wait_ms=0)
+
+        with self.assertRaises(ValueError):
+            encoder.encode_many(['a', 'b'])
+
+    def test_model_loads_once_on_first_use(self):
+        """Test that concurrent first callers share one lazily loaded
+        embedding model"""
+        from deconfliction_service import node_utils
+
+        with patch.dict(node_utils._models, clear=True), \
+                self.settings(EMBEDDING_BACKEND='torch'), \
+                patch('deconfliction_service.node_utils.load_embedding_model') as load:
+            threads = [threading.Thread(target=node_utils.get_model) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertIs(node_utils.get_model(), load.return_value)
+            load.assert_called_once_with(node_utils.MODEL_NAME, 'torch')
+
+
+@tag('unit')
+class EmbeddingServiceTests(SimpleTestCase):
+
+    def test_clients_share_one_encoder(self):
+        """Test that threads of several clients are encoded by the one
+        server side encoder and errors come back to the caller"""
+        def encode(texts):
+            if 'fail' in texts:
+                raise ValueError('boom')
+            return np.array([[len(text)] for text in texts], dtype=np.float32)
+
+        encoder = MicroBatchEncoder(encode, max_batch_size=16, max_wait_ms=20)
+        with tempfile.TemporaryDirectory() as directory:
+            address = os.path.join(directory, 'embedding.sock')
+            server = EmbeddingServer(address, encoder, authkey=b'test').start()
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                clients = [EmbeddingClient(address, authkey=b'test') for _ in range(2)]
+                results = {}
+
+                def request(length):
+                    client = clients[length % 2]
+                    results[length] = client.encode_many(['x' * length, 'y'])[:, 0].tolist()
+
+                threads = [threading.Thread(target=request, args=(length,))
+                           for length in range(2, 10)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                self.assertEqual(results, {length: [length, 1] for length in range(2, 10)})
+                self.assertEqual(encoder.encoded, 16)
+                with self.assertRaises(RuntimeError):
+                    clients[0].encode_many(['fail'])
+            finally:
+                server.close()
+
+
+@tag('unit')
+class EmbeddingBackendTests(SimpleTestCase):
+
+    def test_embedding_backends(self):
+        """Test that only fp32 torch keeps the bare model name in the cache
+        and unknown backends are rejected"""
+        self.assertEqual(embedding_model_id('model', 'torch'), 'model')
+        self.assertEqual(embedding_model_id('model', 'torch-int8'), 'model/torch-int8')
+        self.assertNotEqual(embedding_key(embedding_model_id('model', 'onnx'), 'text'),
+                            embedding_key('model', 'text'))
+
+        with self.assertRaises(ValueError):
+            load_embedding_model('model', 'fp16')
+
+    def test_embedding_parity_report(self):
+        """Test that the parity report flags a backend whose drift changes
+        a deconfliction decision"""
+        from deconfliction_service.management.commands.embedding_parity import parity_report
+
+        reference = np.array([[1, 0, 0], [0.8, 0.6, 0], [0, 0, 1]], dtype=np.float32)
+
+        same = parity_report(reference, reference * 2)
+        self.assertAlmostEqual(same['cosine']['min'], 1.0, places=5)
+        self.assertEqual(same['status_changes'], 0)
+        self.assertEqual(same['self_duplicates'], 3)
+
+        # row 0 moves away from row 1, its 0.9 duplicate match drops to unique
+        drifted = reference.copy()
+        drifted[0] = [0.95, -0.31, 0]
+        report = parity_report(reference, drifted, block_size=2)
+        self.assertEqual(report['status_changes'], 1)
+        self.assertLess(report['cosine']['min'], 0.96)
+        self.assertGreater(report['nearest_score_drift']['max'], 0.1)
+
+
+@tag('unit')
+class GraphSchemaTests(SimpleTestCase):
+
+    def setUp(self):
+        reset_graph_schema_state()
+
+    def tearDown(self):
+        reset_graph_schema_state()
+
+    def test_ensure_graph_schema_runs_once(self):
+        """Test that the DDL is only issued once per process"""
+        with patch('deconfliction_service.schema.db.cypher_query') as query:
+            self.assertTrue(ensure_graph_schema())
+            self.assertTrue(ensure_graph_schema())
+
+        self.assertEqual(query.call_count, len(schema_statements()))
+
+    def test_ensure_graph_schema_continues_after_error(self):
+        """Test that one failing statement does not stop the others"""
+        with patch('deconfliction_service.schema.db.cypher_query') as query:
+            query.side_effect = [Exception('boom')] + \
+                [None] * (len(schema_statements()) - 1)
+
+            self.assertFalse(ensure_graph_schema())
+
+        self.assertEqual(query.call_count, len(schema_statements()))
+
+    def test_ensure_graph_schema_skips_rejected_statements(self):
+        """Test that a statement the database rejects is not issued
+        again on the write path"""
+        with patch('deconfliction_service.schema.db.cypher_query') as query:
+            query.side_effect = [Exception('duplicate aliases')] + \
+                [None] * (len(schema_statements()) - 1)
+            self.assertFalse(ensure_graph_schema())
+            self.assertFalse(ensure_graph_schema())
+
+        self.assertEqual(query.call_count, len(schema_statements()))
+
+    @patch('deconfliction_service.schema.time.monotonic')
+    def test_ensure_graph_schema_retries_connection_errors(self, monotonic):
+        """Test that statements that failed for lack of a connection are
+        retried after a delay, and only those"""
+        monotonic.return_value = 1000
+        with patch('deconfliction_service.schema.db.cypher_query') as query:
+            query.side_effect = [ServiceUnavailable('down')] + \
+                [None] * (len(schema_statements()) - 1)
+            self.assertFalse(ensure_graph_schema())
+            self.assertFalse(ensure_graph_schema())
+            self.assertEqual(query.call_count, len(schema_statements()))
+
+            query.side_effect = None
+            monotonic.return_value = 1000 + RETRY_DELAY
+            self.assertTrue(ensure_graph_schema())
+
+        self.assertEqual(query.call_count, len(schema_statements()) + 1)
+
+    def test_schema_statements(self):
+        """Test that the required constraints and indexes are listed"""
+        statements = '\n'.join(schema_statements())
+
+        self.assertIn('constraint_unique_NeoTerm_uid ', statements)
+        self.assertIn('constraint_unique_NeoAlias_alias ', statements)
+        self.assertIn('index_UIDCounter_owner_uid ', statements)
+        self.assertIn('CREATE VECTOR INDEX `definitions`', statements)
+
+
+@tag('unit')
+class CollisionDetectorTests(SimpleTestCase):
+
+    def test_find_collisions(self):
+        """Test that similar definitions collide once and are written in
+        one batch"""
+        rows = [
+            ['d1', 'first', [1.0, 0.0], 'uid1', 'alias1', 'context'],
+            ['d2', 'second', [0.9, 0.1], 'uid2', None, 'context'],
+            ['d3', 'third', [0.0, 1.0], 'uid3', None, 'context'],
+            ['d4', 'no embedding', None, None, None, None],
+        ]
+
+        with patch('deconfliction_service.collision_utils.db'
+                   '.cypher_query') as query:
+            query.side_effect = [(rows, None), ([], None)]
+
+            collisions = CollisionDetector(top_k=2).find_collisions()
+
+        self.assertEqual(len(collisions), 1)
+        self.assertEqual(collisions[0]['term1']['id'], 'uid1')
+        self.assertEqual(collisions[0]['term2']['definition'], 'second')
+        self.assertEqual(query.call_count, 2)
+        self.assertEqual(
+            [(pair['source'], pair['target'])
+             for pair in query.call_args[0][1]['pairs']], [('d1', 'd2')])
+
+
+@tag('unit')
+class IVFFlatIndexTests(SimpleTestCase):
+
+    def test_build_search_and_add(self):
+        """Test that the index finds neighbours before and after adds and
+        survives a reload"""
+        rng = np.random.default_rng(1)
+        embeddings = rng.normal(size=(50, 8)).astype(np.float32)
+        texts = [f'text {i}' for i in range(50)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            index = IVFFlatIndex(directory, nprobe=50)
+            index.build(texts, embeddings, 'definition')
+
+            results = index.search(embeddings[:2], top_k=3)
+            self.assertEqual([result[0][0] for result in results],
+                             ['text 0', 'text 1'])
+            self.assertAlmostEqual(results[0][0][1], 1.0, places=5)
+
+            index.add(['new text'], -embeddings[:1])
+            reloaded = IVFFlatIndex(directory, nprobe=50)
+            reloaded.load()
+
+            self.assertEqual(reloaded.size, 51)
+            self.assertEqual(
+                reloaded.search(-embeddings[:1], top_k=1)[0][0][0],
+                'new text')
+
+    def test_shared_directory(self):
+        """Test that an index sees what another process added or rebuilt
+        in the same directory"""
+        rng = np.random.default_rng(2)
+        embeddings = rng.normal(size=(20, 8)).astype(np.float32)
+        texts = [f'text {i}' for i in range(20)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            writer = IVFFlatIndex(directory, nprobe=20)
+            writer.build(texts, embeddings, 'definition')
+            reader = IVFFlatIndex(directory, nprobe=20)
+            reader.load()
+
+            writer.add(['added ü'], -embeddings[:1])
+            reader.refresh()
+            self.assertEqual(reader.search(-embeddings[:1], top_k=1)[0][0][0], 'added ü')
+
+            # a torn record left by a crashed writer is ignored
+            with open(os.path.join(directory, 'delta.bin'), 'ab') as delta_file:
+                delta_file.write(b'\x05\x00\x00\x00ab')
+            reader.refresh()
+            self.assertEqual(reader.size, 21)
+            writer.add(['after tear'], embeddings[1:2] * -1)
+            reader.refresh()
+            self.assertEqual(reader.delta_texts, ['added ü', 'after tear'])
+
+            writer.build(texts[:10], embeddings[:10], 'definition')
+            reader.refresh()
+            self.assertEqual(reader.size, 10)
+            self.assertEqual(reader.delta_texts, [])
+
+    def test_large_delta_requests_rebuild(self):
+        """Test that add only flags an outgrown index and that the
+        rebuild is left to rebuild_if_needed"""
+        rng = np.random.default_rng(3)
+        embeddings = rng.normal(size=(10, 8)).astype(np.float32)
+
+        with tempfile.TemporaryDirectory() as directory:
+            IVFFlatIndex(os.path.join(directory, 'definitions')).build(
+                [f'text {i}' for i in range(10)], embeddings, 'definition')
+            backend = IVFFlatBackend(path=directory)
+
+            with patch.object(backend, 'rebuild') as rebuild:
+                backend.add('definitions', [f'added {i}' for i in range(1001)],
+                            rng.normal(size=(1001, 8)))
+            rebuild.assert_not_called()
+            self.assertTrue(backend.get_index('definitions').needs_rebuild)
+
+            with patch('deconfliction_service.similarity_backends.db') as db:
+                db.cypher_query.return_value = (
+                    [[f'text {i}', embeddings[i].tolist()] for i in range(10)], None)
+                self.assertEqual(backend.rebuild_if_needed(), ['definitions'])
+                self.assertEqual(backend.rebuild_if_needed(), [])
+
+            index = backend.get_index('definitions')
+            self.assertFalse(index.needs_rebuild)
+            self.assertEqual(index.size, 10)
+
+    def test_search_drops_removed_nodes(self):
+        """Test that texts whose node left the graph are not matched"""
+        embeddings = np.eye(8, dtype=np.float32)[:3]
+
+        with tempfile.TemporaryDirectory() as directory:
+            IVFFlatIndex(os.path.join(directory, 'definitions')).build(
+                ['kept', 'deleted', 'other'], embeddings, 'definition')
+            backend = IVFFlatBackend(path=directory, nprobe=8)
+
+            with patch('deconfliction_service.similarity_backends.db') as db:
+                db.cypher_query.return_value = ([['kept'], ['other']], None)
+                results = backend.search(embeddings[1:2] + embeddings[:1] * 0.5,
+                                         'definition', 'definitions', top_k_results=2)
+
+        self.assertEqual([text for text, _ in results[0]], ['kept', 'other'])
+        self.assertCountEqual(db.cypher_query.call_args[0][1]['texts'],
+                              ['kept', 'deleted', 'other'])
+
+    def test_empty_index(self):
+        """Test that an empty index returns no neighbours"""
+        with tempfile.TemporaryDirectory() as directory:
+            index = IVFFlatIndex(directory)
+            index.build([], np.zeros((0, 8)), 'definition')
+
+            self.assertEqual(index.search(np.ones((1, MODEL_VECTOR_DIMENSION)),
+                                          top_k=3), [[]])
+
+
+@tag('unit')
+class DeconflictionJobTests(TestCase):
+
+    def test_term_job(self):
+        """Test that a queued term is claimed once and its outcome stored"""
+        job = DeconflictionJob.enqueue_term('a definition', 'context',
+                                            'description', alias='')
+
+        with patch('core.utils.run_node_creation') as run_node_creation:
+            run_node_creation.return_value = {
+                'status': 'unique', 'uid': '0x00000001',
+                'most_similar_text': None, 'score': np.float32(0.5)}
+
+            claimed = DeconflictionJob.claim_next()
+            self.assertEqual(claimed.pk, job.pk)
+            self.assertIsNone(DeconflictionJob.claim_next())
+            claimed.run()
+
+        run_node_creation.assert_called_once_with(
+            definition='a definition', context='context',
+            context_description='description', alias=None)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeconflictionJob.STATUS_SUCCEEDED)
+        self.assertEqual(job.result[0]['uid'], '0x00000001')
+        self.assertEqual(job.result[0]['score'], 0.5)
+
+    def test_failed_csv_import_job(self):
+        """Test that a failing import is recorded with its error"""
+        DeconflictionJob.enqueue_csv_import(pd.DataFrame({
+            'Alias': [float('nan')], 'Definition': ['a definition'],
+            'Context': ['context'], 'Context Description': ['description']}))
+
+        with patch('core.term_import.import_terms_from_data_frame',
+                   side_effect=Exception('boom')) as import_terms:
+            job = DeconflictionJob.claim_next().run()
+
+        self.assertIsNone(import_terms.call_args[0][0]['Alias'][0])
+        self.assertEqual(job.status, DeconflictionJob.STATUS_FAILED)
+        self.assertEqual(job.error, 'boom')
+
+    def test_reclaim_stale_jobs(self):
+        """Test that jobs abandoned by a dead worker are requeued, and
+        failed once they ran out of attempts"""
+        long_ago = timezone.now() - timedelta(hours=1)
+        abandoned = DeconflictionJob.enqueue_term('first', 'context', 'description')
+        exhausted = DeconflictionJob.enqueue_term('second', 'context', 'description')
+        alive = DeconflictionJob.enqueue_term('third', 'context', 'description')
+        DeconflictionJob.objects.filter(pk=abandoned.pk).update(
+            status=DeconflictionJob.STATUS_RUNNING, started=long_ago, heartbeat=long_ago, attempts=1)
+        DeconflictionJob.objects.filter(pk=exhausted.pk).update(
+            status=DeconflictionJob.STATUS_RUNNING, started=long_ago, heartbeat=None,
+            attempts=DeconflictionJob.MAX_ATTEMPTS)
+        DeconflictionJob.objects.filter(pk=alive.pk).update(
+            status=DeconflictionJob.STATUS_RUNNING, started=long_ago, heartbeat=timezone.now(), attempts=1)
+
+        claimed = DeconflictionJob.claim_next()
+
+        self.assertEqual(claimed.pk, abandoned.pk)
+        self.assertEqual(claimed.attempts, 2)
+        exhausted.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(exhausted.status, DeconflictionJob.STATUS_FAILED)
+        self.assertEqual(alive.status, DeconflictionJob.STATUS_RUNNING)
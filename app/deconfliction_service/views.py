@@ -1,7 +1,6 @@
 from django.shortcuts import render
 
 from core.models import NeoDefinition
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import logging
 from typing import List
@@ -14,7 +13,8 @@ import logging
 from django.urls import reverse
 from core.models import NeoTerm, NeoDefinition
 
-from .node_utils import create_vector_index, find_colliding_definition_nodes, find_similar_text_by_embedding, generate_embedding, evaluate_deconfliction_status, get_terms_with_multiple_definitions
+from .node_utils import find_colliding_definition_nodes, find_similar_text_by_embedding, generate_embedding, evaluate_deconfliction_status, get_terms_with_multiple_definitions
+from .schema import ensure_graph_schema
 from core.models import NeoDefinition, NeoTerm
 logger = logging.getLogger('dict_config_logger')
 
@@ -23,7 +23,7 @@ def run_deconfliction(alias: str, definition: str, context: str, context_descrip
     try:
         logger.info('Running Deconfliction')
         definition_vector_embedding = generate_embedding(definition)
-        create_vector_index('definitions', 'NeoDefinition', 'embedding')
+        ensure_graph_schema()
         results = find_similar_text_by_embedding(definition_vector_embedding, 'definition', 'definitions')
         deconfliction_status, most_similar_text, highest_score = evaluate_deconfliction_status(results)
         if deconfliction_status == 'unique':
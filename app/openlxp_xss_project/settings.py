@@ -248,3 +248,47 @@ if os.environ.get('TMP_SCHEMA_DIR') is not None and\
 else:
     TMP_SCHEMA_DIR = os.path.join(BASE_DIR, 'tmp', 'schemas')
 TMP_SCHEMA_DIR = os.path.join(TMP_SCHEMA_DIR, '')
+
+# number of UID counter values each worker reserves from Neo4j at a time
+UID_BLOCK_SIZE = int(os.environ.get('UID_BLOCK_SIZE', 100))
+
+# process-local cache of resolved UID providers
+PROVIDER_CACHE_SIZE = int(os.environ.get('PROVIDER_CACHE_SIZE', 1024))
+PROVIDER_CACHE_TTL = int(os.environ.get('PROVIDER_CACHE_TTL', 300))
+
+# sentence embedding cache, EMBEDDING_CACHE_PATH enables the shared SQLite tier
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 10000))
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH') or None
+
+# create the Neo4j indexes and constraints when the app registry is ready
+GRAPH_SCHEMA_BOOTSTRAP = os.environ.get('GRAPH_SCHEMA_BOOTSTRAP', 'false').lower() == 'true'
+
+# nearest neighbour search used by deconfliction, 'neo4j' or 'ivf_flat'
+DECONFLICTION_SIMILARITY_BACKEND = os.environ.get('DECONFLICTION_SIMILARITY_BACKEND', 'neo4j')
+DECONFLICTION_ANN_PATH = os.environ.get('DECONFLICTION_ANN_PATH', os.path.join(BASE_DIR, 'tmp', 'ann'))
+DECONFLICTION_ANN_NPROBE = int(os.environ.get('DECONFLICTION_ANN_NPROBE', 8))
+
+# gzip the CSV term export for clients that accept it
+EXPORT_CSV_GZIP = os.environ.get('EXPORT_CSV_GZIP', 'true').lower() == 'true'
+
+# queue admin term creation and CSV imports for run_deconfliction_worker,
+# only enable once a worker is running
+DECONFLICTION_JOBS_ASYNC = os.environ.get('DECONFLICTION_JOBS_ASYNC', 'false').lower() == 'true'
+# a running job without a heartbeat for this long lost its worker and is requeued
+DECONFLICTION_JOB_HEARTBEAT_SECONDS = int(os.environ.get('DECONFLICTION_JOB_HEARTBEAT_SECONDS', 30))
+DECONFLICTION_JOB_STALE_SECONDS = int(os.environ.get('DECONFLICTION_JOB_STALE_SECONDS', 300))
+
+# micro-batching of concurrent embedding requests, 0 threads keeps torch's default
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 64))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_BATCH_MAX_WAIT_MS', 5))
+EMBEDDING_TORCH_THREADS = int(os.environ.get('EMBEDDING_TORCH_THREADS', 0))
+
+# unix socket of run_embedding_service, the one process that loads the model
+EMBEDDING_SERVICE_SOCKET = os.environ.get('EMBEDDING_SERVICE_SOCKET') or None
+
+# load the embedding model when a web worker starts rather than on first use
+EMBEDDING_PRELOAD = os.environ.get('EMBEDDING_PRELOAD', 'false').lower() == 'true'
+
+# inference backend of the embedding model: torch (fp32), torch-int8 or onnx,
+# check a switch with the embedding_parity command before changing it
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'openlxp_xss_project.settings')
 
 application = get_wsgi_application()
+
+# load the embedding model before the first request instead of during it
+if settings.EMBEDDING_PRELOAD and not settings.EMBEDDING_SERVICE_SOCKET:
+    from deconfliction_service.node_utils import get_model
+
+    get_model()
@@ -6,6 +6,9 @@ class UidConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'uid'
 
+    def ready(self):
+        import uid.signals  # noqa
+
     #def ready(self):
         #from .models import LastGeneratedUID  # Import the LastGeneratedUID model
      #   self.initialize_last_generated_uid()
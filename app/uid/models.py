@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.db import models, transaction #Import Models and transaction atomic
 from neomodel import db, StringProperty, DateTimeProperty, BooleanProperty, RelationshipTo, RelationshipFrom, StructuredNode, IntegerProperty, NodeSet
 from datetime import datetime
-import time, logging, re # Import time module to use sleep, Logging and re
+import time, logging, re, threading # Import time module to use sleep, Logging, re and threading
 from django_neomodel import DjangoNode
-from collections import defaultdict
-from typing import List
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
 from uuid import uuid4
 
 logger = logging.getLogger(__name__)
@@ -12,6 +14,9 @@ logger = logging.getLogger(__name__)
 GLOBAL_PROVIDER_OWNER_UID = "0xFFFFFFFF"
 UID_PATTERN = r"^0x[0-9A-Fa-f]{8}$"
 COLLISION_THRESHOLD = 5  # Number of attempts before adjusting the base counter
+DEFAULT_UID_BLOCK_SIZE = 100  # Number of counter values each process reserves per round trip
+DEFAULT_PROVIDER_CACHE_SIZE = 1024  # Number of providers each process keeps resolved
+DEFAULT_PROVIDER_CACHE_TTL = 300  # Seconds before a cached provider is looked up again
 
 # Function to check Neo4j connection
 def check_neo4j_connection():
@@ -69,14 +74,90 @@ class UIDCounter(StructuredNode):
         # cls._cache[owner_uid] = instance
         return instance 
 
+    @classmethod
+    def reserve(cls, owner_uid: str, count: int) -> range:
+        """
+        Atomically claim the next `count` counter values for owner_uid.
+        The MERGE and the increment run as a single statement, so concurrent
+        workers can never be handed the same values.
+        """
+        if count <= 0:
+            raise ValueError("Reserved block size must be a positive integer.")
+
+        cypher_query = """
+        MERGE (c:UIDCounter {owner_uid: $owner_uid})
+        ON CREATE SET c.counter = 0
+        SET c.counter = c.counter + $count
+        RETURN c.counter
+        """
+        results, _ = db.cypher_query(cypher_query, {'owner_uid': owner_uid, 'count': count})
+        block_end = results[0][0]
+
+        return range(block_end - count + 1, block_end + 1)
+
     @classmethod
     def increment(cls, owner_uid: str):
-        # with transaction.atomic():  # Ensure atomic operation
-        instance = cls._get_instance(owner_uid)
-        current_value = instance.counter
-        instance.counter = current_value + 1
-        instance.save()
-        return instance.counter
+        return uid_allocator.allocate(owner_uid)
+
+class UIDBlockAllocator:
+    """
+    Process-local allocator handing out counter values from blocks reserved
+    through UIDCounter.reserve.  Each worker only goes back to Neo4j once its
+    current block for an owner is used up.  Values left in a block when the
+    process exits are never issued, so UIDs stay unique but may have gaps.
+    """
+
+    def __init__(self, block_size: int = None):
+        self._block_size = block_size
+        self._blocks = {}
+        self._released = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @property
+    def block_size(self) -> int:
+        if self._block_size is not None:
+            return self._block_size
+        return getattr(settings, 'UID_BLOCK_SIZE', DEFAULT_UID_BLOCK_SIZE)
+
+    def allocate(self, owner_uid: str) -> int:
+        return self.allocate_many(owner_uid, 1)[0]
+
+    def allocate_many(self, owner_uid: str, count: int) -> List[int]:
+        """Return `count` unused counter values, reserving at most one new block."""
+        with self._lock:
+            released = self._released[owner_uid]
+            values = released[:count]
+            del released[:count]
+            count -= len(values)
+            block = self._blocks.get(owner_uid, range(0))
+
+            taken = min(count, len(block))
+            values.extend(block[:taken])
+            block = block[taken:]
+
+            missing = count - taken
+            if missing > 0:
+                reserved = UIDCounter.reserve(owner_uid, max(missing, self.block_size))
+                values.extend(reserved[:missing])
+                block = reserved[missing:]
+
+            self._blocks[owner_uid] = block
+            return values
+
+    def release(self, owner_uid: str, values: List[int]):
+        """Take back values that were allocated but never used, e.g. because
+        the write they were meant for rolled back.  They are handed out
+        again before the current block."""
+        with self._lock:
+            self._released[owner_uid] = sorted(set(self._released[owner_uid]) | set(values))
+
+    def reset(self):
+        """Forget every locally held block."""
+        with self._lock:
+            self._blocks.clear()
+            self._released.clear()
+
+uid_allocator = UIDBlockAllocator()
 
 # # Django model for admin management
 # class UIDCounterDjangoModel(models.Model):
@@ -214,9 +295,130 @@ def generate_uid(owner_uid) -> str:
     # def get_last_generated_uid():
     #     last_uid_record = LastGeneratedUID.objects.first()
     #     return last_uid_record.uid if last_uid_record else None
-    
+
 # uid_singleton = UIDGenerator()
 
+def generate_uids(owner_uid, count: int) -> List[str]:
+    """
+    Bulk counterpart of generate_uid: claims every counter value with at most
+    one Neo4j round trip and writes the logs with a single bulk insert.
+    """
+    new_uids = reserve_uids(owner_uid, count)
+    log_generated_uids(owner_uid, new_uids)
+    return new_uids
+
+def reserve_uids(owner_uid, count: int) -> List[str]:
+    """Claim `count` UIDs without logging them yet"""
+    new_uids = [f"0x{uid_value:08x}" for uid_value in uid_allocator.allocate_many(owner_uid, count)]
+    malformed = [new_uid for new_uid in new_uids if not is_uid_compliant(new_uid)]
+    if malformed:
+        release_uids(owner_uid, [new_uid for new_uid in new_uids if new_uid not in malformed])
+        raise ValueError(f"Generated UID {malformed[0]} is not compliant with the expected pattern.")
+    return new_uids
+
+def release_uids(owner_uid, uids: List[str]):
+    """Hand reserved UIDs that were never written back to the allocator"""
+    uid_allocator.release(owner_uid, [int(uid, 16) for uid in uids])
+
+def log_generated_uids(owner_uid, uids: List[str]):
+    GeneratedUIDLog.objects.bulk_create([
+        GeneratedUIDLog(uid=new_uid, uid_full=f"{owner_uid}-{new_uid}")
+        for new_uid in uids
+    ])
+
+@contextmanager
+def issuing_uids(owner_uid, count: int):
+    """
+    Reserve `count` UIDs for the graph write run inside the block.  If the
+    block raises, the UIDs go back to the allocator and nothing is logged;
+    otherwise they are logged once the surrounding Django transaction, if
+    any, commits.  Run the Neo4j transaction inside the block so the log
+    only describes UIDs that were committed.
+    """
+    new_uids = reserve_uids(owner_uid, count)
+    try:
+        yield new_uids
+    except BaseException:
+        release_uids(owner_uid, new_uids)
+        raise
+    transaction.on_commit(lambda: log_generated_uids(owner_uid, new_uids))
+
+class ProviderCache:
+    """
+    Bounded, TTL'd process-local map from provider name to the provider's
+    default_uid and element id.  Cached entries are rebuilt into Provider
+    instances without touching the graph, which is enough for the hot path
+    (reading default_uid and connecting relationships).
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, 'PROVIDER_CACHE_SIZE', DEFAULT_PROVIDER_CACHE_SIZE)
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'PROVIDER_CACHE_TTL', DEFAULT_PROVIDER_CACHE_TTL)
+
+    def get(self, name: str) -> Optional['Provider']:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[2] < time.monotonic():
+                self._entries.pop(name, None)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(name)
+            self.hits += 1
+            default_uid, element_id, _ = entry
+
+        provider = Provider(name=name, default_uid=default_uid)
+        provider.element_id_property = element_id
+        return provider
+
+    def set(self, provider: 'Provider'):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[provider.name] = (provider.default_uid, provider.element_id, time.monotonic() + self.ttl)
+            self._entries.move_to_end(provider.name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name: str = None):
+        """Drop a single provider, or every provider when no name is given."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+provider_cache = ProviderCache()
+
 # Provider and LCVTerms now Nodes
 class Provider(DjangoNode):
     # uid = StringProperty(unique_index=True)
@@ -233,6 +435,8 @@ class Provider(DjangoNode):
     @classmethod
     def create_provider(cls, name) -> 'Provider':
         
+        provider_cache.invalidate(name)
+
         uid_node = UIDNode.create_node(owner_uid=GLOBAL_PROVIDER_OWNER_UID)
         counter_node = UIDCounter._get_instance(owner_uid=uid_node.uid)
 
@@ -253,20 +457,39 @@ class Provider(DjangoNode):
         return result is not None
     
     @classmethod
-    def get_provider_by_name(cls, name):
+    def get_provider_or_none(cls, name) -> Optional['Provider']:
+        """Resolve a provider by name, consulting the process-local cache first."""
+        provider = provider_cache.get(name)
+        if provider is not None:
+            return provider
+
         provider_nodes = Provider.nodes
         assert isinstance(provider_nodes, NodeSet)
         result = provider_nodes.get_or_none(name=name)
 
         if result is None:
-            raise Exception(f"CANNOT FIND REQUESTED PROVIDER: {name}")
+            return None
 
         provider = result
         if isinstance(provider, list):
             provider = result[0]
 
         assert isinstance(provider, Provider)
+        provider_cache.set(provider)
+        return provider
+
+    @classmethod
+    def get_provider_by_name(cls, name):
+        provider = cls.get_provider_or_none(name)
+
+        if provider is None:
+            raise Exception(f"CANNOT FIND REQUESTED PROVIDER: {name}")
+
         return provider
+
+    def delete(self):
+        provider_cache.invalidate(self.name)
+        return super().delete()
     
     def get_current_uid(self):
         current_uid = self.default_uid
@@ -295,17 +518,22 @@ class ProviderDjangoModel(models.Model):
         Ensure that this Provider exists as both a Django Model (for the admin view)
         and as a graph node.  The graph node portion is handled by the save() override,
         which gives that node as an extended return value.
+
+        Resolved providers are kept in the process-local provider_cache, so
+        after warm-up this does not touch the graph at all.
         """
-        if not Provider.does_provider_exist(provider_name):
-            django_model_exists = ProviderDjangoModel.does_django_provider_exist(provider_name)
-            if django_model_exists:
-                provider = ProviderDjangoModel.get_by_name(provider_name).save()
-            else:
-                provider = ProviderDjangoModel(name=provider_name).save()
+        provider = Provider.get_provider_or_none(provider_name)
+        if provider is not None:
+            return provider
+
+        django_model_exists = ProviderDjangoModel.does_django_provider_exist(provider_name)
+        if django_model_exists:
+            provider = ProviderDjangoModel.get_by_name(provider_name).save()
         else:
-            return Provider.get_provider_by_name(provider_name)
+            provider = ProviderDjangoModel(name=provider_name).save()
 
         assert isinstance(provider, Provider)
+        provider_cache.set(provider)
         return provider
 
     @classmethod
@@ -358,22 +586,51 @@ class UIDRequestNode(DjangoNode):
 
     @classmethod
     def create_requested_uid(cls, provider_name: str):
-        
+        return cls.create_requested_uids(provider_name, 1)[0]
+
+    @classmethod
+    def create_requested_uids(cls, provider_name: str, count: int) -> List['UIDRequestNode']:
+        """
+        Bulk counterpart of create_requested_uid.  The provider is resolved
+        once, the UIDs are reserved in a single block and every UIDNode /
+        UIDRequestNode pair is written, with its relationships, by one
+        UNWIND statement.
+        """
         provider = ProviderDjangoModel.ensure_provider_exists(provider_name)
         assert isinstance(provider, Provider)
-                
-        uid_node = UIDNode.create_node(owner_uid=provider.default_uid)
 
-        requested_node = UIDRequestNode()
-        requested_node.token = uuid4()
-        requested_node.default_uid = uid_node.uid
-        requested_node.default_uid_chain = f"{provider.default_uid}-{uid_node.uid}" 
-        requested_node.save()
-        requested_node.uid.connect(uid_node)
-        requested_node.provider.connect(provider)
-        requested_node.save()
-        
-        return requested_node
+        cypher_query = """
+        MATCH (p:Provider {name: $provider_name})
+        UNWIND $rows AS row
+        CREATE (u:UIDNode {uid: row.uid, created_at: $now, updated_at: $now})
+        CREATE (r:UIDRequestNode {token: row.token, default_uid: row.uid, default_uid_chain: row.uid_chain})
+        CREATE (r)-[:HAS_UID]->(u)
+        CREATE (r)-[:HAS_PROVIDER]->(p)
+        RETURN r
+        """
+        # the UIDs are only logged once the nodes exist, a missing provider
+        # hands them back to the allocator
+        with issuing_uids(provider.default_uid, count) as uids:
+            rows = [
+                {
+                    'token': str(uuid4()),
+                    'uid': uid,
+                    'uid_chain': f"{provider.default_uid}-{uid}",
+                }
+                for uid in uids
+            ]
+            with db.transaction:
+                results, _ = db.cypher_query(cypher_query, {
+                    'provider_name': provider.name,
+                    'rows': rows,
+                    'now': time.time(),
+                })
+                if len(results) != len(rows):
+                    # the cached provider was deleted from the graph
+                    provider_cache.invalidate(provider_name)
+                    raise Exception(f"CANNOT FIND REQUESTED PROVIDER: {provider_name}")
+
+        return [cls.inflate(row[0]) for row in results]
     
 # LCV Terms model for DjangoNode
 class LCVTerm(DjangoNode):
@@ -0,0 +1,14 @@
+import logging
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from uid.models import ProviderDjangoModel, provider_cache
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_delete, sender=ProviderDjangoModel)
+def invalidate_provider_cache(sender, instance, **kwargs):
+    provider_cache.invalidate(instance.name)
+    logger.info(f"Provider cache invalidated for {instance.name}")
@@ -0,0 +1,334 @@
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.db.models.signals import post_delete
+from django.test import RequestFactory, SimpleTestCase, tag
+from django_neomodel import DjangoNode
+
+from uid.models import (Provider, ProviderCache, ProviderDjangoModel,
+                        UIDBlockAllocator, UIDCounter, UIDRequestNode,
+                        issuing_uids, provider_cache)
+from uid.views import MAX_BULK_UIDS, api_generate_uid
+
+
+def cached_provider(name, default_uid='0x00000001'):
+    provider = MagicMock(default_uid=default_uid, element_id=f'{name}-id')
+    provider.name = name
+    return provider
+
+
+@tag('unit')
+class UIDBlockAllocatorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.counter = 0
+        self.counter_lock = threading.Lock()
+
+    def cypher_query(self, query, params):
+        """Stand in for the atomic MERGE and increment of UIDCounter.reserve"""
+        with self.counter_lock:
+            self.counter += params['count']
+            return [[self.counter]], None
+
+    def test_reserve(self):
+        """Test that reserve claims the values up to the new counter"""
+        with patch('uid.models.db') as db:
+            db.cypher_query.return_value = ([[200]], None)
+
+            block = UIDCounter.reserve('0x00000001', 100)
+
+        self.assertEqual(block, range(101, 201))
+        self.assertEqual(db.cypher_query.call_args[0][1],
+                         {'owner_uid': '0x00000001', 'count': 100})
+
+    def test_reserve_rejects_empty_block(self):
+        """Test that reserve needs a positive block size"""
+        with self.assertRaises(ValueError):
+            UIDCounter.reserve('0x00000001', 0)
+
+    def test_allocate_many_refills_across_block_boundary(self):
+        """Test that the rest of a block is used before a new one is
+        reserved and that values stay contiguous across the boundary"""
+        allocator = UIDBlockAllocator(block_size=3)
+
+        with patch('uid.models.db') as db:
+            db.cypher_query.side_effect = self.cypher_query
+
+            first = allocator.allocate_many('0x00000001', 2)
+            second = allocator.allocate_many('0x00000001', 3)
+            third = allocator.allocate_many('0x00000001', 1)
+
+        self.assertEqual(first, [1, 2])
+        self.assertEqual(second, [3, 4, 5])
+        self.assertEqual(third, [6])
+        self.assertEqual(
+            [call[0][1]['count'] for call in db.cypher_query.call_args_list],
+            [3, 3])
+
+    def test_allocate_many_reserves_large_requests_at_once(self):
+        """Test that a request larger than a block is one round trip"""
+        allocator = UIDBlockAllocator(block_size=3)
+
+        with patch('uid.models.db') as db:
+            db.cypher_query.side_effect = self.cypher_query
+
+            values = allocator.allocate_many('0x00000001', 7)
+
+        self.assertEqual(values, list(range(1, 8)))
+        db.cypher_query.assert_called_once()
+
+    def test_allocate_concurrent_callers(self):
+        """Test that threads sharing an allocator, and allocators sharing
+        a counter, are never handed the same value"""
+        allocators = [UIDBlockAllocator(block_size=5),
+                      UIDBlockAllocator(block_size=5)]
+        issued = []
+        issued_lock = threading.Lock()
+
+        def allocate(allocator):
+            for _ in range(20):
+                value = allocator.allocate('0x00000001')
+                with issued_lock:
+                    issued.append(value)
+
+        with patch('uid.models.db') as db:
+            db.cypher_query.side_effect = self.cypher_query
+            threads = [threading.Thread(target=allocate,
+                                        args=(allocators[i % 2],))
+                       for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(issued), 160)
+        self.assertEqual(len(set(issued)), 160)
+
+    def test_released_values_are_issued_first(self):
+        """Test that values handed back are reused before the block"""
+        allocator = UIDBlockAllocator(block_size=5)
+
+        with patch('uid.models.db') as db:
+            db.cypher_query.side_effect = self.cypher_query
+
+            values = allocator.allocate_many('0x00000001', 3)
+            allocator.release('0x00000001', values[1:])
+            reused = allocator.allocate_many('0x00000001', 3)
+
+        self.assertEqual(reused, [2, 3, 4])
+        db.cypher_query.assert_called_once()
+
+
+@tag('unit')
+class ProviderCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        provider_cache.invalidate()
+
+    def tearDown(self):
+        provider_cache.invalidate()
+
+    def test_get_returns_cached_provider(self):
+        """Test that a cached provider is rebuilt without the graph"""
+        cache = ProviderCache(max_size=2, ttl=60)
+        cache.set(cached_provider('first', '0x00000002'))
+
+        provider = cache.get('first')
+
+        self.assertEqual(provider.name, 'first')
+        self.assertEqual(provider.default_uid, '0x00000002')
+        self.assertEqual(provider.element_id_property, 'first-id')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        """Test that an entry older than the ttl is looked up again"""
+        cache = ProviderCache(max_size=2, ttl=60)
+
+        with patch('uid.models.time.monotonic') as monotonic:
+            monotonic.return_value = 1000
+            cache.set(cached_provider('first'))
+
+            monotonic.return_value = 1059
+            self.assertIsNotNone(cache.get('first'))
+
+            monotonic.return_value = 1061
+            self.assertIsNone(cache.get('first'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test that a lookup keeps an entry over older ones"""
+        cache = ProviderCache(max_size=2, ttl=60)
+        cache.set(cached_provider('first'))
+        cache.set(cached_provider('second'))
+        cache.get('first')
+
+        cache.set(cached_provider('third'))
+
+        self.assertIsNotNone(cache.get('first'))
+        self.assertIsNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+    def test_zero_size_disables_cache(self):
+        """Test that nothing is kept when the cache size is zero"""
+        cache = ProviderCache(max_size=0, ttl=60)
+        cache.set(cached_provider('first'))
+
+        self.assertIsNone(cache.get('first'))
+
+    def test_create_provider_invalidates(self):
+        """Test that recreating a provider drops the cached one before
+        the graph is written"""
+        provider_cache.set(cached_provider('first'))
+
+        with patch('uid.models.UIDNode.create_node',
+                   side_effect=Exception('boom')):
+            with self.assertRaises(Exception):
+                Provider.create_provider('first')
+
+        self.assertIsNone(provider_cache.get('first'))
+
+    def test_delete_invalidates(self):
+        """Test that deleting the provider node drops the cached one"""
+        provider_cache.set(cached_provider('first'))
+        provider_cache.set(cached_provider('second'))
+
+        with patch.object(DjangoNode, 'delete') as delete:
+            Provider(name='first', default_uid='0x00000001').delete()
+
+        delete.assert_called_once()
+        self.assertIsNone(provider_cache.get('first'))
+        self.assertIsNotNone(provider_cache.get('second'))
+
+    def test_post_delete_signal_invalidates(self):
+        """Test that deleting the admin model drops the cached provider"""
+        provider_cache.set(cached_provider('first'))
+
+        post_delete.send(sender=ProviderDjangoModel,
+                         instance=ProviderDjangoModel(name='first'))
+
+        self.assertIsNone(provider_cache.get('first'))
+
+
+@tag('unit')
+class RequestedUIDTests(SimpleTestCase):
+
+    def setUp(self):
+        self.provider = Provider(name='first', default_uid='0x00000001')
+        self.commits = []
+        patches = [
+            patch.object(ProviderDjangoModel, 'ensure_provider_exists',
+                         return_value=self.provider),
+            patch('uid.models.reserve_uids',
+                  return_value=['0x00000002', '0x00000003']),
+            patch('uid.models.transaction.on_commit',
+                  side_effect=self.commits.append),
+            patch('uid.models.UIDRequestNode.inflate',
+                  side_effect=lambda node: node),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.log = self.patch('uid.models.log_generated_uids')
+        self.release = self.patch('uid.models.release_uids')
+        self.db = self.patch('uid.models.db')
+        self.addCleanup(provider_cache.invalidate)
+
+    def patch(self, target):
+        patcher = patch(target)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def commit(self):
+        for callback in self.commits:
+            callback()
+
+    def test_create_requested_uids(self):
+        """Test that every requested UID is written by one statement and
+        only logged once the surrounding transaction commits"""
+        self.db.cypher_query.return_value = ([['first'], ['second']], None)
+
+        nodes = UIDRequestNode.create_requested_uids('first', 2)
+
+        self.assertEqual(nodes, ['first', 'second'])
+        self.db.cypher_query.assert_called_once()
+        params = self.db.cypher_query.call_args[0][1]
+        self.assertEqual(params['provider_name'], 'first')
+        self.assertEqual([row['uid_chain'] for row in params['rows']],
+                         ['0x00000001-0x00000002', '0x00000001-0x00000003'])
+        self.db.transaction.__enter__.assert_called_once()
+        self.log.assert_not_called()
+
+        self.commit()
+
+        self.log.assert_called_once_with('0x00000001',
+                                         ['0x00000002', '0x00000003'])
+        self.release.assert_not_called()
+
+    def test_missing_provider_releases_uids(self):
+        """Test that a provider missing from the graph hands the UIDs back,
+        logs nothing and drops the cached provider"""
+        self.db.cypher_query.return_value = ([], None)
+        provider_cache.set(cached_provider('first'))
+
+        with self.assertRaisesMessage(Exception,
+                                      'CANNOT FIND REQUESTED PROVIDER'):
+            UIDRequestNode.create_requested_uids('first', 2)
+
+        self.release.assert_called_once_with('0x00000001',
+                                             ['0x00000002', '0x00000003'])
+        self.assertEqual(self.commits, [])
+        self.log.assert_not_called()
+        self.assertIsNone(provider_cache.get('first'))
+
+    def test_failed_write_releases_uids(self):
+        """Test that a write that raises hands the UIDs back"""
+        self.db.cypher_query.side_effect = Exception('boom')
+
+        with self.assertRaisesMessage(Exception, 'boom'):
+            UIDRequestNode.create_requested_uids('first', 2)
+
+        self.release.assert_called_once_with('0x00000001',
+                                             ['0x00000002', '0x00000003'])
+        self.assertEqual(self.commits, [])
+
+    def test_issuing_uids_logs_on_commit(self):
+        """Test that issued UIDs are logged from on_commit only"""
+        with issuing_uids('0x00000001', 2) as uids:
+            self.assertEqual(uids, ['0x00000002', '0x00000003'])
+
+        self.log.assert_not_called()
+        self.assertEqual(len(self.commits), 1)
+        self.commit()
+        self.log.assert_called_once_with('0x00000001', uids)
+
+
+@tag('unit')
+class GenerateUIDViewTests(SimpleTestCase):
+
+    def post(self, payload):
+        request = RequestFactory().post('/api/generate', json.dumps(payload),
+                                        content_type='application/json')
+        return api_generate_uid(request)
+
+    def test_bulk_over_limit_is_rejected(self):
+        """Test that requests above MAX_BULK_UIDS never reach the graph"""
+        with patch.object(UIDRequestNode, 'create_requested_uids') as create:
+            response = self.post({'provider_name': 'first',
+                                  'bulk': MAX_BULK_UIDS + 1})
+
+        self.assertEqual(response.status_code, 400)
+        create.assert_not_called()
+
+    def test_bulk_at_limit_is_accepted(self):
+        """Test that MAX_BULK_UIDS UIDs are created in one call"""
+        with patch.object(UIDRequestNode, 'create_requested_uids',
+                          return_value=[]) as create:
+            response = self.post({'provider_name': 'first',
+                                  'bulk': MAX_BULK_UIDS})
+
+        self.assertEqual(response.status_code, 200)
+        create.assert_called_once_with('first', MAX_BULK_UIDS)
@@ -2,7 +2,7 @@ from django.urls import path
 from . import views
 from .views import export_to_postman
 from .views import generate_report
-from .views import report_generated_uids, api_generate_uid
+from .views import report_generated_uids, api_generate_uid, report_provider_cache
 
 app_name = 'uid'
 
@@ -16,6 +16,7 @@ urlpatterns = [
 
     path('api/log', report_generated_uids, name='uid-generated'),
     path('api/generate', api_generate_uid, name='uid-generated'),
+    path('api/provider-cache', report_provider_cache, name='provider-cache'),
     
     # path('api/uid-repo/', UIDRepoViewSet.as_view({'get': 'list'}), name='uid-repo'),
     # path('api/uid/all', UIDTermViewSet.as_view({'get': 'list'}), name='uid-all'),
@@ -6,7 +6,7 @@ from neomodel import db
 # from .models import UIDGenerator, UIDNode, Provider, LCVTerm, LanguageSet
 from .models import UIDNode, Provider, generate_uid, UIDRequestNode
 from .forms import ProviderForm
-from .models import report_all_uids, report_all_generated_uids, report_all_term_uids, report_uids_by_echelon, GeneratedUIDLog
+from .models import report_all_uids, report_all_generated_uids, report_all_term_uids, report_uids_by_echelon, GeneratedUIDLog, provider_cache
 from rest_framework import viewsets
 from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
@@ -24,6 +24,7 @@ logger = logging.getLogger(__name__)
 #     uid_generator = None  # Handle initialization failure appropriately
 
 MAX_CHILDREN = 2**32 -1
+MAX_BULK_UIDS = 10000
 
 # Create your views here.
 def generate_uid_node(request: HttpRequest):
@@ -133,6 +134,10 @@ def report_generated_uids(request):
     uid_data = report_all_generated_uids()
     return JsonResponse(uid_data, safe=False)
 
+def report_provider_cache(request):
+    # Hit and miss counters for this worker's provider resolution cache
+    return JsonResponse(provider_cache.stats())
+
 @csrf_exempt
 def api_generate_uid(request: HttpRequest):
     if request.method != "POST":
@@ -152,11 +157,11 @@ def api_generate_uid(request: HttpRequest):
     if "bulk" in payload:
         given_bulk = payload["bulk"]
         if not isinstance(given_bulk, int):
-            return JsonResponse({"message": "Param 'bulk' must be an integer between 0 and 100."}, status=400)
-        if (given_bulk <= 0) or given_bulk > 100:
-            return JsonResponse({"message": "Param 'bulk' must be an integer between 0 and 100."}, status=400)
+            return JsonResponse({"message": f"Param 'bulk' must be an integer between 0 and {MAX_BULK_UIDS}."}, status=400)
+        if (given_bulk <= 0) or given_bulk > MAX_BULK_UIDS:
+            return JsonResponse({"message": f"Param 'bulk' must be an integer between 0 and {MAX_BULK_UIDS}."}, status=400)
         
-        request_nodes = [UIDRequestNode.create_requested_uid(given_provider) for _ in range(given_bulk)]
+        request_nodes = UIDRequestNode.create_requested_uids(given_provider, given_bulk)
         return JsonResponse([
             {
                 "token": node.token,
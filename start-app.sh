@@ -3,6 +3,7 @@
 
 python manage.py waitdb 
 python manage.py migrate 
+python manage.py ensure_graph_schema 
 python manage.py loaddata admin_theme_data.json 
 cd /opt/app/ 
 if [ -n "$TMP_SCHEMA_DIR" ] ; then
@@ -3,5 +3,18 @@
 if [ -n "$DJANGO_SUPERUSER_USERNAME" ] && [ -n "$DJANGO_SUPERUSER_PASSWORD" ] ; then
     (cd openlxp-xss; python manage.py createsuperuser --no-input)
 fi
+# one process holds the embedding model, the workers below encode through it
+export EMBEDDING_SERVICE_SOCKET=${EMBEDDING_SERVICE_SOCKET:-/tmp/xss-embedding.sock}
+# restart the background services when they exit, a job left running by a
+# dead worker is requeued by the next one
+supervise() {
+    while true; do
+        (cd openlxp-xss; python manage.py "$@")
+        echo "$1 exited with status $?, restarting in 5 seconds" >&2
+        sleep 5
+    done
+}
+supervise run_embedding_service &
+supervise run_deconfliction_worker &
 (cd openlxp-xss; gunicorn openlxp_xss_project.wsgi --reload --user www-data --bind 0.0.0.0:8010 --workers 3) &
 nginx -g "daemon off;"